@@ -1,5 +1,29 @@
 from django.contrib import admin
-from .models import Appointment, Contact
+
+from . import rollups, search
+from .models import (
+    Appointment,
+    AppointmentRollup,
+    ArchivedAppointment,
+    Contact,
+    IdempotencyKey,
+    Location,
+    OutboundSync,
+    WebhookEvent,
+)
+
+
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ('location_id', 'name', 'masked_api_key', 'rate_limit_per_second', 'max_concurrency', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('location_id', 'name')
+    readonly_fields = ('date_added', 'date_updated')
+
+    @admin.display(description='API key')
+    def masked_api_key(self, obj):
+        return f"…{obj.api_key[-4:]}" if obj.api_key else ""
+
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -8,9 +32,94 @@ class ContactAdmin(admin.ModelAdmin):
     search_fields = ('ghl_id', 'first_name', 'last_name', 'email', 'phone')
     readonly_fields = ('ghl_id', 'date_added', 'date_updated')
 
+    # La caja de búsqueda usa el índice de texto (search.py), no icontains por columna
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.search_contacts(queryset, search_term), False
+
+
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('ghl_id', 'title', 'contact_id', 'appointment_status', 'start_time', 'end_time')
     list_filter = ('appointment_status', 'start_time', 'location_id')
     search_fields = ('ghl_id', 'title', 'contact_id', 'notes')
     readonly_fields = ('ghl_id', 'date_added', 'date_updated')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.search_appointments(queryset, search_term), False
+
+    # Ediciones y borrados desde el admin también mueven el resumen por día
+    def save_model(self, request, obj, form, change):
+        with rollups.tracking([obj.ghl_id]):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with rollups.tracking([obj.ghl_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with rollups.tracking(list(queryset.values_list('ghl_id', flat=True))):
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(ArchivedAppointment)
+class ArchivedAppointmentAdmin(admin.ModelAdmin):
+    list_display = ('ghl_id', 'title', 'contact_id', 'appointment_status', 'start_time', 'archived_at')
+    list_filter = ('appointment_status', 'location_id')
+    search_fields = ('ghl_id', 'contact_id')
+    date_hierarchy = 'start_time'
+
+    # Solo lectura: vuelven a Appointment con un webhook o la reconciliación (archive.restore)
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def delete_model(self, request, obj):
+        with rollups.tracking([obj.ghl_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with rollups.tracking(list(queryset.values_list('ghl_id', flat=True))):
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(AppointmentRollup)
+class AppointmentRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'location_id', 'calendar_id', 'assigned_user_id', 'appointment_status', 'count')
+    list_filter = ('appointment_status', 'location_id')
+    date_hierarchy = 'day'
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(OutboundSync)
+class OutboundSyncAdmin(admin.ModelAdmin):
+    list_display = ('id', 'operation', 'ghl_id', 'status', 'attempts', 'result_status_code', 'date_added')
+    list_filter = ('status', 'operation', 'location_id')
+    search_fields = ('ghl_id',)
+    readonly_fields = ('date_added', 'date_updated')
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'ghl_id', 'status', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('ghl_id',)
+    readonly_fields = ('received_at', 'processed_at')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'scope', 'status', 'response_status_code', 'date_added', 'expires_at')
+    list_filter = ('scope', 'status')
+    search_fields = ('key',)
+    readonly_fields = ('date_added',)
@@ -3,3 +3,26 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        # Invalidar la caché de lecturas en save()/delete() de una fila
+        # (admin, update_or_create); los bulk/update() invalidan explícitamente.
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_migrate, post_save
+
+        from . import availability, caching, search, tenancy, timing
+        from .models import Appointment, Contact, Location
+
+        for model in (Appointment, Contact):
+            post_save.connect(caching.on_model_change, sender=model, dispatch_uid=f"read-cache-{model.__name__}")
+            post_delete.connect(caching.on_model_change, sender=model, dispatch_uid=f"read-cache-del-{model.__name__}")
+        # Índice de horarios: altas/ediciones con save() y borrados (admin incluido)
+        post_save.connect(availability.on_appointment_save, sender=Appointment, dispatch_uid="slots-save")
+        post_delete.connect(availability.on_appointment_delete, sender=Appointment, dispatch_uid="slots-delete")
+        # Credenciales cacheadas de una location editada o borrada
+        post_save.connect(tenancy.on_location_change, sender=Location, dispatch_uid="location-credentials")
+        post_delete.connect(tenancy.on_location_change, sender=Location, dispatch_uid="location-credentials-del")
+        # Tiempo de BD por petición (Server-Timing)
+        connection_created.connect(timing.on_connection_created, dispatch_uid="request-timing-db")
+        # Triggers del índice de búsqueda (SQLite) tras migraciones que rehacen tablas
+        post_migrate.connect(search.on_post_migrate, sender=self, dispatch_uid="search-index-triggers")
@@ -0,0 +1,113 @@
+# appointments/archive.py
+# Separación de citas calientes y frías: las citas que terminaron hace más de
+# ARCHIVE_AFTER_DAYS días, o canceladas hace más de ARCHIVE_CANCELLED_AFTER_DAYS,
+# pasan de Appointment a ArchivedAppointment en lotes de ARCHIVE_BATCH_SIZE
+# (un INSERT ... SELECT y un DELETE por lote, cada uno en su transacción).
+# Así la tabla Appointment y sus índices crecen con las citas vigentes y no
+# con todo el historial.
+#
+# Las filas conservan su id y sus columnas; el detalle y los webhooks siguen
+# encontrando las citas archivadas, y un upsert (webhook o reconciliación)
+# sobre una cita archivada la restaura antes de escribirla. Los listados solo
+# leen Appointment; las archivadas se listan en /api/appointments/archive/.
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import availability, caching, metrics
+from .models import Appointment, ArchivedAppointment
+from .services import resolve_contact_refs
+
+# Columnas comunes a las dos tablas (contact_ref se recalcula al restaurar)
+COLUMNS = [f.column for f in ArchivedAppointment._meta.concrete_fields if f.name != "archived_at"]
+
+
+def rules(now=None):
+    """{regla: filtro Q} de las citas a archivar; una regla con 0 días está desactivada."""
+    now = now or timezone.now()
+    found = {}
+    if settings.ARCHIVE_AFTER_DAYS:
+        cutoff = now - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+        # start_time por el índice appt_start_idx; end_time asegura que ya terminó
+        found["past"] = Q(start_time__lt=cutoff, end_time__lt=cutoff)
+    if settings.ARCHIVE_CANCELLED_AFTER_DAYS:
+        cutoff = now - timedelta(days=settings.ARCHIVE_CANCELLED_AFTER_DAYS)
+        found["cancelled"] = Q(appointment_status="cancelled", date_updated__lt=cutoff)
+    return found
+
+
+def _move(source, target, pks, extra_column=None, extra_value=None):
+    """Copia las filas `pks` de `source` a `target` y las borra de `source` (SQL directo, sin señales)."""
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(c) for c in COLUMNS)
+    placeholders = ", ".join(["%s"] * len(pks))
+    insert_columns, select_columns, params = columns, columns, []
+    if extra_column:
+        insert_columns += f", {quote(extra_column)}"
+        select_columns += ", %s"
+        params.append(extra_value)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(target._meta.db_table)} ({insert_columns}) "
+            f"SELECT {select_columns} FROM {quote(source._meta.db_table)} WHERE id IN ({placeholders})",
+            [*params, *pks],
+        )
+        cursor.execute(f"DELETE FROM {quote(source._meta.db_table)} WHERE id IN ({placeholders})", pks)
+
+
+def archive_batch(condition, batch_size, now=None):
+    """Archiva hasta `batch_size` citas que cumplen `condition`. Devuelve cuántas movió."""
+    with transaction.atomic():
+        queryset = Appointment.objects.filter(condition).order_by("start_time", "id")
+        if connection.features.has_select_for_update:
+            # Otro proceso archivando a la vez se salta las filas ya tomadas
+            queryset = queryset.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        rows = list(queryset.values_list("id", "ghl_id", "location_id")[:batch_size])
+        if not rows:
+            return 0
+        pks, ghl_ids, location_ids = zip(*rows)
+        _move(Appointment, ArchivedAppointment, list(pks), "archived_at", now or timezone.now())
+        caching.invalidate_appointments(ghl_ids, location_ids)
+        availability.appointments_removed(ghl_ids)
+    return len(rows)
+
+
+def run(batch_size=None, now=None, max_batches=None):
+    """Archiva por lotes todo lo que cumplen las reglas. Devuelve {regla: citas movidas}."""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    now = now or timezone.now()
+    moved = {}
+    for rule, condition in rules(now).items():
+        moved[rule] = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = archive_batch(condition, batch_size, now)
+            moved[rule] += count
+            batches += 1
+            if count < batch_size:
+                break
+        metrics.inc("appointments_archived_total", moved[rule], rule=rule)
+    return moved
+
+
+def restore(ghl_ids):
+    """
+    Devuelve a Appointment las citas archivadas de `ghl_ids` (antes de un
+    upsert que puede volverlas vigentes). Devuelve los ghl_id restaurados.
+    """
+    rows = list(ArchivedAppointment.objects.filter(ghl_id__in=[g for g in ghl_ids if g]).values_list("id", "ghl_id"))
+    if not rows:
+        return []
+    pks, restored = zip(*rows)
+    with transaction.atomic():
+        _move(ArchivedAppointment, Appointment, list(pks))
+        # Sin contact_ref en el archivo: enlazar de nuevo con el contacto local
+        resolve_contact_refs(list(restored))
+    return list(restored)
+
+
+def pending(now=None):
+    """{regla: citas en Appointment que el próximo run() archivaría}."""
+    return {rule: Appointment.objects.filter(condition).count() for rule, condition in rules(now).items()}
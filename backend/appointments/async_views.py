@@ -0,0 +1,149 @@
+# appointments/async_views.py
+# Versiones async (ASGI) de las vistas que llaman a GHL: crear, actualizar y
+# cancelar citas, y el webhook. Mientras GHL responde el event loop atiende
+# otras peticiones, así un solo proceso uvicorn mantiene cientos de llamadas
+# en vuelo. Se activan con GHL_ASYNC_VIEWS=True (ver urls.py); bajo WSGI
+# conviene dejar las vistas síncronas.
+#
+# DRF no tiene vistas async: son vistas de Django que responden JSON con el
+# mismo contrato que las de views.py.
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+import httpx
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from . import idempotency, outbox, services, tenancy, views, webhooks
+from .models import Appointment, ArchivedAppointment, OutboundSync
+from .resilience import GHLUnavailable
+from .serializers import AppointmentSerializer
+
+
+def _json(body, status=200, headers=None):
+    response = JsonResponse(body, status=status, headers=headers, safe=False)
+    # Cuerpo original, para guardar la respuesta con Idempotency-Key
+    response.data = body
+    return response
+
+
+def _read_json(request):
+    """Cuerpo JSON de la petición, o None si no es JSON válido."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data
+
+
+def _ghl_unavailable(exc):
+    headers = {"Retry-After": str(int(exc.retry_after + 0.999))} if exc.retry_after else None
+    return _json({"error": "GHL no disponible temporalmente", "details": str(exc)},
+                 status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers)
+
+
+async def _missing_credentials(location_id):
+    if await tenancy.acredentials_for(location_id) is None:
+        return _json(tenancy.missing_credentials_error(location_id), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotency.idempotent_async("appointments.create")
+async def appointment_create(request):
+    """Como AppointmentCreateView, con la llamada a GHL y la BD en async."""
+    data = _read_json(request)
+    if data is None:
+        return _json({"error": "JSON inválido"}, status=status.HTTP_400_BAD_REQUEST)
+    # Las credenciales de la location pueden venir de la BD: fuera del event loop
+    api_payload, location_id, error = await sync_to_async(views._build_create_payload)(data or {})
+    if error:
+        return _json(error, status=status.HTTP_400_BAD_REQUEST)
+    precheck = await sync_to_async(views._precheck_write)(request, OutboundSync.OP_CREATE, api_payload, location_id)
+    if precheck:
+        return _json(*precheck)
+
+    try:
+        appointment = await services.acreate_appointment(api_payload, location_id)
+        return _json(AppointmentSerializer(appointment).data, status=status.HTTP_201_CREATED)
+    except httpx.HTTPStatusError as http_err:
+        return _json({"error": "Error HTTP al crear cita en GHL", "details": http_err.response.text},
+                     status=http_err.response.status_code)
+    except GHLUnavailable as e:
+        return _ghl_unavailable(e)
+    except httpx.RequestError as e:
+        return _json({"error": "Error conexión GHL", "details": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+    except Exception as e:
+        return _json({"error": "Error interno", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+async def appointment_update(request, appointment_id):
+    """Como AppointmentUpdateView."""
+    data = _read_json(request)
+    if not isinstance(data, dict):
+        return _json({"error": "JSON inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+    appointment = await Appointment.objects.filter(ghl_id=appointment_id).afirst()
+    if not appointment:
+        return _json({"error": "Cita no encontrada en la base de datos local"}, status=status.HTTP_404_NOT_FOUND)
+    ghl_payload, location_id, error = await sync_to_async(views._build_update_payload)(appointment, data)
+    if error:
+        return _json(error, status=status.HTTP_400_BAD_REQUEST)
+    precheck = await sync_to_async(views._precheck_write)(request, OutboundSync.OP_UPDATE, ghl_payload, location_id,
+                                                          appointment)
+    if precheck:
+        return _json(*precheck)
+
+    try:
+        body, code = await services.aupdate_appointment(appointment, ghl_payload, location_id)
+        return _json(body, status=code)
+    except httpx.HTTPStatusError as http_err:
+        return _json({"error": "Error al actualizar cita en GHL", "details": http_err.response.text},
+                     status=http_err.response.status_code)
+    except GHLUnavailable as e:
+        return _ghl_unavailable(e)
+    except httpx.RequestError as e:
+        return _json({"error": "Error al actualizar cita en GHL", "details": str(e)}, status=500)
+    except Exception as e:
+        return _json({"error": "Error interno al procesar actualización", "details": str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["DELETE"])
+async def appointment_delete(request, appointment_id):
+    """Como AppointmentDeleteView (cancela la cita en GHL)."""
+    appointment = (await Appointment.objects.filter(ghl_id=appointment_id).afirst()
+                   or await ArchivedAppointment.objects.filter(ghl_id=appointment_id).afirst())
+    location_id = appointment.location_id if appointment else settings.GHL_LOCATION_ID
+    error = await _missing_credentials(location_id)
+    if error:
+        return error
+
+    if outbox.wants_async(request):
+        item = await sync_to_async(outbox.enqueue)(OutboundSync.OP_DELETE, location_id,
+                                                   {"appointmentStatus": "cancelled"}, ghl_id=appointment_id)
+        return _json(outbox.accepted_body(item), status=status.HTTP_202_ACCEPTED)
+
+    try:
+        code = await services.acancel_appointment(appointment_id, location_id)
+        return _json({"message": "Cita cancelada correctamente"}, status=code)
+    except GHLUnavailable as e:
+        return _ghl_unavailable(e)
+    except httpx.HTTPError as e:
+        return _json({"error": "Error al cancelar cita en GHL", "details": str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def ghl_webhook(request):
+    """Como views.ghl_webhook: no llama a GHL, solo libera el event loop mientras escribe en la BD."""
+    event = _read_json(request)
+    body, code = await sync_to_async(webhooks.handle)(event or {}, request.headers.get("X-GHL-Event"))
+    return _json(body, status=code)
@@ -0,0 +1,300 @@
+# appointments/availability.py
+# Motor local de disponibilidad: índice de intervalos en memoria por
+# calendar_id y por assigned_user_id, construido desde la tabla Appointment y
+# refrescado de forma incremental (filas con date_updated reciente).
+#
+# Las escrituras de este proceso (save_created/save_update/save_cancel, admin,
+# borrados) se aplican al confirmar la transacción; las de otros procesos
+# llegan con el refresco (cada SLOTS_REFRESH_INTERVAL s). Un borrado o
+# archivado en otro proceso no deja rastro en date_updated: las citas que
+# resultan de una consulta se comprueban contra la tabla, como mucho una vez
+# por refresco (las leídas de la tabla desde el último ya están comprobadas).
+#
+# No conoce el horario laboral configurado en GHL: "libre" significa que no
+# hay otra cita (no cancelada) en ese intervalo.
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment
+
+# Estados que no ocupan el horario
+NON_BLOCKING_STATUSES = {"cancelled", "invalid"}
+# Margen al pedir cambios: cubre transacciones que confirman con un date_updated anterior
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+CALENDAR = "calendar"
+USER = "user"
+
+
+def _ts(dt):
+    return dt.timestamp()
+
+
+def _dt(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+class IntervalIndex:
+    """
+    Intervalos [start, end) ordenados por inicio. Como todo intervalo dura a
+    lo sumo `max_len`, los que se solapan con [qs, qe) empiezan en
+    (qs - max_len, qe): una búsqueda binaria y un recorrido corto.
+    """
+
+    __slots__ = ("items", "max_len")
+
+    def __init__(self):
+        self.items = []  # (start, end, ghl_id)
+        self.max_len = 0.0
+
+    def add(self, start, end, ghl_id):
+        insort(self.items, (start, end, ghl_id))
+        self.max_len = max(self.max_len, end - start)
+
+    def remove(self, start, end, ghl_id):
+        i = bisect_left(self.items, (start, end, ghl_id))
+        if i < len(self.items) and self.items[i] == (start, end, ghl_id):
+            del self.items[i]
+
+    def overlapping(self, qs, qe):
+        lo = bisect_right(self.items, (qs - self.max_len,))
+        hi = bisect_left(self.items, (qe,))
+        return [item for item in self.items[lo:hi] if item[1] > qs]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class AvailabilityIndex:
+    """Índice de citas que ocupan horario, por calendario y por usuario asignado."""
+
+    def __init__(self, lookback_days=30):
+        self.lookback = timedelta(days=lookback_days)
+        self.indexes = {}  # (CALENDAR|USER, id) -> IntervalIndex
+        self.rows = {}  # ghl_id -> (calendar_id, assigned_user_id, start, end)
+        self.verified = set()  # ghl_ids leídos de la tabla desde el último refresco
+        self.horizon = None
+        self.watermark = None
+        self.refreshed_at = 0.0
+        self._lock = threading.RLock()
+
+    # === Mantenimiento ===
+
+    @staticmethod
+    def _keys(calendar_id, user_id):
+        keys = [(CALENDAR, calendar_id)] if calendar_id else []
+        if user_id:
+            keys.append((USER, user_id))
+        return keys
+
+    def _discard(self, ghl_id):
+        self.verified.discard(ghl_id)
+        row = self.rows.pop(ghl_id, None)
+        if row is not None:
+            calendar_id, user_id, start, end = row
+            for key in self._keys(calendar_id, user_id):
+                self.indexes[key].remove(start, end, ghl_id)
+
+    def _apply(self, ghl_id, calendar_id, user_id, status, start_time, end_time):
+        self._discard(ghl_id)
+        if status in NON_BLOCKING_STATUSES or end_time <= self.horizon:
+            return
+        start, end = _ts(start_time), _ts(end_time)
+        self.rows[ghl_id] = (calendar_id, user_id, start, end)
+        self.verified.add(ghl_id)
+        for key in self._keys(calendar_id, user_id):
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = IntervalIndex()
+            index.add(start, end, ghl_id)
+
+    def _fetch(self, queryset):
+        return queryset.values_list(
+            "ghl_id", "calendar_id", "assigned_user_id", "appointment_status", "start_time", "end_time", "date_updated"
+        ).iterator(chunk_size=5000)
+
+    def load(self):
+        """Carga completa: citas que terminan después de `ahora - lookback`."""
+        with self._lock:
+            now = timezone.now()
+            self.indexes, self.rows, self.verified = {}, {}, set()
+            self.horizon = now - self.lookback
+            watermark = None
+            for ghl_id, calendar_id, user_id, status, start, end, updated in self._fetch(
+                Appointment.objects.filter(end_time__gt=self.horizon)
+            ):
+                self._apply(ghl_id, calendar_id, user_id, status, start, end)
+                watermark = updated if watermark is None or updated > watermark else watermark
+            self.watermark = watermark or now
+            self.refreshed_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """Aplica las filas cambiadas desde la última marca (y carga todo la primera vez)."""
+        with self._lock:
+            # Recarga completa si la ventana quedó muy atrás (libera citas pasadas)
+            if self.watermark is None or timezone.now() - self.horizon > 2 * self.lookback:
+                return self.load()
+            interval = settings.SLOTS_REFRESH_INTERVAL
+            if not force and interval and time.monotonic() - self.refreshed_at < interval:
+                return
+            watermark = self.watermark
+            # Desde aquí cada cita se vuelve a comprobar (una vez) si aparece en una consulta
+            self.verified = set()
+            for ghl_id, calendar_id, user_id, status, start, end, updated in self._fetch(
+                Appointment.objects.filter(date_updated__gte=self.watermark - REFRESH_OVERLAP)
+            ):
+                self._apply(ghl_id, calendar_id, user_id, status, start, end)
+                watermark = max(watermark, updated)
+            self.watermark = watermark
+            self.refreshed_at = time.monotonic()
+
+    def forget(self, ghl_ids):
+        """Quita citas borradas de la tabla (post_delete)."""
+        with self._lock:
+            for ghl_id in ghl_ids:
+                self._discard(ghl_id)
+
+    def sync_rows(self, ghl_ids):
+        """Aplica ya las citas `ghl_ids` según la tabla (las que no están se quitan)."""
+        with self._lock:
+            if self.watermark is None:
+                return
+            found = set()
+            for ghl_id, calendar_id, user_id, status, start, end, _ in self._fetch(
+                Appointment.objects.filter(ghl_id__in=ghl_ids)
+            ):
+                self._apply(ghl_id, calendar_id, user_id, status, start, end)
+                found.add(ghl_id)
+            for ghl_id in set(ghl_ids) - found:
+                self._discard(ghl_id)
+
+    def _existing(self, items):
+        """
+        Descarta (y olvida) las citas de `items` que ya no están en la tabla.
+        Solo consulta la BD por las que no se comprobaron desde el último refresco.
+        """
+        with self._lock:
+            unverified = {item[2] for item in items} - self.verified
+            if not unverified:
+                return items
+            found = set(Appointment.objects.filter(ghl_id__in=unverified).values_list("ghl_id", flat=True))
+            self.verified |= found
+            gone = unverified - found
+            if not gone:
+                return items
+            self.forget(gone)
+        return [item for item in items if item[2] not in gone]
+
+    # === Consultas ===
+
+    def _check_window(self, start):
+        if start < self.horizon:
+            raise ValueError(f"Fuera de la ventana del índice (desde {self.horizon.isoformat()})")
+
+    def conflicts(self, start_time, end_time, calendar_id=None, assigned_user_id=None, exclude=None):
+        """ghl_ids de las citas que se solapan con [start_time, end_time) en el calendario o el usuario."""
+        self.refresh()
+        with self._lock:
+            self._check_window(start_time)
+            qs, qe = _ts(start_time), _ts(end_time)
+            items = []
+            for key in self._keys(calendar_id, assigned_user_id):
+                index = self.indexes.get(key)
+                if index is not None:
+                    items.extend(item for item in index.overlapping(qs, qe) if item[2] != exclude)
+        return sorted({item[2] for item in self._existing(items)})
+
+    def busy(self, start_time, end_time, calendar_id=None, assigned_user_id=None):
+        """Intervalos ocupados (fusionados) dentro de la ventana."""
+        self.refresh()
+        with self._lock:
+            self._check_window(start_time)
+            qs, qe = _ts(start_time), _ts(end_time)
+            items = []
+            for key in self._keys(calendar_id, assigned_user_id):
+                index = self.indexes.get(key)
+                if index is not None:
+                    items.extend(index.overlapping(qs, qe))
+        merged = []
+        for start, end, _ in sorted(self._existing(items)):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def free_slots(self, start_time, end_time, duration, step=None, calendar_id=None, assigned_user_id=None):
+        """Huecos de `duration` libres en [start_time, end_time), cada `step` (por defecto = duration)."""
+        length = duration.total_seconds()
+        step = (step or duration).total_seconds()
+        busy = self.busy(start_time, end_time, calendar_id, assigned_user_id)
+        slots = []
+        cursor, end = _ts(start_time), _ts(end_time)
+        i = 0
+        while cursor + length <= end:
+            while i < len(busy) and busy[i][1] <= cursor:
+                i += 1
+            if i < len(busy) and busy[i][0] < cursor + length:
+                # Saltar al primer inicio alineado después del bloque ocupado
+                skip = busy[i][1] - cursor
+                cursor += -(-skip // step) * step
+                continue
+            slots.append((_dt(cursor), _dt(cursor + length)))
+            cursor += step
+        return [(_dt(s), _dt(e)) for s, e in busy], slots
+
+    def stats(self):
+        with self._lock:
+            return {"appointments": len(self.rows), "keys": len(self.indexes),
+                    "horizon": self.horizon.isoformat() if self.horizon else None}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Índice del proceso actual (se carga en la primera consulta)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AvailabilityIndex(lookback_days=settings.SLOTS_LOOKBACK_DAYS)
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def appointments_changed(ghl_ids):
+    """Aplica al índice (si ya está cargado) las citas escritas por este proceso, al confirmar."""
+    index = _index
+    ghl_ids = [g for g in ghl_ids if g]
+    if index is not None and ghl_ids:
+        transaction.on_commit(lambda: index.sync_rows(ghl_ids))
+
+
+def appointments_removed(ghl_ids):
+    """Quita del índice (si ya está cargado), al confirmar, citas que salieron de la tabla sin post_delete."""
+    index = _index
+    ghl_ids = [g for g in ghl_ids if g]
+    if index is not None and ghl_ids:
+        transaction.on_commit(lambda: index.forget(ghl_ids))
+
+
+def on_appointment_save(sender, instance, **kwargs):
+    appointments_changed([instance.ghl_id])
+
+
+def on_appointment_delete(sender, instance, **kwargs):
+    appointments_changed([instance.ghl_id])
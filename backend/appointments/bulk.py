@@ -0,0 +1,86 @@
+# appointments/bulk.py
+# Alta masiva de citas: envío concurrente a GHL con un pool de hilos acotado
+# y escritura local de todos los resultados en un solo bulk_create. El ritmo y
+# los reintentos (429 incluidos) son los del cliente GHL de cada location: su
+# limitador es compartido con el resto de llamadas y procesos.
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+import requests
+
+from . import availability, caching, rollups, services
+from .models import Appointment
+from .resilience import GHLUnavailable
+
+# Campos reescritos si la cita ya existía localmente (mismo ghl_id)
+UPSERT_FIELDS = [
+    "location_id",
+    "calendar_id",
+    "contact_id",
+    "title",
+    "appointment_status",
+    "assigned_user_id",
+    "notes",
+    "start_time",
+    "end_time",
+    "source",
+    "date_updated",
+]
+
+
+def _push_one(index, api_payload, location_id):
+    """Envía una cita a GHL. Devuelve el JSON de GHL o el error del ítem."""
+    try:
+        ghl_data = services.push_appointment(api_payload, location_id)
+        return {"index": index, "ghl_data": ghl_data, "api_payload": api_payload, "location_id": location_id}
+    except requests.exceptions.HTTPError as http_err:
+        resp = http_err.response
+        code = resp.status_code if resp is not None else 500
+        details = resp.text if resp is not None else str(http_err)
+        return {"index": index, "status": code, "error": "Error HTTP al crear cita en GHL", "details": details}
+    except GHLUnavailable as e:
+        return {"index": index, "status": 503, "error": "GHL no disponible temporalmente", "details": str(e)}
+    except requests.exceptions.RequestException as e:
+        return {"index": index, "status": 502, "error": "Error conexión GHL", "details": str(e)}
+    except Exception as e:
+        return {"index": index, "status": 500, "error": "Error interno", "details": str(e)}
+
+
+def create_many(items, concurrency=None):
+    """
+    Crea en GHL las citas ya validadas (`items` = [(api_payload, location_id)])
+    y las guarda localmente. Devuelve un resultado por ítem, en el orden de entrada.
+    """
+    concurrency = concurrency or settings.GHL_BULK_CONCURRENCY
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1))) as pool:
+        futures = [
+            pool.submit(_push_one, index, api_payload, location_id)
+            for index, (api_payload, location_id) in enumerate(items)
+        ]
+        outcomes = [future.result() for future in futures]
+
+    rows = {}
+    for outcome in outcomes:
+        if "ghl_data" in outcome:
+            ghl_data = outcome["ghl_data"]
+            defaults = services.appointment_defaults(ghl_data, outcome["api_payload"], outcome["location_id"])
+            rows[ghl_data.get("id")] = Appointment(ghl_id=ghl_data.get("id"), **defaults)
+
+    if rows:
+        with transaction.atomic(), rollups.tracking(list(rows)), caching.tracking(caching.APPOINTMENTS, list(rows)):
+            Appointment.objects.bulk_create(
+                list(rows.values()), update_conflicts=True, unique_fields=["ghl_id"], update_fields=UPSERT_FIELDS
+            )
+            services.resolve_contact_refs(list(rows))
+        availability.appointments_changed(list(rows))
+
+    results = []
+    for outcome in outcomes:
+        if "ghl_data" in outcome:
+            results.append({"index": outcome["index"], "status": 201, "ghl_id": outcome["ghl_data"].get("id")})
+        else:
+            results.append(outcome)
+    return results
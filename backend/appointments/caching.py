@@ -0,0 +1,218 @@
+# appointments/caching.py
+# Caché de lectura para listados y detalle de citas/contactos sobre el cache
+# framework de Django, con ETag/304 e invalidación por location al escribir.
+#
+# Claves de listado: namespace + versión de la location filtrada (o "all") +
+# hash de los query params. Cada escritura cambia la versión de su location y
+# la de "all", así solo se invalidan los listados que pueden contener la fila.
+# El detalle usa una versión propia por ghl_id.
+#
+# Las versiones viven en la caché: para que una escritura de otro proceso
+# (otro worker, process_webhooks, process_outbox, sync_ghl, archive) invalide
+# lo de este, la caché tiene que ser compartida (READ_CACHE_BACKEND=file).
+import contextlib
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import tenancy
+from .models import Appointment, ArchivedAppointment, Contact
+
+APPOINTMENTS = "appointments"
+CONTACTS = "contacts"
+ALL_LOCATIONS = "all"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.READ_CACHE_ALIAS]
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def stats_snapshot():
+    """Aciertos/fallos de la caché en este proceso y ratio de aciertos."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats.get("hit", 0) + stats.get("miss", 0)
+    stats["hit_ratio"] = round(stats.get("hit", 0) / lookups, 4) if lookups else None
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# === Versiones e invalidación ===
+
+def _version_key(namespace, scope):
+    return f"reads:{namespace}:v:{scope}"
+
+
+def _versions(namespace, scopes):
+    """Versión actual de cada scope; se crea si no existe (o fue expulsada)."""
+    cache = _cache()
+    keys = [_version_key(namespace, scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex[:12], None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def _bump(namespace, location_ids, ghl_ids):
+    scopes = {ALL_LOCATIONS, *(loc for loc in location_ids if loc), *(f"id:{ghl_id}" for ghl_id in ghl_ids)}
+    _cache().set_many({_version_key(namespace, scope): uuid.uuid4().hex[:12] for scope in scopes}, None)
+
+
+def _locations_of(namespace, ghl_ids):
+    """Locations guardadas de `ghl_ids` (las citas también en el archivo)."""
+    models = (Appointment, ArchivedAppointment) if namespace == APPOINTMENTS else (Contact,)
+    return {
+        location_id
+        for model in models
+        for location_id in model.objects.filter(ghl_id__in=list(ghl_ids)).values_list("location_id", flat=True)
+    }
+
+
+def invalidate(namespace, ghl_ids=(), location_ids=None):
+    """
+    Invalida el detalle de `ghl_ids` y los listados de sus locations cuando
+    la transacción actual confirma. Sin `location_ids` se buscan en la BD.
+    """
+    if not settings.READ_CACHE_ENABLED:
+        return
+    ghl_ids = [g for g in ghl_ids if g]
+    if location_ids is None:
+        location_ids = _locations_of(namespace, ghl_ids) if ghl_ids else set()
+    location_ids = set(location_ids)
+    transaction.on_commit(lambda: _bump(namespace, location_ids, ghl_ids))
+
+
+def invalidate_appointments(ghl_ids=(), location_ids=None):
+    invalidate(APPOINTMENTS, ghl_ids, location_ids)
+
+
+def invalidate_contacts(ghl_ids=(), location_ids=None):
+    """Un contacto cambia su propio detalle y los listados de citas con ?expand=contact."""
+    if not settings.READ_CACHE_ENABLED:
+        return
+    ghl_ids = [g for g in ghl_ids if g]
+    if location_ids is None:
+        location_ids = _locations_of(CONTACTS, ghl_ids) if ghl_ids else set()
+    invalidate(CONTACTS, ghl_ids, location_ids)
+    invalidate(APPOINTMENTS, (), location_ids)
+
+
+@contextlib.contextmanager
+def tracking(namespace, ghl_ids):
+    """
+    Invalida (al confirmar) el detalle de `ghl_ids` y los listados de sus
+    locations de antes y de después del bloque: una fila que cambia de
+    location también sale de los listados cacheados de la anterior.
+    """
+    ghl_ids = [g for g in ghl_ids if g]
+    if not settings.READ_CACHE_ENABLED or not ghl_ids:
+        yield
+        return
+    before = _locations_of(namespace, ghl_ids)
+    yield
+    locations = before | _locations_of(namespace, ghl_ids)
+    if namespace == APPOINTMENTS:
+        invalidate_appointments(ghl_ids, locations)
+    else:
+        invalidate_contacts(ghl_ids, locations)
+
+
+def on_model_change(sender, instance, **kwargs):
+    """Receptor de post_save/post_delete (admin, save() y update_or_create)."""
+    if sender is Appointment:
+        invalidate_appointments([instance.ghl_id], [instance.location_id])
+    else:
+        invalidate_contacts([instance.ghl_id], [instance.location_id])
+
+
+# === Claves y ETag ===
+
+def detail_key(namespace, ghl_id):
+    (version,) = _versions(namespace, [f"id:{ghl_id}"])
+    return f"reads:{namespace}:detail:{ghl_id}:{version}"
+
+
+def list_key(namespace, request):
+    """Clave por location + ruta + query params (y host, que aparece en los links next/previous)."""
+    params = tenancy.scoped_params(request)
+    location_id = params.get("location_id") or ALL_LOCATIONS
+    (version,) = _versions(namespace, [location_id])
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.lists()))
+    digest = hashlib.sha256(f"{request.get_host()}{request.path}?{query}".encode()).hexdigest()[:32]
+    return f"reads:{namespace}:list:{location_id}:{version}:{digest}"
+
+
+def etag_for(data):
+    return '"%s"' % hashlib.sha256(JSONRenderer().render(data)).hexdigest()[:32]
+
+
+def _not_modified(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class CachedReadMixin:
+    """
+    Para ListAPIView/RetrieveAPIView: sirve la respuesta desde la caché si
+    existe y responde 304 si el If-None-Match coincide con el ETag.
+    """
+
+    cache_namespace = None
+    cache_lookup_kwarg = None  # kwarg de la URL con el ghl_id (vistas de detalle)
+
+    def _cache_key(self, kwargs):
+        if self.cache_lookup_kwarg:
+            return detail_key(self.cache_namespace, kwargs[self.cache_lookup_kwarg])
+        return list_key(self.cache_namespace, self.request)
+
+    def get(self, request, *args, **kwargs):
+        if not settings.READ_CACHE_ENABLED:
+            return super().get(request, *args, **kwargs)
+        # La clave (y su versión) se lee antes de consultar la BD: si una
+        # escritura llega en medio, lo guardado queda bajo la versión vieja.
+        key = self._cache_key(kwargs)
+        entry = _cache().get(key)
+        if entry is None:
+            _record("miss")
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {"data": response.data, "etag": etag_for(response.data)}
+            _cache().set(key, entry, settings.READ_CACHE_TIMEOUT)
+        else:
+            _record("hit")
+
+        headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+        if _not_modified(request, entry["etag"]):
+            _record("not_modified")
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry["data"], headers=headers)
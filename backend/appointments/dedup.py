@@ -0,0 +1,109 @@
+# appointments/dedup.py
+# Índice local de duplicados de contactos: email en minúsculas y teléfono en
+# E.164 por location_id (columnas *_normalized de Contact). Permite responder
+# "ya existe" sin llamar a GHL y cruzar miles de candidatos de una vez.
+import re
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Contact
+
+# Candidatos por consulta: dos listas IN (email y teléfono) caben en los
+# límites de parámetros de SQLite y MySQL
+MATCH_CHUNK = 500
+
+_NON_DIGITS = re.compile(r"\D")
+# Dígitos mínimos del número nacional tras un código de país escrito sin "+"
+MIN_NATIONAL_DIGITS = 8
+
+
+def normalize_email(email):
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if "@" in email else None
+
+
+def normalize_phone(phone):
+    """
+    Teléfono en formato E.164 (+ y 8 a 15 dígitos) o None.
+    Sin prefijo internacional (+ o 00) se asume CONTACT_DEFAULT_COUNTRY_CODE,
+    salvo que los dígitos ya empiecen por ese código seguido de un número
+    nacional completo (51987654321 es +51987654321, no +5151987654321).
+    """
+    if not phone:
+        return None
+    raw = str(phone).strip()
+    digits = _NON_DIGITS.sub("", raw)
+    country = settings.CONTACT_DEFAULT_COUNTRY_CODE
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif country and not (digits.startswith(country) and len(digits) - len(country) >= MIN_NATIONAL_DIGITS):
+        digits = country + digits.lstrip("0")
+    if not 8 <= len(digits) <= 15:
+        return None
+    return f"+{digits}"
+
+
+def _match_field(contact, email, phone):
+    if email and contact.email_normalized == email:
+        return "email"
+    return "phone"
+
+
+def find_duplicate(location_id, email=None, phone=None):
+    """(contacto existente, campo que coincide) o (None, None). Una sola consulta."""
+    email, phone = normalize_email(email), normalize_phone(phone)
+    conditions = Q()
+    if email:
+        conditions |= Q(email_normalized=email)
+    if phone:
+        conditions |= Q(phone_normalized=phone)
+    if not conditions:
+        return None, None
+    contact = Contact.objects.filter(conditions, location_id=location_id).order_by("date_added").first()
+    if contact is None:
+        return None, None
+    return contact, _match_field(contact, email, phone)
+
+
+def match_many(location_id, candidates):
+    """
+    Cruza una lista de {"email", "phone"} con los contactos de la location.
+    Devuelve un resultado por candidato, en el mismo orden. Una consulta por
+    cada MATCH_CHUNK candidatos.
+    """
+    keys = [(normalize_email(c.get("email")), normalize_phone(c.get("phone"))) for c in candidates]
+    by_email, by_phone = {}, {}
+    for start in range(0, len(keys), MATCH_CHUNK):
+        chunk = keys[start:start + MATCH_CHUNK]
+        emails = {email for email, _ in chunk if email}
+        phones = {phone for _, phone in chunk if phone}
+        if not emails and not phones:
+            continue
+        rows = (
+            Contact.objects.filter(Q(email_normalized__in=emails) | Q(phone_normalized__in=phones),
+                                   location_id=location_id)
+            .order_by("-date_added")
+            .values_list("ghl_id", "email_normalized", "phone_normalized")
+        )
+        # Orden descendente: si hay varios, queda el contacto más antiguo
+        for ghl_id, email, phone in rows:
+            if email in emails:
+                by_email[email] = ghl_id
+            if phone in phones:
+                by_phone[phone] = ghl_id
+
+    results = []
+    for index, (email, phone) in enumerate(keys):
+        if email in by_email:
+            match = {"contact_id": by_email[email], "matching_field": "email"}
+        elif phone in by_phone:
+            match = {"contact_id": by_phone[phone], "matching_field": "phone"}
+        else:
+            match = {"contact_id": None, "matching_field": None}
+        results.append({"index": index, "matched": match["contact_id"] is not None, **match})
+    return results
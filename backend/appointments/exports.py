@@ -0,0 +1,116 @@
+# appointments/exports.py
+# Exportación completa de citas y contactos en streaming (NDJSON o CSV).
+# Las filas se leen por bloques con .iterator() y se escriben a medida que
+# se generan, así la memoria no crece con el tamaño de la tabla.
+import csv
+import json
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from rest_framework.exceptions import ValidationError
+
+from . import tenancy
+from .filters import filter_appointments, filter_contacts
+from .models import Appointment, Contact
+
+CHUNK_SIZE = 2000
+
+APPOINTMENT_EXPORT_FIELDS = [
+    "ghl_id",
+    "location_id",
+    "calendar_id",
+    "contact_id",
+    "title",
+    "appointment_status",
+    "assigned_user_id",
+    "notes",
+    "start_time",
+    "end_time",
+    "source",
+    "date_added",
+    "date_updated",
+]
+CONTACT_EXPORT_FIELDS = [
+    "ghl_id",
+    "location_id",
+    "first_name",
+    "last_name",
+    "email",
+    "phone",
+    "source",
+    "date_added",
+    "date_updated",
+]
+DATETIME_FIELDS = {"start_time", "end_time", "date_added", "date_updated"}
+
+
+class _Echo:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def _iso(value, tz):
+    """Mismo formato que DateTimeField de DRF: ISO8601 en la zona actual, 'Z' para UTC."""
+    value = value.astimezone(tz).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _rows(queryset, fields):
+    """Listas con las fechas ya formateadas igual que la API."""
+    tz = timezone.get_current_timezone()
+    datetime_positions = [i for i, name in enumerate(fields) if name in DATETIME_FIELDS]
+    for row in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        row = list(row)
+        for i in datetime_positions:
+            if row[i] is not None:
+                row[i] = _iso(row[i], tz)
+        yield row
+
+
+def _ndjson(rows, fields):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n"
+
+
+def _csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _export(request, queryset, fields, name, filter_func):
+    output = request.GET.get("output", "ndjson")
+    if output not in ("ndjson", "csv"):
+        return JsonResponse({"error": "output debe ser 'ndjson' o 'csv'"}, status=400)
+    try:
+        queryset = filter_func(queryset, tenancy.scoped_params(request))
+    except ValidationError as e:
+        return JsonResponse({"error": e.detail}, status=400)
+
+    rows = _rows(queryset.order_by("pk"), fields)
+    if output == "csv":
+        response = StreamingHttpResponse(_csv(rows, fields), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{name}.csv"'
+    else:
+        response = StreamingHttpResponse(_ndjson(rows, fields), content_type="application/x-ndjson; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{name}.ndjson"'
+    return response
+
+
+@require_GET
+def export_appointments(request):
+    """GET /api/appointments/export/?output=ndjson|csv (misma location y filtros que el listado)."""
+    return _export(request, Appointment.objects.all(), APPOINTMENT_EXPORT_FIELDS, "appointments", filter_appointments)
+
+
+@require_GET
+def export_contacts(request):
+    """GET /api/contacts/export/?output=ndjson|csv (mismos filtros que el listado)."""
+    return _export(request, Contact.objects.all(), CONTACT_EXPORT_FIELDS, "contacts", filter_contacts)
@@ -0,0 +1,148 @@
+# appointments/fastread.py
+# Camino rápido de lectura para los listados: en vez de instanciar modelos y
+# pasar cada fila por los campos de DRF, se leen dicts con .values() y se
+# convierten con un "plan" precompilado a partir del serializer.
+#
+# El resultado es idéntico al de serializer.data (mismas claves, mismo orden,
+# mismos valores): los campos de texto/enteros pasan tal cual, las fechas se
+# formatean como DateTimeField de DRF, los None se respetan y cualquier otro
+# tipo de campo usa su propio to_representation. Si el serializer tiene algo
+# que el plan no sabe leer de .values() (métodos, source con puntos, listas
+# anidadas), compile_plan() lanza Unsupported y la vista usa el serializer normal.
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+from .exports import _iso
+
+# Campos del modelo cuyo valor de .values() ya es el de la respuesta
+_PASSTHROUGH = {
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.EmailField: (models.CharField,),
+    serializers.IntegerField: (models.AutoField, models.BigAutoField, models.IntegerField),
+}
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Plan:
+    """Columnas de .values() y conversión fila -> dict de un serializer."""
+
+    def __init__(self, names, columns, converters, nested):
+        self.names = names
+        self.columns = columns
+        # itemgetter con una sola columna devuelve el valor y no una tupla
+        self._getter = itemgetter(*columns) if len(columns) > 1 else lambda row: tuple(row[c] for c in columns)
+        # (nombre, función) solo para los campos que no pasan tal cual
+        self._converters = converters
+        # (nombre, Plan) de serializers anidados sobre una ForeignKey
+        self._nested = nested
+        self.all_columns = [*columns, *(column for _, plan in nested for column in plan.all_columns)]
+
+    def convert(self, rows):
+        """Lista de dicts de la respuesta para las filas (dicts de .values())."""
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [self._convert(row, tz) for row in rows]
+
+    def _convert(self, row, tz):
+        out = dict(zip(self.names, self._getter(row)))
+        for name, convert in self._converters:
+            value = out[name]
+            if value is not None:
+                out[name] = convert(value, tz)
+        for name, plan in self._nested:
+            # La columna del anidado es la FK: None si no hay relacionado
+            if out[name] is not None:
+                out[name] = plan._convert(row, tz)
+        return out
+
+
+def _field_converter(field, model_field):
+    for serializer_type, model_types in _PASSTHROUGH.items():
+        if type(field) is serializer_type and isinstance(model_field, model_types):
+            return None
+    if (type(field) is serializers.DateTimeField and isinstance(model_field, models.DateTimeField)
+            and settings.USE_TZ and getattr(field, "timezone", None) is None
+            and str(getattr(field, "format", api_settings.DATETIME_FORMAT)).lower() == ISO_8601):
+        # DateTimeField.to_representation con formato ISO 8601, igual que en las exportaciones
+        return _iso
+    # Cualquier otro: el mismo to_representation del serializer
+    return lambda value, tz: field.to_representation(value)
+
+
+def _compile(serializer, model, prefix=""):
+    names, columns, converters, nested = [], [], [], []
+    for field in serializer._readable_fields:
+        source = field.source
+        if source == "*" or "." in source or field.source_attrs != [source]:
+            raise Unsupported(f"{field.field_name}: source {source!r}")
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise Unsupported(f"{field.field_name}: {source!r} no es un campo del modelo") from None
+        names.append(field.field_name)
+        columns.append(prefix + source)
+        if isinstance(field, serializers.ModelSerializer):
+            if not isinstance(model_field, models.ForeignKey):
+                raise Unsupported(f"{field.field_name}: anidado sin ForeignKey")
+            nested.append((field.field_name, _compile(field, model_field.related_model, f"{prefix}{source}__")))
+        elif isinstance(field, serializers.BaseSerializer) or model_field.is_relation:
+            raise Unsupported(f"{field.field_name}: relación")
+        else:
+            convert = _field_converter(field, model_field)
+            if convert is not None:
+                converters.append((field.field_name, convert))
+    return Plan(names, columns, converters, nested)
+
+
+def compile_plan(serializer_class):
+    """Plan para `serializer_class` (un ModelSerializer); Unsupported si no se puede."""
+    serializer = serializer_class()
+    return _compile(serializer, serializer.Meta.model)
+
+
+@lru_cache(maxsize=None)
+def _cached_plan(serializer_class):
+    try:
+        return compile_plan(serializer_class)
+    except Unsupported:
+        return None
+
+
+def plan_for(serializer_class):
+    """Plan o None si el camino rápido está desactivado o el serializer no es compatible."""
+    if not settings.FAST_READ_PATH_ENABLED:
+        return None
+    return _cached_plan(serializer_class)
+
+
+class FastListMixin:
+    """
+    Para ListAPIView: pagina sobre .values() y convierte la página con el plan
+    del serializer; si no hay plan, el list() normal de DRF.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = plan_for(self.get_serializer_class())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        # La paginación por cursor lee de cada fila las columnas de orden
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        columns = dict.fromkeys([*plan.all_columns, *(field.lstrip("-") for field in ordering)])
+        rows = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(plan.convert(rows))
+        return self.get_paginated_response(plan.convert(page))
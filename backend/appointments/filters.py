@@ -0,0 +1,51 @@
+# appointments/filters.py
+# Filtros de los listados a partir de los query params.
+from rest_framework.exceptions import ValidationError
+
+from .services import _to_datetime
+
+APPOINTMENT_FILTERS = ["location_id", "calendar_id", "contact_id", "assigned_user_id", "appointment_status"]
+CONTACT_FILTERS = ["location_id", "source"]
+
+
+def _datetime_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    dt = _to_datetime(value)
+    if dt is None:
+        raise ValidationError({name: "Fecha inválida, usar ISO8601 (ej. 2025-01-20T10:00:00Z)"})
+    return dt
+
+
+def _exact_filters(queryset, params, fields):
+    lookups = {field: params[field] for field in fields if params.get(field)}
+    return queryset.filter(**lookups) if lookups else queryset
+
+
+def filter_appointments(queryset, params):
+    """
+    Filtros exactos por location_id, calendar_id, contact_id, assigned_user_id,
+    appointment_status y ventana de tiempo: start <= start_time < end.
+    """
+    queryset = _exact_filters(queryset, params, APPOINTMENT_FILTERS)
+    start = _datetime_param(params, "start")
+    end = _datetime_param(params, "end")
+    if start:
+        queryset = queryset.filter(start_time__gte=start)
+    if end:
+        queryset = queryset.filter(start_time__lt=end)
+    return queryset
+
+
+def filter_contacts(queryset, params):
+    """Filtros exactos por location_id y source."""
+    return _exact_filters(queryset, params, CONTACT_FILTERS)
+
+
+def search_term(params):
+    """Texto de ?q= de las búsquedas (obligatorio)."""
+    term = (params.get("q") or "").strip()
+    if not term:
+        raise ValidationError({"q": "Parámetro requerido (texto, email o teléfono a buscar)"})
+    return term
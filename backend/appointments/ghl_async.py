@@ -0,0 +1,172 @@
+# appointments/ghl_async.py
+# Cliente GHL asíncrono (httpx) para las vistas async bajo ASGI: un solo
+# proceso mantiene cientos de llamadas a GHL en vuelo sin ocupar un hilo por
+# llamada. Hay uno por event loop y location, y comparte con el cliente
+# síncrono de su location el circuit breaker, el presupuesto de reintentos y
+# los token buckets del proceso.
+import asyncio
+import time
+import weakref
+
+from django.conf import settings
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from . import metrics, tenancy
+from .ghl_client import IDEMPOTENT_METHODS, GHLClient, MissingCredentials, client_for
+from .ratelimit import SharedTokenBucket
+from .resilience import GHLUnavailable, backoff_delay
+from .timing import track
+
+
+class AsyncGHLClient:
+    """
+    Igual que GHLClient pero con `httpx.AsyncClient`: pool de conexiones
+    keep-alive de hasta `pool_size` conexiones, turnos por location
+    (`max_concurrency` del cliente síncrono) y limitador sin bloquear el event
+    loop, y reintentos con `asyncio.sleep`. Devuelve `httpx.Response`.
+    """
+
+    def __init__(self, sync_client, pool_size=100):
+        self.sync = sync_client
+        self._slots = asyncio.Semaphore(sync_client.max_concurrency) if sync_client.max_concurrency else None
+        timeout = sync_client.timeout
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.client = httpx.AsyncClient(
+            base_url=sync_client.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def url(self, path):
+        return self.sync.url(path)
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            return
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.sync.queue_timeout)
+        except asyncio.TimeoutError:
+            self.sync.count("queue_timeout")
+            raise GHLUnavailable("Demasiadas llamadas a GHL en curso para esta location",
+                                 retry_after=self.sync.queue_timeout) from None
+
+    def _release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    @staticmethod
+    async def _on_bucket(bucket, func, *args):
+        """
+        Llama a `func` sobre el bucket. El compartido entre procesos hace flock
+        y lee/escribe su fichero: va a un hilo para no frenar el event loop.
+        """
+        if isinstance(bucket, SharedTokenBucket):
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    async def _throttle(self, bucket):
+        if bucket is None:
+            return
+        deadline = time.monotonic() + self.sync.rate_limit_max_wait
+        while True:
+            wait = await self._on_bucket(bucket, bucket.try_acquire)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                self.sync.count("throttled")
+                raise GHLUnavailable("Límite de peticiones a GHL alcanzado", retry_after=self.sync.rate_limit_max_wait)
+            await asyncio.sleep(wait)
+
+    async def request(self, method, path, location_id=None, timeout=None, idempotent=None, **kwargs):
+        """Mismo contrato que GHLClient.request; lanza httpx.RequestError o GHLUnavailable."""
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        await self._acquire_slot()
+        try:
+            return await self._request(method, path, location_id, idempotent, kwargs)
+        finally:
+            self._release_slot()
+
+    async def _request(self, method, path, location_id, idempotent, kwargs):
+        sync = self.sync
+        bucket = sync.bucket_for(location_id)
+        sync.retry_budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Primero el token: si no llega a tiempo no se ocupa el turno de prueba del circuito
+            await self._throttle(bucket)
+            sync.breaker.before_call()
+            sync.count("requests")
+            try:
+                resp = await self._send(method, path, location_id, kwargs)
+            except httpx.TransportError as e:
+                # Un ConnectError/ConnectTimeout nunca llegó a GHL: se puede repetir cualquier método
+                not_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not sync._can_retry(attempt, idempotent or not_sent):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, sync.backoff_base, sync.backoff_cap))
+                continue
+            if bucket is not None:
+                await self._on_bucket(bucket, GHLClient._observe, bucket, resp)
+            delay = sync._retry_delay(resp, attempt, idempotent)
+            if delay is None:
+                return resp
+            await asyncio.sleep(delay)
+
+    async def _send(self, method, path, location_id, kwargs):
+        """Una llamada a GHL: mide su duración e informa el resultado al circuit breaker."""
+        start = time.perf_counter()
+        try:
+            with track("ghl"):
+                resp = await self.client.request(method, path, headers=self.sync.headers_for(location_id), **kwargs)
+        except httpx.TransportError as e:
+            metrics.observe_ghl(method, path, type(e).__name__, time.perf_counter() - start)
+            self.sync.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cualquier otro error (o la cancelación de la tarea): liberar la prueba half-open
+            self.sync.breaker.release_probe()
+            raise
+        self.sync._record_response(method, path, resp.status_code, time.perf_counter() - start)
+        return resp
+
+    async def get(self, path, location_id=None, **kwargs):
+        return await self.request("GET", path, location_id, **kwargs)
+
+    async def post(self, path, location_id=None, **kwargs):
+        return await self.request("POST", path, location_id, **kwargs)
+
+    async def put(self, path, location_id=None, **kwargs):
+        return await self.request("PUT", path, location_id, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# Por event loop (las conexiones de httpx pertenecen al loop que las abrió),
+# un cliente por location: loop -> {location_id: AsyncGHLClient}
+_clients = weakref.WeakKeyDictionary()
+
+
+async def get_async_ghl_client(location_id=None):
+    """Cliente async de la location en el event loop actual (MissingCredentials si no hay)."""
+    credentials = await tenancy.acredentials_for(location_id)
+    if credentials is None:
+        raise MissingCredentials(location_id)
+    sync_client = client_for(credentials)
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(credentials.location_id)
+    if client is None or client.sync is not sync_client:
+        client = clients[credentials.location_id] = AsyncGHLClient(sync_client, pool_size=settings.GHL_ASYNC_POOL_SIZE)
+    return client
+
+
+def reset_async_ghl_clients():
+    _clients.clear()
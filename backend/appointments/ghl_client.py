@@ -0,0 +1,345 @@
+# appointments/ghl_client.py
+# Clientes HTTP para la API de GHL, uno por location (sesión con pool y
+# keep-alive, límite de llamadas simultáneas, limitador de peticiones,
+# reintentos con backoff y circuit breaker propios: una location lenta o
+# limitada no frena a las demás)
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .ratelimit import get_bucket
+from .resilience import CircuitBreaker, GHLUnavailable, RetryBudget, backoff_delay, retry_after_seconds
+from .timing import track
+
+# Métodos que se pueden repetir sin riesgo de duplicar efectos en GHL
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Respuestas que indican GHL degradado (cuentan para el circuit breaker)
+SERVER_ERRORS = {500, 502, 503, 504}
+
+
+class GHLClient:
+    """
+    Cliente GHL con una sesión `requests` reutilizable.
+
+    La sesión mantiene un pool de conexiones keep-alive hacia GHL, así cada
+    llamada evita un nuevo handshake TCP+TLS. Los headers de autenticación se
+    construyen una sola vez por locationId y se reutilizan.
+
+    Cada petición ocupa uno de `max_concurrency` turnos hasta terminar (si no
+    hay turno en `queue_timeout` segundos se rechaza), pasa por un token bucket
+    por API key + locationId (compartido entre procesos si hay
+    `rate_limit_dir`), se reintenta ante 429, 5xx y errores de conexión con
+    backoff exponencial y jitter (solo métodos idempotentes, salvo 429) y se
+    rechaza al instante si el circuito está abierto.
+    """
+
+    def __init__(self, api_key, api_version, base_url, pool_size=10, timeout=15, connect_timeout=None,
+                 rate_limit=0, rate_burst=None, rate_limit_dir=None, rate_limit_max_wait=10.0,
+                 max_retries=0, backoff_base=0.5, backoff_cap=10.0, retry_budget_ratio=0.2,
+                 breaker_threshold=5, breaker_reset_timeout=30.0, max_concurrency=0, queue_timeout=10.0,
+                 credentials=None):
+        self.api_key = api_key
+        self.api_version = api_version
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, timeout) if connect_timeout else timeout
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.rate_limit_dir = rate_limit_dir
+        self.rate_limit_max_wait = rate_limit_max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = RetryBudget(retry_budget_ratio)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # Credenciales con las que se creó (tenancy.Credentials); si cambian se crea otro cliente
+        self.credentials = credentials
+        self.stats = Counter()
+        self._headers_cache = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def headers_for(self, location_id):
+        """Headers de autenticación para una location (cacheados)."""
+        headers = self._headers_cache.get(location_id)
+        if headers is None:
+            with self._lock:
+                headers = self._headers_cache.get(location_id)
+                if headers is None:
+                    headers = {
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Version": self.api_version,
+                        "Content-Type": "application/json",
+                    }
+                    if location_id:
+                        headers["LocationId"] = location_id
+                    self._headers_cache[location_id] = headers
+        return headers
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def count(self, event):
+        """Suma un evento del cliente; salvo "requests", también a ghl_client_events_total de su location."""
+        self.stats[event] += 1
+        if event != "requests":
+            location_id = self.credentials.location_id if self.credentials else None
+            metrics.inc("ghl_client_events_total", event=event, location=location_id or "")
+
+    def bucket_for(self, location_id):
+        """Token bucket de la API key + location, o None si el limitador está desactivado."""
+        if not self.rate_limit:
+            return None
+        return get_bucket(f"{self.api_key}:{location_id or ''}", self.rate_limit, self.rate_burst,
+                          self.rate_limit_dir)
+
+    def _throttle(self, bucket):
+        if bucket is None:
+            return
+        if not bucket.acquire(timeout=self.rate_limit_max_wait):
+            self.count("throttled")
+            raise GHLUnavailable("Límite de peticiones a GHL alcanzado", retry_after=self.rate_limit_max_wait)
+
+    def _acquire_slot(self):
+        if self._slots is None:
+            return
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.count("queue_timeout")
+            raise GHLUnavailable("Demasiadas llamadas a GHL en curso para esta location",
+                                 retry_after=self.queue_timeout)
+
+    def _release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    @staticmethod
+    def _observe(bucket, resp):
+        """Ajusta el limitador con los headers X-RateLimit-* de GHL y, ante un 429, con su Retry-After."""
+        headers = resp.headers
+        try:
+            remaining = headers.get("X-RateLimit-Remaining")
+            limit = headers.get("X-RateLimit-Max")
+            interval = headers.get("X-RateLimit-Interval-Milliseconds")
+            bucket.observe(
+                remaining=int(remaining) if remaining is not None else None,
+                limit=int(limit) if limit else None,
+                interval=int(interval) / 1000 if interval else None,
+            )
+        except ValueError:
+            pass
+        if resp.status_code == 429:
+            delay = retry_after_seconds(resp)
+            if delay:
+                bucket.block(delay)
+
+    def request(self, method, path, location_id=None, timeout=None, idempotent=None, **kwargs):
+        """
+        Petición a GHL con turno, limitador, reintentos y circuit breaker.
+        Devuelve la última respuesta (el llamador decide con raise_for_status)
+        o lanza la excepción de requests / GHLUnavailable.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        # El turno se mantiene durante los reintentos: una location con GHL
+        # lento o limitado ocupa como mucho `max_concurrency` hilos
+        self._acquire_slot()
+        try:
+            return self._request(method, path, location_id, timeout, idempotent, kwargs)
+        finally:
+            self._release_slot()
+
+    def _request(self, method, path, location_id, timeout, idempotent, kwargs):
+        bucket = self.bucket_for(location_id)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Primero el token: si no llega a tiempo no se ocupa el turno de prueba del circuito
+            self._throttle(bucket)
+            self.breaker.before_call()
+            self.count("requests")
+            try:
+                resp = self._send(method, path, location_id, timeout, kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Un ConnectTimeout nunca llegó a GHL: se puede repetir cualquier método
+                not_sent = isinstance(e, requests.exceptions.ConnectTimeout)
+                if not self._can_retry(attempt, idempotent or not_sent):
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+                continue
+            if bucket is not None:
+                self._observe(bucket, resp)
+            delay = self._retry_delay(resp, attempt, idempotent)
+            if delay is None:
+                return resp
+            resp.close()
+            time.sleep(delay)
+
+    def _send(self, method, path, location_id, timeout, kwargs):
+        """Una llamada a GHL: mide su duración e informa el resultado al circuit breaker."""
+        start = time.perf_counter()
+        try:
+            with track("ghl"):
+                resp = self.session.request(
+                    method,
+                    self.url(path),
+                    headers=self.headers_for(location_id),
+                    timeout=timeout or self.timeout,
+                    **kwargs,
+                )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            metrics.observe_ghl(method, path, type(e).__name__, time.perf_counter() - start)
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cualquier otro error no es un resultado de GHL: liberar la prueba half-open
+            self.breaker.release_probe()
+            raise
+        self._record_response(method, path, resp.status_code, time.perf_counter() - start)
+        return resp
+
+    def _record_response(self, method, path, status_code, duration):
+        """Métrica de la llamada y resultado para el circuit breaker (los 5xx cuentan como fallo)."""
+        metrics.observe_ghl(method, path, status_code, duration)
+        if status_code in SERVER_ERRORS:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _retry_delay(self, resp, attempt, idempotent):
+        """
+        Segundos a esperar antes de repetir la petición que respondió `resp`, o
+        None si se devuelve tal cual: un 429 se repite (si su Retry-After no
+        supera rate_limit_max_wait) y un 5xx solo en métodos idempotentes.
+        """
+        if resp.status_code == 429:
+            delay = max(retry_after_seconds(resp) or 0.0, backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+            if delay > self.rate_limit_max_wait or not self._can_retry(attempt, True):
+                return None
+            return delay
+        if resp.status_code in SERVER_ERRORS and self._can_retry(attempt, idempotent):
+            return backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        return None
+
+    def _can_retry(self, attempt, retryable):
+        if not retryable or attempt > self.max_retries:
+            return False
+        if not self.retry_budget.withdraw():
+            self.count("retry_budget_exhausted")
+            return False
+        self.count("retries")
+        return True
+
+    def get(self, path, location_id=None, **kwargs):
+        return self.request("GET", path, location_id, **kwargs)
+
+    def post(self, path, location_id=None, **kwargs):
+        return self.request("POST", path, location_id, **kwargs)
+
+    def put(self, path, location_id=None, **kwargs):
+        return self.request("PUT", path, location_id, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class MissingCredentials(Exception):
+    """La location no tiene credenciales de GHL (no registrada, inactiva o sin GHL_API_KEY)."""
+
+    def __init__(self, location_id):
+        super().__init__(f"Sin credenciales de GHL para la location {location_id or '(ninguna)'}")
+        self.location_id = location_id
+
+
+# location_id -> GHLClient del proceso actual
+_clients = {}
+_clients_pid = None
+_client_lock = threading.Lock()
+
+
+def _build_client(credentials):
+    return GHLClient(
+        api_key=credentials.api_key,
+        api_version=credentials.api_version,
+        base_url=settings.GHL_BASE_URL,
+        pool_size=credentials.pool_size,
+        timeout=settings.GHL_HTTP_TIMEOUT,
+        connect_timeout=settings.GHL_HTTP_CONNECT_TIMEOUT,
+        rate_limit=credentials.rate_limit,
+        rate_burst=settings.GHL_RATE_LIMIT_BURST,
+        rate_limit_dir=settings.GHL_RATE_LIMIT_DIR,
+        rate_limit_max_wait=settings.GHL_RATE_LIMIT_MAX_WAIT,
+        max_retries=settings.GHL_MAX_RETRIES,
+        backoff_base=settings.GHL_RETRY_BACKOFF_BASE,
+        backoff_cap=settings.GHL_RETRY_BACKOFF_MAX,
+        retry_budget_ratio=settings.GHL_RETRY_BUDGET_RATIO,
+        breaker_threshold=settings.GHL_BREAKER_FAILURE_THRESHOLD,
+        breaker_reset_timeout=settings.GHL_BREAKER_RESET_TIMEOUT,
+        max_concurrency=credentials.max_concurrency,
+        queue_timeout=settings.GHL_LOCATION_QUEUE_TIMEOUT,
+        credentials=credentials,
+    )
+
+
+def client_for(credentials):
+    """
+    Cliente de una location en el proceso actual. Se crea de forma perezosa,
+    se vuelve a crear tras un fork (gunicorn con --preload) para no compartir
+    sockets entre procesos, y también si cambian sus credenciales o límites.
+    """
+    global _clients_pid
+    pid = os.getpid()
+    client = _clients.get(credentials.location_id) if _clients_pid == pid else None
+    if client is None or client.credentials != credentials:
+        with _client_lock:
+            if _clients_pid != pid:
+                _clients.clear()
+                _clients_pid = pid
+            client = _clients.get(credentials.location_id)
+            if client is None or client.credentials != credentials:
+                # El cliente anterior no se cierra: puede tener peticiones en curso
+                client = _clients[credentials.location_id] = _build_client(credentials)
+    return client
+
+
+def get_ghl_client(location_id=None):
+    """Cliente GHL de la location (MissingCredentials si no hay con qué autenticarse)."""
+    from .tenancy import credentials_for
+
+    credentials = credentials_for(location_id)
+    if credentials is None:
+        raise MissingCredentials(location_id)
+    return client_for(credentials)
+
+
+def clients():
+    """Clientes creados en este proceso, por location_id."""
+    if _clients_pid != os.getpid():
+        return {}
+    return dict(_clients)
+
+
+def reset_ghl_client():
+    """Descarta los clientes actuales (útil en tests o al cambiar credenciales)."""
+    global _clients_pid
+    with _client_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _clients_pid = None
@@ -0,0 +1,227 @@
+# appointments/idempotency.py
+# Cabecera Idempotency-Key en los POST de creación: la primera petición con
+# una clave la reserva en IdempotencyKey y guarda su respuesta; los reintentos
+# con la misma clave reciben esa respuesta sin volver a llamar a GHL.
+#
+# Peticiones simultáneas con la misma clave esperan a la primera (sondeando la
+# fila) en lugar de competir con ella. Las respuestas transitorias (5xx, 408,
+# 429) no se guardan: la clave se libera y el reintento vuelve a intentarlo.
+import asyncio
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_last_purge = 0.0
+
+
+def _is_transient(status_code):
+    return status_code >= 500 or status_code in (408, 429)
+
+
+def fingerprint(method, path, data):
+    """Hash de método, ruta y cuerpo: la misma clave con otro cuerpo es un error del cliente."""
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{method} {path}\n{body}".encode()).hexdigest()
+
+
+def purge_expired(force=False):
+    """Borra las claves vencidas (como mucho cada IDEMPOTENCY_PURGE_INTERVAL segundos por proceso)."""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < settings.IDEMPOTENCY_PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def _claim(scope, key, digest):
+    """
+    Reserva la clave. Devuelve (registro, True) si esta petición debe ejecutar
+    la vista, o (registro existente, False) si otra ya la reservó.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                scope=scope, key=key, fingerprint=digest, locked_at=now,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(scope=scope, key=key).first(), False
+
+
+def _take_over(record):
+    """Toma una reserva abandonada (proceso caído a mitad de la petición)."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    return bool(
+        IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.STATUS_PROCESSING, locked_at__lt=stale)
+        .update(locked_at=now)
+    )
+
+
+def _try_acquire(scope, key, digest):
+    """Un intento de reserva: (registro, es_dueño, hay_que_esperar)."""
+    record, owner = _claim(scope, key, digest)
+    if owner:
+        return record, True, False
+    if record is None:
+        # La primera petición liberó la clave: volver a reservar
+        return None, False, True
+    if record.status == IdempotencyKey.STATUS_DONE or record.fingerprint != digest:
+        return record, False, False
+    if _take_over(record):
+        return record, True, False
+    return record, False, True
+
+
+def _acquire(scope, key, digest):
+    """
+    Devuelve (registro, es_dueño). Si la clave está en proceso espera hasta
+    IDEMPOTENCY_WAIT_TIMEOUT a que termine; al vencer devuelve el registro
+    todavía en `processing`.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    delay = 0.05
+    while True:
+        record, owner, wait = _try_acquire(scope, key, digest)
+        if not wait or (record is not None and time.monotonic() >= deadline):
+            return record, owner
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+async def _aacquire(scope, key, digest):
+    """Como _acquire, esperando con asyncio.sleep (no retiene el event loop)."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    delay = 0.05
+    while True:
+        record, owner, wait = await sync_to_async(_try_acquire)(scope, key, digest)
+        if not wait or (record is not None and time.monotonic() >= deadline):
+            return record, owner
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def _release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.STATUS_PROCESSING).delete()
+
+
+def _finish(record, status_code, body):
+    """Guarda la respuesta, o libera la clave si el fallo es transitorio."""
+    if _is_transient(status_code):
+        _release(record)
+        return
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status=IdempotencyKey.STATUS_DONE,
+        response_status_code=status_code,
+        response_body=json.loads(json.dumps(body, default=str)),
+    )
+
+
+def _precheck(key):
+    """Error (body, status) si la clave no es válida."""
+    if len(key) > MAX_KEY_LENGTH:
+        return {"error": f"{HEADER} admite como máximo {MAX_KEY_LENGTH} caracteres"}, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def _not_owner_response(record, digest):
+    """(body, status, headers) para una petición que no ejecuta la vista."""
+    if record.fingerprint != digest:
+        return ({"error": f"{HEADER} ya usada con otro cuerpo de petición"},
+                status.HTTP_422_UNPROCESSABLE_ENTITY, {})
+    if record.status != IdempotencyKey.STATUS_DONE:
+        return ({"error": "Otra petición con la misma Idempotency-Key sigue en curso"},
+                status.HTTP_409_CONFLICT, {"Retry-After": "1"})
+    return record.response_body, record.response_status_code, {REPLAY_HEADER: "true"}
+
+
+def idempotent(scope):
+    """
+    Decorador para el `post` de una APIView. Sin cabecera Idempotency-Key la
+    vista se ejecuta como siempre.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key or not settings.IDEMPOTENCY_ENABLED:
+                return view_method(self, request, *args, **kwargs)
+            error = _precheck(key)
+            if error:
+                return Response(error[0], status=error[1])
+
+            purge_expired()
+            digest = fingerprint(request.method, request.path, request.data)
+            record, owner = _acquire(scope, key, digest)
+            if not owner:
+                body, code, headers = _not_owner_response(record, digest)
+                return Response(body, status=code, headers=headers)
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except BaseException:
+                _release(record)
+                raise
+            _finish(record, response.status_code, response.data)
+            return response
+        return wrapper
+    return decorator
+
+
+def idempotent_async(scope):
+    """
+    Igual que `idempotent` para vistas async de Django (las de async_views),
+    que reciben un HttpRequest y devuelven JsonResponse con `.data`.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key or not settings.IDEMPOTENCY_ENABLED:
+                return await view(request, *args, **kwargs)
+            error = _precheck(key)
+            if error:
+                return JsonResponse(error[0], status=error[1])
+            try:
+                data = json.loads(request.body or b"{}")
+            except ValueError:
+                return await view(request, *args, **kwargs)
+
+            await sync_to_async(purge_expired)()
+            digest = fingerprint(request.method, request.path, data)
+            record, owner = await _aacquire(scope, key, digest)
+            if not owner:
+                body, code, headers = _not_owner_response(record, digest)
+                return JsonResponse(body, status=code, headers=headers, safe=False)
+
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await sync_to_async(_release)(record)
+                raise
+            await sync_to_async(_finish)(record, response.status_code, response.data)
+            return response
+        return wrapper
+    return decorator
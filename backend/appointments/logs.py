@@ -0,0 +1,110 @@
+# appointments/logs.py
+# Logging estructurado: una línea JSON por registro con los campos de `extra`,
+# payloads redactados (sin email, teléfono, nombres...) y muestreo.
+#
+# Los payloads van al logger "appointments.payload" en nivel DEBUG envueltos
+# en `Redacted`: si el nivel no está activo o el muestreo descarta el
+# registro, nunca se redactan ni se serializan.
+import json
+import logging
+import random
+
+from django.conf import settings
+
+# Atributos propios de LogRecord: todo lo demás vino en `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+MASK = "***"
+
+
+def redact(data, fields=None):
+    """Copia de `data` con los campos sensibles (LOG_REDACT_FIELDS, sin mayúsculas) enmascarados."""
+    if fields is None:
+        fields = settings.LOG_REDACT_FIELDS
+    if isinstance(data, dict):
+        return {
+            key: MASK if str(key).lower() in fields and value not in (None, "") else redact(value, fields)
+            for key, value in data.items()
+        }
+    if isinstance(data, (list, tuple)):
+        return [redact(item, fields) for item in data]
+    return data
+
+
+class Redacted:
+    """Payload (o función que lo devuelve) que se redacta solo si el log se emite."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def value(self):
+        data = self.data() if callable(self.data) else self.data
+        return redact(data)
+
+    def __str__(self):
+        return json.dumps(self.value(), ensure_ascii=False, default=str)
+
+
+def response_payload(resp):
+    """Cuerpo de una respuesta requests/httpx, parseado y redactado solo al emitir el log."""
+    def body():
+        try:
+            return resp.json()
+        except ValueError:
+            return resp.text[:500]
+    return Redacted(body)
+
+
+def _default(value):
+    if isinstance(value, Redacted):
+        return value.value()
+    return str(value)
+
+
+def extra_fields(record):
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON: ts, level, logger, msg y los campos de `extra`."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=_default)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo: mensaje seguido de `clave=valor`."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = " ".join(
+            f"{key}={json.dumps(value, ensure_ascii=False, default=_default)}"
+            for key, value in extra_fields(record).items()
+        )
+        return f"{line} {fields}" if fields else line
+
+
+class SampleFilter(logging.Filter):
+    """Deja pasar solo una fracción `rate` de los registros."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+def sampled(rate):
+    return rate >= 1 or random.random() < rate
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from appointments import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve a ArchivedAppointment las citas pasadas (ARCHIVE_AFTER_DAYS) y las canceladas "
+        "hace tiempo (ARCHIVE_CANCELLED_AFTER_DAYS), por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE, help="Citas por transacción")
+        parser.add_argument("--max-batches", type=int, help="Tope de lotes por regla en esta ejecución")
+        parser.add_argument("--dry-run", action="store_true", help="Solo contar las citas a archivar")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            counts = archive.pending()
+            self.stdout.write(", ".join(f"{rule}: {n}" for rule, n in counts.items()) or "Reglas desactivadas")
+            return
+        moved = archive.run(batch_size=options["batch_size"], max_batches=options["max_batches"])
+        summary = ", ".join(f"{rule}: {n}" for rule, n in moved.items()) or "reglas desactivadas"
+        self.stdout.write(self.style.SUCCESS(f"Citas archivadas — {summary}"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from appointments.outbox import run_worker
+
+
+class Command(BaseCommand):
+    help = "Envía a GHL los cambios de citas encolados en el outbox (modo async)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Hilos que llaman a GHL en paralelo")
+        parser.add_argument("--batch-size", type=int, default=50, help="Elementos reservados por iteración")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Espera (s) cuando la cola está vacía")
+        parser.add_argument("--once", action="store_true", help="Vaciar la cola y terminar")
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+            stdout=self.stdout if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Procesados: {processed}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from appointments.webhooks import drain
+
+
+class Command(BaseCommand):
+    help = "Aplica por lotes los webhooks de GHL guardados en el inbox (GHL_WEBHOOK_MODE=deferred)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Eventos por transacción")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Espera (s) cuando el inbox está vacío")
+        parser.add_argument("--once", action="store_true", help="Vaciar el inbox y terminar")
+        parser.add_argument("--delete-processed", action="store_true", help="Borrar los eventos ya aplicados")
+
+    def handle(self, *args, **options):
+        processed, failed = drain(
+            batch_size=options["batch_size"],
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+            delete_processed=options["delete_processed"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Procesados: {processed}, fallidos: {failed}"))
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recalcula el resumen de citas por día (AppointmentRollup) desde la tabla Appointment."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Solo los días desde esta fecha (YYYY-MM-DD); por defecto todo")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = date.fromisoformat(options["since"])
+            except ValueError:
+                raise CommandError("--since debe ser una fecha YYYY-MM-DD")
+        rows = rebuild(since=since)
+        self.stdout.write(self.style.SUCCESS(f"Filas del resumen: {rows}"))
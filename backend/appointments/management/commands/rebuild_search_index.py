@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from appointments.search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda FTS5 de contactos y citas (solo SQLite)."
+
+    def handle(self, *args, **options):
+        if rebuild():
+            self.stdout.write(self.style.SUCCESS("Índice de búsqueda reconstruido"))
+        else:
+            self.stdout.write("El índice de este motor lo mantiene la BD; no hay nada que reconstruir")
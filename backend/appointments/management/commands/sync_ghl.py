@@ -0,0 +1,48 @@
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from appointments import reconcile, tenancy
+
+
+def _date_arg(value):
+    day = parse_date(value) if value else None
+    if value and day is None:
+        raise CommandError(f"Fecha inválida: {value} (usar AAAA-MM-DD)")
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+
+class Command(BaseCommand):
+    help = "Reconciliación de citas y contactos con GHL (completa o incremental desde la marca de agua)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=[reconcile.MODE_FULL, reconcile.MODE_INCREMENTAL],
+                            default=reconcile.MODE_INCREMENTAL)
+        parser.add_argument("--entities", default="contacts,appointments", help="contacts, appointments o ambas")
+        parser.add_argument("--location", default=None, help="locationId (por defecto GHL_LOCATION_ID)")
+        parser.add_argument("--since", default=None, help="Inicio de la ventana de citas (AAAA-MM-DD)")
+        parser.add_argument("--until", default=None, help="Fin de la ventana de citas (AAAA-MM-DD)")
+        parser.add_argument("--window-days", type=int, default=7, help="Días por página de eventos")
+        parser.add_argument("--workers", type=int, default=8, help="Páginas descargadas en paralelo")
+
+    def handle(self, *args, **options):
+        location_id = options["location"] or settings.GHL_LOCATION_ID
+        if not location_id:
+            raise CommandError("No se encontró locationId (usar --location o GHL_LOCATION_ID)")
+        if tenancy.credentials_for(location_id) is None:
+            raise CommandError(tenancy.missing_credentials_error(location_id)["error"])
+
+        for entity in [e.strip() for e in options["entities"].split(",") if e.strip()]:
+            stats = reconcile.run(
+                entity,
+                location_id,
+                mode=options["mode"],
+                since=_date_arg(options["since"]),
+                until=_date_arg(options["until"]),
+                window_days=options["window_days"],
+                workers=options["workers"],
+            )
+            self.stdout.write(self.style.SUCCESS(f"{entity}: {stats}"))
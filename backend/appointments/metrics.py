@@ -0,0 +1,348 @@
+# appointments/metrics.py
+# Métricas estilo Prometheus dentro del propio proceso, sin servicios
+# externos: contadores e histogramas en memoria, expuestos en GET /metrics
+# con el formato de texto de Prometheus.
+#
+# Varios procesos (workers de gunicorn, outbox, process_webhooks): un hilo de
+# cada proceso vuelca su estado cada METRICS_FLUSH_INTERVAL segundos (si
+# cambió) a METRICS_DIR/<pid>-<token>.json y /metrics suma todos los
+# ficheros. Registrar una métrica no toca el disco. Los de
+# procesos que ya terminaron se funden en archive.json (con flock) para que
+# los contadores no retrocedan cuando gunicorn recicla un worker.
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: los ficheros de procesos muertos no se archivan
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Nombre -> (tipo, ayuda)
+METRICS = {
+    "http_request_duration_seconds": ("histogram", "Duración de las peticiones por vista, método y status"),
+    "http_request_db_queries": ("histogram", "Consultas a la BD por petición"),
+    "ghl_request_duration_seconds": ("histogram", "Duración de las llamadas a GHL por endpoint, método y status"),
+    "ghl_request_errors_total": ("counter", "Llamadas a GHL con status >= 400 o error de conexión"),
+    "ghl_client_events_total": (
+        "counter",
+        "Reintentos, esperas del limitador, turnos agotados y presupuesto agotado del cliente GHL de cada location",
+    ),
+    "webhook_events_total": ("counter", "Webhooks de GHL por tipo y resultado"),
+    "read_cache_lookups_total": ("counter", "Consultas a la caché de lecturas por resultado"),
+    "appointments_archived_total": ("counter", "Citas movidas a ArchivedAppointment por regla (past, cancelled)"),
+    "outbound_sync_queue_depth": ("gauge", "Cambios hacia GHL en el outbox por estado"),
+    "webhook_inbox_queue_depth": ("gauge", "Webhooks en el inbox por estado"),
+}
+
+WEBHOOK_TYPES = {"AppointmentCreate", "AppointmentUpdate", "AppointmentDelete"}
+ARCHIVE = "archive.json"
+
+# Segmentos de ruta que son ids (para agrupar /contacts/<id> en un endpoint)
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[A-Za-z0-9_-]{8,}$")
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """Contadores e histogramas del proceso (thread-safe)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets),
+                                               "sum": 0.0, "count": 0}
+            for i, bound in enumerate(hist["buckets"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+                    break
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Estado serializable en JSON (incluye los contadores de los collectors)."""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: {**hist, "counts": list(hist["counts"])} for key, hist in self.histograms.items()}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [[name, dict(labels), hist] for (name, labels), hist in histograms.items()],
+        }
+
+
+def merge(snapshots):
+    """Suma varios snapshots en uno."""
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in snap.get("histograms", []):
+            key = _key(name, labels)
+            total = histograms.get(key)
+            if total is None or total["buckets"] != hist["buckets"]:
+                histograms[key] = {**hist, "counts": list(hist["counts"])}
+                continue
+            total["counts"] = [a + b for a, b in zip(total["counts"], hist["counts"])]
+            total["sum"] += hist["sum"]
+            total["count"] += hist["count"]
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, dict(labels), hist] for (name, labels), hist in histograms.items()],
+    }
+
+
+registry = Registry()
+
+_token = uuid.uuid4().hex[:8]
+_dirty = False
+_flush_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _process_file():
+    return os.path.join(settings.METRICS_DIR, f"{os.getpid()}-{_token}.json")
+
+
+def flush():
+    """Vuelca el estado del proceso a METRICS_DIR."""
+    global _dirty
+    if not settings.METRICS_DIR:
+        return
+    with _flush_lock:
+        _dirty = False
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = _process_file()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(registry.snapshot(), fh)
+        os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        if _dirty:
+            flush()
+
+
+def _touch():
+    """Marca el estado como cambiado y arranca el hilo de volcado de este proceso."""
+    global _dirty, _flusher_pid, _token
+    _dirty = True
+    pid = os.getpid()
+    if _flusher_pid == pid or not settings.METRICS_DIR:
+        return
+    with _flush_lock:
+        if _flusher_pid == pid:
+            return
+        if _flusher_pid is not None:
+            # Hijo de un fork (gunicorn --preload): no heredar los contadores del padre
+            registry.clear()
+            _token = uuid.uuid4().hex[:8]
+        _flusher_pid = pid
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def inc(name, value=1, **labels):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+        _touch()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    if settings.METRICS_ENABLED:
+        registry.observe(name, value, buckets, **labels)
+        _touch()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """Snapshot de todos los procesos (o solo de este sin METRICS_DIR)."""
+    if not settings.METRICS_DIR:
+        return registry.snapshot()
+    flush()
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    snapshots, dead = [], []
+    for fname in os.listdir(directory):
+        if not fname.endswith(".json") or fname == ARCHIVE:
+            continue
+        path = os.path.join(directory, fname)
+        try:
+            pid = int(fname.split("-", 1)[0])
+        except ValueError:
+            continue
+        if fcntl is not None and pid != os.getpid() and not _alive(pid):
+            dead.append(path)
+        else:
+            snapshots.append(_read(path))
+    archive_path = os.path.join(directory, ARCHIVE)
+    if dead:
+        _archive(archive_path, dead)
+    snapshots.append(_read(archive_path))
+    return merge(s for s in snapshots if s)
+
+
+def _archive(archive_path, dead):
+    """Funde los ficheros de procesos terminados en archive.json y los borra."""
+    with open(os.path.join(os.path.dirname(archive_path), ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshots = [_read(archive_path)]
+        existing = [path for path in dead if os.path.exists(path)]
+        snapshots.extend(_read(path) for path in existing)
+        tmp = f"{archive_path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(merge(s for s in snapshots if s), fh)
+        os.replace(tmp, archive_path)
+        for path in existing:
+            os.remove(path)
+
+
+def ghl_endpoint(path):
+    """/calendars/events/appointments/abc123XYZ -> /calendars/events/appointments/{id}"""
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+def observe_ghl(method, path, status, seconds):
+    endpoint = ghl_endpoint(path)
+    observe("ghl_request_duration_seconds", seconds, endpoint=endpoint, method=method, status=status)
+    if not isinstance(status, int) or status >= 400:
+        inc("ghl_request_errors_total", endpoint=endpoint, method=method, status=status)
+
+
+def observe_request(request, response, timings, total):
+    match = getattr(request, "resolver_match", None)
+    view = (match.url_name or match.view_name) if match else "unmatched"
+    observe("http_request_duration_seconds", total, view=view, method=request.method, status=response.status_code)
+    observe("http_request_db_queries", timings.spans.get("db", (0.0, 0))[1], QUERY_BUCKETS, view=view)
+
+
+def webhook_type(event_type):
+    return event_type if event_type in WEBHOOK_TYPES else "ignored"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot, gauges=()):
+    """Texto en formato de exposición de Prometheus 0.0.4."""
+    series = {}
+    for name, labels, value in snapshot["counters"]:
+        series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for name, labels, hist in snapshot["histograms"]:
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(hist["buckets"], hist["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {hist['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    for name, labels, value in gauges:
+        series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    out = []
+    for name in sorted(series):
+        kind, help_text = METRICS.get(name, ("untyped", ""))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(sorted(series[name]))
+    return "\n".join(out) + "\n"
+
+
+def queue_depths():
+    """Gauges de las colas en BD (se calculan al leer /metrics, valen para todos los procesos)."""
+    from django.db.models import Count
+
+    from .models import OutboundSync, WebhookEvent
+
+    queues = [
+        ("outbound_sync_queue_depth", OutboundSync,
+         [OutboundSync.STATUS_PENDING, OutboundSync.STATUS_PROCESSING, OutboundSync.STATUS_FAILED,
+          OutboundSync.STATUS_NEEDS_RECONCILE]),
+        ("webhook_inbox_queue_depth", WebhookEvent,
+         [WebhookEvent.STATUS_PENDING, WebhookEvent.STATUS_PROCESSING, WebhookEvent.STATUS_FAILED]),
+    ]
+    gauges = []
+    for name, model, statuses in queues:
+        counts = dict(
+            model.objects.filter(status__in=statuses).values_list("status").annotate(n=Count("id")).order_by()
+        )
+        gauges.extend((name, {"status": s}, counts.get(s, 0)) for s in statuses)
+    return gauges
+
+
+def _read_cache_stats():
+    from . import caching
+
+    with caching._stats_lock:
+        stats = dict(caching._stats)
+    return [("read_cache_lookups_total", {"outcome": outcome}, count) for outcome, count in stats.items()]
+
+
+registry.collectors.extend([_read_cache_stats])
+atexit.register(lambda: _dirty and flush())
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='ghl_date_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='last_event_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
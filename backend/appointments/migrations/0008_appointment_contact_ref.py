@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_contact_ref(apps, schema_editor):
+    """Resuelve en un solo UPDATE las citas cuyo contact_id ya existe como contacto local."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Contact = apps.get_model('appointments', 'Contact')
+    Appointment.objects.filter(contact_id__in=Contact.objects.values('ghl_id')).update(contact_ref_id=F('contact_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='contact_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='appointments.contact', to_field='ghl_id'),
+        ),
+        migrations.RunPython(backfill_contact_ref, migrations.RunPython.noop),
+    ]
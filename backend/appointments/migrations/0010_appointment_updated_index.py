@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_reconciliation_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date_updated'], name='appt_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:46
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copia de appointments.dedup.normalize_* al escribir esta migración: el
+# backfill no debe cambiar si después cambia el módulo.
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_email(email):
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if "@" in email else None
+
+
+def normalize_phone(phone):
+    if not phone:
+        return None
+    raw = str(phone).strip()
+    digits = _NON_DIGITS.sub("", raw)
+    country = getattr(settings, "CONTACT_DEFAULT_COUNTRY_CODE", "")
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif country and not (digits.startswith(country) and len(digits) - len(country) >= 8):
+        digits = country + digits.lstrip("0")
+    if not 8 <= len(digits) <= 15:
+        return None
+    return f"+{digits}"
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    """Calcula email/teléfono normalizados de los contactos existentes, por lotes."""
+    Contact = apps.get_model('appointments', 'Contact')
+    batch = []
+    for contact in Contact.objects.only('id', 'email', 'phone').iterator(chunk_size=2000):
+        contact.email_normalized = normalize_email(contact.email)
+        contact.phone_normalized = normalize_phone(contact.phone)
+        batch.append(contact)
+        if len(batch) >= 2000:
+            Contact.objects.bulk_update(batch, ['email_normalized', 'phone_normalized'])
+            batch = []
+    if batch:
+        Contact.objects.bulk_update(batch, ['email_normalized', 'phone_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='email_normalized',
+            field=models.CharField(blank=True, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_normalized',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['location_id', 'email_normalized'], name='contact_loc_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['location_id', 'phone_normalized'], name='contact_loc_phone_idx'),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:13
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Llena el resumen con las citas existentes (como `manage.py rebuild_rollups`)."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentRollup = apps.get_model('appointments', 'AppointmentRollup')
+    fields = ('location_id', 'day', 'calendar_id', 'assigned_user_id', 'appointment_status')
+    grouped = (
+        Appointment.objects.annotate(day=TruncDate('start_time'))
+        .values_list(*fields)
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    counts = Counter()
+    for location_id, day, calendar_id, user_id, status, n in grouped.iterator(chunk_size=5000):
+        counts[location_id, day, calendar_id, user_id or '', status] += n
+    AppointmentRollup.objects.bulk_create(
+        [AppointmentRollup(**dict(zip(fields, key)), count=n) for key, n in counts.items()], batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_contact_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('calendar_id', models.CharField(max_length=100)),
+                ('assigned_user_id', models.CharField(blank=True, default='', max_length=100)),
+                ('appointment_status', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='rollup_day_idx'), models.Index(fields=['calendar_id', 'day'], name='rollup_cal_day_idx'), models.Index(fields=['assigned_user_id', 'day'], name='rollup_user_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('location_id', 'day', 'calendar_id', 'assigned_user_id', 'appointment_status'), name='rollup_key_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:35
+
+import logging
+
+from django.db import OperationalError, migrations, models
+
+logger = logging.getLogger("appointments.search")
+
+# DDL del índice de texto tal como quedó al escribir esta migración (no se
+# importa appointments.search: la migración no debe cambiar con el módulo).
+# (tabla, tabla FTS5, índice GIN/FULLTEXT, columnas)
+INDEXES = [
+    ("appointments_contact", "appointments_contact_fts", "contact_search_idx", ("first_name", "last_name", "email")),
+    ("appointments_appointment", "appointments_appointment_fts", "appt_search_idx", ("title", "notes")),
+]
+
+
+def _sqlite_statements(table, fts, columns):
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN {delete_old} {insert_new} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def install_search_index(apps, schema_editor):
+    """Índice de texto según el motor (FTS5 + triggers en SQLite, GIN en PostgreSQL, FULLTEXT en MySQL)."""
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table, fts, index_name, columns in INDEXES:
+            if vendor == "sqlite":
+                try:
+                    for sql in _sqlite_statements(table, fts, columns):
+                        cursor.execute(sql)
+                except OperationalError as e:
+                    # SQLite compilado sin FTS5: la búsqueda usa icontains
+                    logger.warning("no se pudo crear el índice FTS5", extra={"table": table, "error": str(e)})
+                    return
+            elif vendor == "postgresql":
+                document = " || ' ' || ".join(f"coalesce({c}, '')" for c in columns)
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING GIN (to_tsvector('simple', {document}))"
+                )
+            elif vendor == "mysql":
+                cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index_name} ({', '.join(columns)})")
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table, fts, index_name, columns in INDEXES:
+            if vendor == "sqlite":
+                for suffix in ("ai", "ad", "au"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+            elif vendor == "postgresql":
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            elif vendor == "mysql":
+                cursor.execute(f"ALTER TABLE {table} DROP INDEX {index_name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_appointment_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['email_normalized'], name='contact_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['phone_normalized'], name='contact_phone_idx'),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('api_key', models.CharField(max_length=500)),
+                ('api_version', models.CharField(blank=True, max_length=20)),
+                ('default_assigned_user_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('rate_limit_per_second', models.FloatField(blank=True, null=True)),
+                ('max_concurrency', models.PositiveIntegerField(blank=True, null=True)),
+                ('pool_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboundsync',
+            index=models.Index(fields=['status', 'location_id', 'available_at'], name='outbox_status_loc_avail_idx'),
+        ),
+    ]
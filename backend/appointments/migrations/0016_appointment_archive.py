@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0015_location_registry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ghl_id', models.CharField(max_length=100, unique=True)),
+                ('location_id', models.CharField(max_length=100)),
+                ('calendar_id', models.CharField(max_length=100)),
+                ('contact_id', models.CharField(max_length=100)),
+                ('title', models.CharField(default='Cita', max_length=200)),
+                ('appointment_status', models.CharField(default='confirmed', max_length=50)),
+                ('assigned_user_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('source', models.CharField(blank=True, max_length=50, null=True)),
+                ('date_added', models.DateTimeField()),
+                ('date_updated', models.DateTimeField()),
+                ('ghl_date_updated', models.DateTimeField(blank=True, null=True)),
+                ('last_event_fingerprint', models.CharField(blank=True, max_length=64, null=True)),
+                ('archived_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['location_id', 'start_time'], name='archive_loc_start_idx'), models.Index(fields=['contact_id', 'start_time'], name='archive_contact_start_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0017_webhook_event_locking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboundsync',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('done', 'Completado'), ('failed', 'Fallido'), ('needs_reconcile', 'Revisar con reconciliación')], default='pending', max_length=20),
+        ),
+    ]
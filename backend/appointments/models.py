@@ -2,6 +2,29 @@
 # Modelo para gestionar las citas del sistema GHL Sala 02
 from django.db import models
 
+class Location(models.Model):
+    """
+    Sub-cuenta de GHL (location) con sus credenciales y límites propios. Las
+    locations sin registro usan GHL_API_KEY y los límites globales de settings.
+    """
+    location_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=200, blank=True)
+    # Token de la sub-cuenta (private integration / OAuth de la location)
+    api_key = models.CharField(max_length=500)
+    api_version = models.CharField(max_length=20, blank=True)
+    default_assigned_user_id = models.CharField(max_length=100, null=True, blank=True)
+    # Vacíos = valores globales (GHL_RATE_LIMIT_PER_SECOND, GHL_LOCATION_MAX_CONCURRENCY, GHL_HTTP_POOL_SIZE)
+    rate_limit_per_second = models.FloatField(null=True, blank=True)
+    max_concurrency = models.PositiveIntegerField(null=True, blank=True)
+    pool_size = models.PositiveIntegerField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name or self.location_id} ({self.location_id})"
+
+
 class Contact(models.Model):
     """Modelo para gestionar contactos de GHL"""
     ghl_id = models.CharField(max_length=100, unique=True)
@@ -13,6 +36,40 @@ class Contact(models.Model):
     source = models.CharField(max_length=50, null=True, blank=True)
     date_added = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
+    # dateUpdated de GHL del último cambio sincronizado
+    ghl_date_updated = models.DateTimeField(null=True, blank=True)
+    # Claves de deduplicación: email en minúsculas y teléfono en E.164
+    email_normalized = models.CharField(max_length=254, null=True, blank=True)
+    phone_normalized = models.CharField(max_length=16, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Orden del listado (-date_added) y filtro por location
+            models.Index(fields=["date_added", "id"], name="contact_added_idx"),
+            models.Index(fields=["location_id", "date_added"], name="contact_loc_added_idx"),
+            models.Index(fields=["source", "date_added"], name="contact_source_added_idx"),
+            # Búsqueda de duplicados antes de crear en GHL
+            models.Index(fields=["location_id", "email_normalized"], name="contact_loc_email_idx"),
+            models.Index(fields=["location_id", "phone_normalized"], name="contact_loc_phone_idx"),
+            # Búsqueda por email/teléfono sin location (search.py)
+            models.Index(fields=["email_normalized"], name="contact_email_idx"),
+            models.Index(fields=["phone_normalized"], name="contact_phone_idx"),
+        ]
+
+    def fill_lookup_keys(self):
+        """Recalcula email/teléfono normalizados (bulk_create no pasa por save())."""
+        from .dedup import normalize_email, normalize_phone
+
+        self.email_normalized = normalize_email(self.email)
+        self.phone_normalized = normalize_phone(self.phone)
+        return self
+
+    def save(self, *args, **kwargs):
+        self.fill_lookup_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email", "phone"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "email_normalized", "phone_normalized"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.ghl_id})"
@@ -22,6 +79,16 @@ class Appointment(models.Model):
     location_id = models.CharField(max_length=100)
     calendar_id = models.CharField(max_length=100)
     contact_id = models.CharField(max_length=100)
+    # Relación opcional con el contacto local (mismo ghl_id que contact_id);
+    # queda en NULL mientras el contacto no exista en la BD local.
+    contact_ref = models.ForeignKey(
+        Contact,
+        to_field="ghl_id",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="appointments",
+    )
     title = models.CharField(max_length=200, default="Cita")
     appointment_status = models.CharField(max_length=50, default="confirmed")
     assigned_user_id = models.CharField(max_length=100, null=True, blank=True)
@@ -31,6 +98,225 @@ class Appointment(models.Model):
     source = models.CharField(max_length=50, null=True, blank=True)
     date_added = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
+    # Versión del último webhook aplicado (dateUpdated de GHL + huella del evento)
+    ghl_date_updated = models.DateTimeField(null=True, blank=True)
+    last_event_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Orden del listado (-start_time) y filtros + ventana de tiempo
+            models.Index(fields=["start_time", "id"], name="appt_start_idx"),
+            models.Index(fields=["location_id", "start_time"], name="appt_loc_start_idx"),
+            models.Index(fields=["calendar_id", "start_time"], name="appt_cal_start_idx"),
+            models.Index(fields=["assigned_user_id", "start_time"], name="appt_user_start_idx"),
+            # Búsquedas por contacto y filtros del admin por estado
+            models.Index(fields=["contact_id", "start_time"], name="appt_contact_start_idx"),
+            models.Index(fields=["appointment_status", "start_time"], name="appt_status_start_idx"),
+            models.Index(fields=["location_id", "appointment_status", "start_time"], name="appt_loc_status_start_idx"),
+            # Refresco incremental del índice de disponibilidad (filas cambiadas)
+            models.Index(fields=["date_updated"], name="appt_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.ghl_id})"
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Citas pasadas o canceladas hace tiempo, fuera de la tabla Appointment
+    (ver archive.py). Mismas columnas y mismo id que tenían en Appointment,
+    sin la relación con el contacto (se recalcula al restaurarlas).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    ghl_id = models.CharField(max_length=100, unique=True)
+    location_id = models.CharField(max_length=100)
+    calendar_id = models.CharField(max_length=100)
+    contact_id = models.CharField(max_length=100)
+    title = models.CharField(max_length=200, default="Cita")
+    appointment_status = models.CharField(max_length=50, default="confirmed")
+    assigned_user_id = models.CharField(max_length=100, null=True, blank=True)
+    notes = models.TextField(null=True, blank=True)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    source = models.CharField(max_length=50, null=True, blank=True)
+    date_added = models.DateTimeField()
+    date_updated = models.DateTimeField()
+    ghl_date_updated = models.DateTimeField(null=True, blank=True)
+    last_event_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["location_id", "start_time"], name="archive_loc_start_idx"),
+            models.Index(fields=["contact_id", "start_time"], name="archive_contact_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.ghl_id}, archivada)"
+
+
+class AppointmentRollup(models.Model):
+    """
+    Citas por location, día de start_time (en TIME_ZONE), calendario, usuario
+    asignado y estado. Se mantiene de forma incremental (ver rollups.py).
+    """
+    location_id = models.CharField(max_length=100)
+    day = models.DateField()
+    calendar_id = models.CharField(max_length=100)
+    # "" = sin usuario asignado (con NULL la restricción UNIQUE no agruparía)
+    assigned_user_id = models.CharField(max_length=100, blank=True, default="")
+    appointment_status = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # También sirve a las consultas del dashboard: location + rango de días
+            models.UniqueConstraint(
+                fields=["location_id", "day", "calendar_id", "assigned_user_id", "appointment_status"],
+                name="rollup_key_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="rollup_day_idx"),
+            # Dashboards de un calendario o de un usuario
+            models.Index(fields=["calendar_id", "day"], name="rollup_cal_day_idx"),
+            models.Index(fields=["assigned_user_id", "day"], name="rollup_user_day_idx"),
+        ]
+
+    def key(self):
+        return (self.location_id, self.day, self.calendar_id, self.assigned_user_id, self.appointment_status)
+
+    def __str__(self):
+        return f"{self.day} {self.calendar_id} {self.appointment_status}: {self.count}"
+
+
+class OutboundSync(models.Model):
+    """Cola (outbox) de cambios pendientes de enviar a GHL en modo asíncrono."""
+
+    OP_CREATE = "create"
+    OP_UPDATE = "update"
+    OP_DELETE = "delete"
+    OPERATION_CHOICES = [
+        (OP_CREATE, "Crear cita"),
+        (OP_UPDATE, "Actualizar cita"),
+        (OP_DELETE, "Cancelar cita"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    # Un create que pudo llegar a GHL sin respuesta clara: no se repite (duplicaría
+    # la cita); la reconciliación (sync_ghl) trae la cita si se creó
+    STATUS_NEEDS_RECONCILE = "needs_reconcile"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pendiente"),
+        (STATUS_PROCESSING, "Procesando"),
+        (STATUS_DONE, "Completado"),
+        (STATUS_FAILED, "Fallido"),
+        (STATUS_NEEDS_RECONCILE, "Revisar con reconciliación"),
+    ]
+
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES)
+    ghl_id = models.CharField(max_length=100, null=True, blank=True)
+    location_id = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    available_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_status_avail_idx"),
+            # Reparto de cada lote entre locations (outbox.claim_batch)
+            models.Index(fields=["status", "location_id", "available_at"], name="outbox_status_loc_avail_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.ghl_id or ''} [{self.status}] ({self.pk})"
+
+
+class WebhookEvent(models.Model):
+    """Inbox durable de webhooks de GHL, procesado por lotes fuera del request."""
+
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pendiente"),
+        (STATUS_PROCESSING, "Procesando"),
+        (STATUS_PROCESSED, "Procesado"),
+        (STATUS_FAILED, "Fallido"),
+    ]
+
+    event_type = models.CharField(max_length=50, null=True, blank=True)
+    ghl_id = models.CharField(max_length=100, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    batch_id = models.CharField(max_length=32, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    # Veces que un consumidor lo tomó; al llegar a GHL_WEBHOOK_MAX_ATTEMPTS sin aplicarse queda fallido
+    attempts = models.PositiveIntegerField(default=0)
+    # Cuándo se tomó: un evento en processing más viejo que GHL_WEBHOOK_LOCK_TIMEOUT se recupera
+    locked_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="webhook_status_id_idx"),
+            models.Index(fields=["batch_id"], name="webhook_batch_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.ghl_id} [{self.status}]"
+
+
+class SyncState(models.Model):
+    """Marca de agua (high-water mark) de la reconciliación con GHL por entidad y location."""
+    name = models.CharField(max_length=150, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_stats = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water_mark}"
+
+
+class IdempotencyKey(models.Model):
+    """Respuesta guardada de un POST con cabecera Idempotency-Key (se reutiliza hasta expires_at)."""
+
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_CHOICES = [
+        (STATUS_PROCESSING, "Procesando"),
+        (STATUS_DONE, "Completado"),
+    ]
+
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PROCESSING)
+    response_status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    date_added = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} [{self.status}]"
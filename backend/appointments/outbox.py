@@ -0,0 +1,221 @@
+# appointments/outbox.py
+# Modo "async write": los cambios se guardan en OutboundSync y un pool de
+# workers los envía a GHL en segundo plano (sin broker externo, solo la BD).
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import chain, islice, zip_longest
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Min
+from django.utils import timezone
+
+import requests
+
+from . import services
+from .models import Appointment, OutboundSync
+from .resilience import GHLUnavailable
+from .serializers import AppointmentSerializer
+
+# Códigos de GHL que vale la pena reintentar
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Un create (POST) no es idempotente: solo se repite si GHL seguro no lo procesó
+CREATE_RETRYABLE_STATUS = {429}
+
+
+def wants_async(request):
+    """El cliente pide modo async con `Prefer: respond-async` o `?async=1`; si no, manda el setting."""
+    prefer = request.headers.get("Prefer", "")
+    if "respond-async" in prefer:
+        return True
+    flag = request.GET.get("async")
+    if flag is not None:
+        return flag.lower() in ("1", "true", "yes")
+    return settings.GHL_ASYNC_WRITES
+
+
+def enqueue(operation, location_id, payload, ghl_id=None):
+    """Registra un cambio pendiente y lo deja disponible para los workers."""
+    return OutboundSync.objects.create(
+        operation=operation,
+        ghl_id=ghl_id,
+        location_id=location_id,
+        payload=payload,
+        available_at=timezone.now(),
+    )
+
+
+def accepted_body(item):
+    """Cuerpo de la respuesta 202 devuelta al encolar."""
+    return {
+        "status": item.status,
+        "sync_id": item.pk,
+        "operation": item.operation,
+        "ghl_id": item.ghl_id,
+        "status_url": f"/api/sync/{item.pk}/",
+    }
+
+
+def _pending_by_location(pending, limit):
+    """
+    Hasta `limit` pendientes repartidos por turnos entre locations (el más
+    antiguo de cada una, después el segundo, ...): una location con miles de
+    cambios en cola no deja esperando a las demás. Cada location se lee con
+    el índice (status, location_id, available_at).
+    """
+    locations = list(pending.order_by().values_list("location_id", flat=True).distinct())
+    queues = [
+        list(pending.filter(location_id=location_id).order_by("available_at", "pk")
+             .values_list("pk", "ghl_id", "available_at")[:limit])
+        for location_id in locations
+    ]
+    # Empieza la location que lleva más tiempo esperando
+    queues = sorted(filter(None, queues), key=lambda queue: queue[0][2])
+    rows = (row for row in chain.from_iterable(zip_longest(*queues)) if row is not None)
+    return [(pk, ghl_id) for pk, ghl_id, _ in islice(rows, limit)]
+
+
+def claim_batch(limit):
+    """
+    Reserva hasta `limit` elementos pendientes, repartidos entre locations.
+
+    El UPDATE condicionado a status=pending hace de lock optimista, así varios
+    procesos pueden consumir la misma tabla sin tomar dos veces un elemento.
+    También se recuperan elementos que quedaron en `processing` por un worker caído.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.GHL_OUTBOX_LOCK_TIMEOUT)
+    pending = OutboundSync.objects.filter(status=OutboundSync.STATUS_PENDING, available_at__lte=now)
+    abandoned = OutboundSync.objects.filter(status=OutboundSync.STATUS_PROCESSING, locked_at__lt=stale)
+    candidates = _pending_by_location(pending, limit)
+    candidates += list(abandoned.order_by("pk").values_list("pk", "ghl_id")[:limit])
+
+    # Los cambios sobre una misma cita se aplican en orden: solo se toma el más
+    # antiguo sin terminar de cada ghl_id.
+    ghl_ids = {ghl_id for _, ghl_id in candidates if ghl_id}
+    first_per_id = dict(
+        OutboundSync.objects.filter(
+            ghl_id__in=ghl_ids, status__in=[OutboundSync.STATUS_PENDING, OutboundSync.STATUS_PROCESSING]
+        )
+        .values("ghl_id")
+        .annotate(first=Min("pk"))
+        .values_list("ghl_id", "first")
+    )
+
+    claimed = []
+    for pk, ghl_id in candidates[:limit]:
+        if ghl_id and first_per_id.get(ghl_id) != pk:
+            continue
+        claimable = (pending | abandoned).filter(pk=pk)
+        if claimable.update(status=OutboundSync.STATUS_PROCESSING, locked_at=now):
+            claimed.append(pk)
+    return claimed
+
+
+def _execute(item):
+    """Ejecuta la operación contra GHL. Devuelve (body, status_code)."""
+    if item.operation == OutboundSync.OP_CREATE:
+        appointment = services.create_appointment(item.payload, item.location_id)
+        item.ghl_id = appointment.ghl_id
+        return AppointmentSerializer(appointment).data, 201
+
+    if item.operation == OutboundSync.OP_UPDATE:
+        appointment = Appointment.objects.filter(ghl_id=item.ghl_id).first()
+        if not appointment:
+            raise LookupError("Cita no encontrada en la base de datos local")
+        return services.update_appointment(appointment, item.payload, item.location_id)
+
+    if item.operation == OutboundSync.OP_DELETE:
+        code = services.cancel_appointment(item.ghl_id, item.location_id)
+        return {"message": "Cita cancelada correctamente"}, code
+
+    raise ValueError(f"Operación desconocida: {item.operation}")
+
+
+def _retry_delay(attempts):
+    base = settings.GHL_OUTBOX_RETRY_BASE
+    return min(300, base * (2 ** (attempts - 1))) * random.uniform(0.5, 1.5)
+
+
+def process_item(pk):
+    """Procesa un elemento ya reservado y registra el resultado."""
+    item = OutboundSync.objects.get(pk=pk)
+    item.attempts += 1
+    is_create = item.operation == OutboundSync.OP_CREATE
+    retry = False
+    # El create pudo llegar a GHL (timeout de lectura, 5xx): repetirlo duplicaría la cita
+    uncertain = False
+    delay = None
+    try:
+        body, code = _execute(item)
+        item.status = OutboundSync.STATUS_DONE
+        item.result = body
+        item.result_status_code = code
+        item.last_error = None
+    except requests.exceptions.HTTPError as http_err:
+        resp = http_err.response
+        code = resp.status_code if resp is not None else 500
+        item.last_error = resp.text if resp is not None else str(http_err)
+        item.result_status_code = code
+        retry = code in (CREATE_RETRYABLE_STATUS if is_create else RETRYABLE_STATUS)
+        uncertain = is_create and not retry and code in RETRYABLE_STATUS
+    except GHLUnavailable as e:
+        # No llegó a GHL (circuito abierto / sin turno): no consume intento
+        item.attempts -= 1
+        item.last_error = str(e)
+        item.result_status_code = 503
+        retry = True
+        delay = e.retry_after
+    except requests.exceptions.ConnectTimeout as e:
+        # No se llegó a conectar: la petición no salió, se puede repetir cualquier operación
+        item.last_error = str(e)
+        item.result_status_code = 502
+        retry = True
+    except requests.exceptions.RequestException as e:
+        item.last_error = str(e)
+        item.result_status_code = 502
+        retry = not is_create
+        uncertain = is_create
+    except Exception as e:
+        item.last_error = str(e)
+        item.result_status_code = 500
+
+    if item.status != OutboundSync.STATUS_DONE:
+        if retry and item.attempts < settings.GHL_OUTBOX_MAX_ATTEMPTS:
+            item.status = OutboundSync.STATUS_PENDING
+            item.available_at = timezone.now() + timedelta(seconds=delay or _retry_delay(item.attempts))
+        elif uncertain:
+            item.status = OutboundSync.STATUS_NEEDS_RECONCILE
+        else:
+            item.status = OutboundSync.STATUS_FAILED
+    item.locked_at = None
+    item.save()
+    return item
+
+
+def _process_in_thread(pk):
+    try:
+        return process_item(pk)
+    finally:
+        # Cada hilo abre su propia conexión a la BD
+        connection.close()
+
+
+def run_worker(workers=4, batch_size=50, once=False, poll_interval=1.0, stdout=None):
+    """Bucle principal del worker: reserva lotes y los procesa en un pool de hilos."""
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            close_old_connections()
+            batch = claim_batch(batch_size)
+            if batch:
+                for item in pool.map(_process_in_thread, batch):
+                    processed += 1
+                    if stdout is not None:
+                        stdout.write(f"{item}\n")
+                continue
+            if once:
+                return processed
+            time.sleep(poll_interval)
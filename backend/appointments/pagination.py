@@ -0,0 +1,18 @@
+# appointments/pagination.py
+# Paginación por cursor (keyset) para los listados: cada página es un
+# WHERE sobre la columna de orden + LIMIT, sin OFFSET ni COUNT(*).
+from rest_framework.pagination import CursorPagination
+
+
+class AppointmentCursorPagination(CursorPagination):
+    ordering = ("-start_time", "-id")
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class ContactCursorPagination(CursorPagination):
+    ordering = ("-date_added", "-id")
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
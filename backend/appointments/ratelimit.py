@@ -0,0 +1,194 @@
+# appointments/ratelimit.py
+# Limitador token bucket para las llamadas salientes a GHL.
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: el limitador queda local a cada proceso
+    fcntl = None
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `rate` tokens por segundo con ráfagas de hasta
+    `capacity`. `acquire()` bloquea hasta que haya un token disponible.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = self.max_rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1.0):
+        """Toma un token si hay; si no, devuelve los segundos a esperar."""
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1.0, timeout=None):
+        """Espera un token. Devuelve False si se supera `timeout` (segundos)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def block(self, seconds):
+        """Pausa el bucket durante `seconds` (p. ej. el Retry-After de un 429)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def observe(self, remaining=None, limit=None, interval=None):
+        """Ajusta el bucket con los headers X-RateLimit-* de GHL."""
+        with self._lock:
+            if limit and interval:
+                self.rate = min(self.max_rate, limit / interval)
+            if remaining is not None:
+                self._tokens = min(self._tokens, float(remaining))
+                if remaining <= 0 and interval:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + interval)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket compartido entre procesos (workers de gunicorn, outbox,
+    sync_ghl) mediante un fichero de estado protegido con flock.
+
+    Además de los tokens guarda `blocked_until`: cuando GHL responde 429 con
+    Retry-After, todos los procesos esperan hasta esa hora. `observe()` ajusta
+    el ritmo con los headers X-RateLimit-* de cada respuesta.
+    """
+
+    def __init__(self, path, rate, capacity=None):
+        self.path = path
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _file(self):
+        # Un descriptor por proceso: flock no excluye a procesos que comparten
+        # el mismo descriptor heredado por fork.
+        pid = os.getpid()
+        if self._fd is None or self._pid != pid:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = pid
+        return self._fd
+
+    @contextlib.contextmanager
+    def _state(self):
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                raw = os.read(fd, 4096)
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                state.setdefault("tokens", self.capacity)
+                state.setdefault("updated", time.time())
+                state.setdefault("blocked_until", 0.0)
+                if state.get("max_rate") != self.rate:
+                    # Límite nuevo en la configuración: se parte de ese ritmo
+                    state["rate"] = state["max_rate"] = self.rate
+                yield state
+                data = json.dumps(state).encode()
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, data)
+                os.ftruncate(fd, len(data))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def try_acquire(self, tokens=1.0):
+        """Toma un token si hay; si no, devuelve los segundos a esperar."""
+        with self._state() as state:
+            now = time.time()
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            elapsed = max(0.0, now - state["updated"])
+            rate = state["rate"]
+            state["tokens"] = min(self.capacity, state["tokens"] + elapsed * rate)
+            state["updated"] = now
+            if state["tokens"] >= tokens:
+                state["tokens"] -= tokens
+                return 0.0
+            return (tokens - state["tokens"]) / rate
+
+    acquire = TokenBucket.acquire
+
+    def block(self, seconds):
+        """Pausa el bucket para todos los procesos durante `seconds`."""
+        with self._state() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+            state["tokens"] = 0.0
+
+    def observe(self, remaining=None, limit=None, interval=None):
+        """
+        Ajusta el bucket con lo que informa GHL: `limit` peticiones cada
+        `interval` segundos y `remaining` disponibles en la ventana actual.
+        """
+        with self._state() as state:
+            if limit and interval:
+                state["rate"] = min(self.rate, limit / interval)
+            if remaining is not None:
+                state["tokens"] = min(state["tokens"], float(remaining))
+                if remaining <= 0 and interval:
+                    state["blocked_until"] = max(state["blocked_until"], time.time() + interval)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key, rate, capacity=None, directory=None):
+    """
+    Bucket para una clave (API key + locationId). Con `directory` y flock
+    disponible se comparte entre procesos; si no, es local al proceso. Si
+    cambian `rate` o `capacity` (p. ej. al editar la Location) se crea de nuevo.
+    """
+    params = (float(rate), capacity, directory)
+    entry = _buckets.get(key)
+    if entry is None or entry[0] != params:
+        with _buckets_lock:
+            entry = _buckets.get(key)
+            if entry is None or entry[0] != params:
+                if directory and fcntl is not None:
+                    name = hashlib.sha256(key.encode()).hexdigest()[:24]
+                    bucket = SharedTokenBucket(os.path.join(directory, f"{name}.bucket"), rate, capacity)
+                else:
+                    bucket = TokenBucket(rate, capacity)
+                entry = _buckets[key] = (params, bucket)
+    return entry[1]
+
+
+def reset_buckets():
+    with _buckets_lock:
+        _buckets.clear()
@@ -0,0 +1,234 @@
+# appointments/reconcile.py
+# Reconciliación con GHL: descarga citas y contactos (páginas en paralelo),
+# los compara con la BD local por ghl_id + dateUpdated y aplica solo los
+# cambios con bulk upserts. El modo incremental parte de la marca de agua
+# guardada en SyncState: los contactos se piden con filtro por dateUpdated; las
+# citas, por una ventana fija de startTime (el endpoint de eventos no filtra
+# por dateUpdated) que cubre las ya empezadas cuyo estado cambia después
+# (showed, noshow, cancelación tardía), y la marca solo descarta las que no
+# cambiaron.
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import archive, caching, rollups, webhooks
+from .ghl_client import get_ghl_client
+from .models import Appointment, Contact, SyncState
+from .services import _to_datetime, link_contact_appointments, resolve_contact_refs
+
+CALENDARS_PATH = "/calendars/"
+EVENTS_PATH = "/calendars/events"
+CONTACTS_SEARCH_PATH = "/contacts/search"
+
+MODE_FULL = "full"
+MODE_INCREMENTAL = "incremental"
+
+# Margen sobre la marca de agua para no perder cambios con relojes desfasados
+HWM_OVERLAP = timedelta(minutes=5)
+# Ventana de startTime de las citas (hacia atrás) por modo
+RECONCILE_LOOKBACK = {MODE_INCREMENTAL: timedelta(days=30), MODE_FULL: timedelta(days=365)}
+DB_CHUNK = 500
+
+CONTACT_UPSERT_FIELDS = [
+    "location_id", "first_name", "last_name", "email", "phone", "source", "date_updated", "ghl_date_updated",
+    "email_normalized", "phone_normalized",
+]
+
+
+def _json(method, path, location_id, **kwargs):
+    resp = get_ghl_client(location_id).request(method, path, location_id, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _chunks(items, size=DB_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _epoch_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+# === Descarga desde GHL ===
+
+def fetch_calendar_ids(location_id):
+    data = _json("GET", CALENDARS_PATH, location_id, params={"locationId": location_id})
+    return [c["id"] for c in data.get("calendars", []) if c.get("id")]
+
+
+def fetch_appointments(location_id, since, until, window_days=7, workers=8):
+    """Eventos de todos los calendarios, pedidos por ventanas de tiempo en paralelo."""
+    windows = []
+    cursor = since
+    while cursor < until:
+        end = min(until, cursor + timedelta(days=window_days))
+        windows.append((_epoch_ms(cursor), _epoch_ms(end)))
+        cursor = end
+    tasks = [(calendar_id, start, end) for calendar_id in fetch_calendar_ids(location_id) for start, end in windows]
+
+    def fetch(task):
+        calendar_id, start, end = task
+        params = {"locationId": location_id, "calendarId": calendar_id, "startTime": start, "endTime": end}
+        return _json("GET", EVENTS_PATH, location_id, params=params).get("events", [])
+
+    events = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for page in pool.map(fetch, tasks):
+            for event in page:
+                if event.get("id"):
+                    events[event["id"]] = event
+    return list(events.values())
+
+
+def fetch_contacts(location_id, updated_since=None, page_size=100, workers=8):
+    """Contactos vía /contacts/search: la primera página da el total y el resto se pide en paralelo."""
+
+    def fetch(page):
+        body = {
+            "locationId": location_id,
+            "page": page,
+            "pageLimit": page_size,
+            "sort": [{"field": "dateUpdated", "direction": "asc"}],
+        }
+        if updated_since is not None:
+            body["filters"] = [{"field": "dateUpdated", "operator": "range", "value": {"gte": updated_since.isoformat()}}]
+        # Búsqueda de solo lectura: se puede reintentar aunque sea POST
+        return _json("POST", CONTACTS_SEARCH_PATH, location_id, json=body, idempotent=True)
+
+    first = fetch(1)
+    contacts = {c["id"]: c for c in first.get("contacts", []) if c.get("id")}
+    pages = math.ceil((first.get("total") or 0) / page_size)
+    if pages > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for data in pool.map(fetch, range(2, pages + 1)):
+                for contact in data.get("contacts", []):
+                    if contact.get("id"):
+                        contacts[contact["id"]] = contact
+    return list(contacts.values())
+
+
+# === Diferencias y aplicación ===
+
+def _is_newer(remote_version, stored_version):
+    return remote_version is None or stored_version is None or remote_version > stored_version
+
+
+def apply_appointments(events, min_version=None):
+    """Upsert de las citas nuevas o con dateUpdated posterior al guardado. Devuelve estadísticas."""
+    stats = {"fetched": len(events), "created": 0, "updated": 0, "unchanged": 0, "invalid": 0}
+    candidates = {}
+    for event in events:
+        parsed = webhooks.parse_event(event)
+        if parsed is None or any(parsed["defaults"][f] is None for f in webhooks.REQUIRED_FIELDS):
+            stats["invalid"] += 1
+            continue
+        if min_version is not None and parsed["version"] is not None and parsed["version"] <= min_version:
+            stats["unchanged"] += 1
+            continue
+        candidates[parsed["ghl_id"]] = parsed
+
+    for chunk in _chunks(list(candidates)):
+        stored = webhooks.stored_versions(chunk)
+        rows = []
+        for ghl_id in chunk:
+            parsed = candidates[ghl_id]
+            if ghl_id in stored and not _is_newer(parsed["version"], stored[ghl_id][0]):
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if ghl_id in stored else "created"] += 1
+            fields = {**parsed["defaults"], "ghl_date_updated": stored.get(ghl_id, (None, None))[0]}
+            fields.update(webhooks.version_fields(parsed))
+            rows.append(Appointment(ghl_id=ghl_id, **fields))
+        if rows:
+            ghl_ids = [row.ghl_id for row in rows]
+            with (transaction.atomic(), rollups.tracking(ghl_ids),
+                  caching.tracking(caching.APPOINTMENTS, ghl_ids)):
+                # Las citas archivadas con una versión nueva vuelven a Appointment
+                archive.restore([row.ghl_id for row in rows if row.ghl_id in stored])
+                Appointment.objects.bulk_create(
+                    rows, update_conflicts=True, unique_fields=["ghl_id"], update_fields=webhooks.UPSERT_FIELDS
+                )
+                resolve_contact_refs(ghl_ids)
+    return stats
+
+
+def apply_contacts(contacts, location_id, min_version=None):
+    """Upsert de los contactos nuevos o con dateUpdated posterior al guardado."""
+    stats = {"fetched": len(contacts), "created": 0, "updated": 0, "unchanged": 0, "invalid": 0}
+    by_id = {c["id"]: c for c in contacts if c.get("id")}
+    stats["invalid"] = len(contacts) - len(by_id)
+    now = timezone.now()
+
+    for chunk in _chunks(list(by_id)):
+        stored = dict(Contact.objects.filter(ghl_id__in=chunk).values_list("ghl_id", "ghl_date_updated"))
+        rows = []
+        for ghl_id in chunk:
+            data = by_id[ghl_id]
+            version = _to_datetime(data.get("dateUpdated"))
+            if min_version is not None and version is not None and version <= min_version:
+                stats["unchanged"] += 1
+                continue
+            if ghl_id in stored and not _is_newer(version, stored[ghl_id]):
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if ghl_id in stored else "created"] += 1
+            rows.append(Contact(
+                ghl_id=ghl_id,
+                location_id=data.get("locationId") or location_id,
+                first_name=data.get("firstName") or "Sin nombre",
+                last_name=data.get("lastName") or "Sin apellido",
+                email=data.get("email"),
+                phone=data.get("phone"),
+                source=data.get("source"),
+                # Explícito: el upsert reescribe date_updated (orden y ETag de los listados)
+                date_updated=now,
+                ghl_date_updated=version,
+            ).fill_lookup_keys())
+        if rows:
+            with transaction.atomic(), caching.tracking(caching.CONTACTS, [row.ghl_id for row in rows]):
+                Contact.objects.bulk_create(
+                    rows, update_conflicts=True, unique_fields=["ghl_id"], update_fields=CONTACT_UPSERT_FIELDS
+                )
+                link_contact_appointments([row.ghl_id for row in rows])
+    return stats
+
+
+def _max_version(items):
+    versions = [_to_datetime(item.get("dateUpdated")) for item in items]
+    versions = [v for v in versions if v is not None]
+    return max(versions) if versions else None
+
+
+def run(entity, location_id, mode=MODE_INCREMENTAL, since=None, until=None, window_days=7, workers=8):
+    """
+    Reconciliación de una entidad ("appointments" o "contacts") para una location.
+    En modo incremental solo se aplican cambios posteriores a la marca de agua.
+    """
+    state, _ = SyncState.objects.get_or_create(name=f"{entity}:{location_id}")
+    min_version = None
+    if mode == MODE_INCREMENTAL and state.high_water_mark is not None:
+        min_version = state.high_water_mark - HWM_OVERLAP
+
+    now = timezone.now()
+    if entity == "appointments":
+        since = since or now - RECONCILE_LOOKBACK[mode]
+        until = until or now + timedelta(days=365)
+        items = fetch_appointments(location_id, since, until, window_days=window_days, workers=workers)
+        stats = apply_appointments(items, min_version=min_version)
+    elif entity == "contacts":
+        items = fetch_contacts(location_id, updated_since=min_version, workers=workers)
+        stats = apply_contacts(items, location_id, min_version=min_version)
+    else:
+        raise ValueError(f"Entidad desconocida: {entity}")
+
+    seen = _max_version(items)
+    if seen is not None and (state.high_water_mark is None or seen > state.high_water_mark):
+        state.high_water_mark = seen
+    state.last_run_at = now
+    state.last_stats = dict(stats, mode=mode)
+    state.save()
+    return stats
@@ -0,0 +1,46 @@
+# appointments/renderers.py
+# JSON de los listados y detalles con orjson (si está instalado): produce los
+# mismos bytes que JSONRenderer de DRF en modo compacto (sin espacios, UTF-8
+# sin escapar, \u2028/\u2029 escapados), varias veces más rápido.
+from django.conf import settings
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa el JSONRenderer de DRF
+    orjson = None
+
+# Tipos que orjson escribiría distinto a DRF: se delegan a su JSONEncoder
+_PASSTHROUGH = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Solo para respuestas de texto, enteros, booleanos y None (los floats y
+    NaN se escriben distinto que con json.dumps); con indentación, ASCII o
+    datos que orjson no acepta se usa el render de DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (orjson is None or not settings.FAST_READ_PATH_ENABLED or data is None
+                or not self.compact or self.ensure_ascii or indent is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=_PASSTHROUGH)
+        except orjson.JSONEncodeError:
+            # Enteros de más de 64 bits, surrogates, etc.
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+# Renderers de DRF con FastJSONRenderer en lugar de JSONRenderer (se mantiene la API navegable)
+READ_RENDERER_CLASSES = [
+    FastJSONRenderer if renderer is JSONRenderer else renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+]
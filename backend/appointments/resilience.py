@@ -0,0 +1,118 @@
+# appointments/resilience.py
+# Circuit breaker, presupuesto de reintentos y backoff para las llamadas a GHL.
+import random
+import threading
+import time
+
+import requests
+
+
+class GHLUnavailable(requests.exceptions.ConnectionError):
+    """
+    GHL no se llamó: el circuito está abierto o no hubo token del limitador a
+    tiempo. Hereda de ConnectionError para que los `except RequestException`
+    existentes la traten como un fallo de conexión.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuito por proceso. Tras `failure_threshold` fallos seguidos (errores de
+    conexión, timeouts o 5xx) se abre y rechaza las llamadas durante
+    `reset_timeout` segundos; luego deja pasar una sola petición de prueba
+    (half-open) que lo cierra o lo vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lanza GHLUnavailable si el circuito no deja pasar la llamada."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise GHLUnavailable("Circuito abierto: GHL no disponible", retry_after=max(1.0, remaining))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """
+        Libera el turno de prueba sin resultado: la llamada no dice nada de GHL
+        (error propio antes o durante el envío). Sin esto el circuito quedaría
+        half-open rechazando todo para siempre.
+        """
+        with self._lock:
+            self._probing = False
+
+
+class RetryBudget:
+    """
+    Limita los reintentos a una fracción del tráfico: cada petición deposita
+    `ratio` y cada reintento gasta 1. Evita multiplicar la carga sobre GHL
+    justo cuando está degradado.
+    """
+
+    def __init__(self, ratio=0.2, min_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+def backoff_delay(attempt, base=0.5, cap=10.0):
+    """Backoff exponencial con jitter completo (attempt empieza en 1)."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def retry_after_seconds(resp):
+    """Segundos de Retry-After (solo el formato numérico), o None."""
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,220 @@
+# appointments/rollups.py
+# Resumen de citas por día para los dashboards: AppointmentRollup guarda
+# cuántas citas hay por (location, día de start_time, calendario, usuario
+# asignado, estado) y se actualiza en la misma transacción que cada escritura.
+#
+# Cada camino que escribe citas (vistas, webhooks, alta masiva,
+# reconciliación, outbox, admin) envuelve el cambio en `tracking(ghl_ids)`:
+# se leen las claves de esas citas antes y después del cambio y solo se
+# aplica la diferencia (un confirmed→cancelled resta de una fila y suma en
+# otra). `manage.py rebuild_rollups` recalcula el resumen desde cero.
+#
+# El resumen cuenta también las citas archivadas (ArchivedAppointment): mover
+# una cita al archivo o restaurarla no cambia su clave ni los totales.
+import contextlib
+from collections import Counter
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentRollup, ArchivedAppointment
+
+KEY_FIELDS = ("location_id", "day", "calendar_id", "assigned_user_id", "appointment_status")
+# Dimensiones por las que se puede agrupar (el día siempre se incluye)
+GROUP_FIELDS = ("location_id", "calendar_id", "assigned_user_id", "appointment_status")
+DEFAULT_GROUP_BY = ("calendar_id", "assigned_user_id", "appointment_status")
+
+
+def _key(location_id, start_time, calendar_id, assigned_user_id, status):
+    # Día en TIME_ZONE (igual que TruncDate en rebuild); sin usuario = "" (NULL no cuenta en el UNIQUE)
+    return (location_id, timezone.localtime(start_time).date(), calendar_id, assigned_user_id or "", status)
+
+
+def _keys_of(ghl_ids, lock=False):
+    keys = {}
+    for model in (Appointment, ArchivedAppointment):
+        queryset = model.objects.filter(ghl_id__in=[g for g in ghl_ids if g not in keys])
+        if lock:
+            queryset = queryset.select_for_update()
+        rows = queryset.values_list("ghl_id", "location_id", "start_time", "calendar_id", "assigned_user_id",
+                                    "appointment_status")
+        keys.update((ghl_id, _key(*fields)) for ghl_id, *fields in rows)
+        if len(keys) == len(ghl_ids):
+            break
+    return keys
+
+
+@contextlib.contextmanager
+def tracking(ghl_ids):
+    """
+    Aplica al resumen los cambios que el bloque hace sobre las citas `ghl_ids`
+    (altas, cambios de clave y borrados), dentro de la misma transacción.
+    """
+    ghl_ids = [g for g in ghl_ids if g]
+    if not settings.ROLLUPS_ENABLED or not ghl_ids:
+        yield
+        return
+    with transaction.atomic():
+        before = _keys_of(ghl_ids, lock=True)
+        yield
+        after = _keys_of(ghl_ids)
+        deltas = Counter()
+        for ghl_id in ghl_ids:
+            old, new = before.get(ghl_id), after.get(ghl_id)
+            if old != new:
+                if old is not None:
+                    deltas[old] -= 1
+                if new is not None:
+                    deltas[new] += 1
+        apply_deltas(deltas)
+
+
+def apply_deltas(deltas):
+    """Suma `deltas` ({clave: +-n}) a las filas del resumen, creando las que falten."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if not connection.features.has_select_for_update:
+        # SQLite: la transacción ya tiene el lock de escritura de toda la BD, nadie crea filas a la vez
+        return _apply(deltas)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _apply(deltas)
+            return
+        except IntegrityError:
+            # Otro proceso creó la misma fila a la vez: releer
+            if attempt:
+                raise
+
+
+def _apply(deltas):
+    # location + día: prefijo del índice UNIQUE (una escritura toca 1-2 filas; un lote, las de sus días)
+    existing = AppointmentRollup.objects.select_for_update().filter(
+        location_id__in={key[0] for key in deltas},
+        day__in={key[1] for key in deltas},
+        calendar_id__in={key[2] for key in deltas},
+    ).values_list("pk", *KEY_FIELDS)
+    found = set()
+    for pk, *key in existing:
+        delta = deltas.get(tuple(key))
+        if delta:
+            AppointmentRollup.objects.filter(pk=pk).update(count=F("count") + delta)
+            found.add(tuple(key))
+    missing = [AppointmentRollup(**dict(zip(KEY_FIELDS, key)), count=delta)
+               for key, delta in deltas.items() if key not in found]
+    if missing:
+        AppointmentRollup.objects.bulk_create(missing)
+
+
+def rebuild(since=None):
+    """
+    Recalcula el resumen con un GROUP BY sobre Appointment y ArchivedAppointment
+    (todo, o desde el día `since`). Devuelve el número de filas del resumen escritas.
+    """
+    rollups = AppointmentRollup.objects.all()
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    with transaction.atomic():
+        rollups.delete()
+        # Citas sin usuario (NULL) y con "" caen en la misma clave
+        counts = Counter()
+        for model in (Appointment, ArchivedAppointment):
+            appointments = model.objects.all()
+            if since is not None:
+                appointments = appointments.filter(start_time__gte=_day_start(since))
+            grouped = (
+                appointments.annotate(day=TruncDate("start_time"))
+                .values_list(*KEY_FIELDS)
+                .annotate(n=Count("id"))
+                .order_by()
+            )
+            for location_id, day, calendar_id, user_id, status, n in grouped.iterator(chunk_size=5000):
+                counts[location_id, day, calendar_id, user_id or "", status] += n
+        AppointmentRollup.objects.bulk_create(
+            [AppointmentRollup(**dict(zip(KEY_FIELDS, key)), count=n) for key, n in counts.items()], batch_size=5000
+        )
+    return len(counts)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# === Consultas del dashboard ===
+
+def _filters(params):
+    """Filtros exactos por las dimensiones (valen igual para el resumen y para Appointment)."""
+    return Q(**{field: params[field] for field in GROUP_FIELDS if params.get(field)})
+
+
+def _parse_day(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise ValueError(f"{name}: fecha inválida, usar YYYY-MM-DD") from None
+
+
+def parse_query(params):
+    """(start, end, group_by) de los query params; ValueError si algo es inválido."""
+    start, end = _parse_day(params, "start"), _parse_day(params, "end")
+    group_by = tuple(f for f in (params.get("group_by") or "").split(",") if f) or DEFAULT_GROUP_BY
+    unknown = set(group_by) - set(GROUP_FIELDS)
+    if unknown:
+        raise ValueError(f"group_by: campos no válidos {', '.join(sorted(unknown))} (usar {', '.join(GROUP_FIELDS)})")
+    return start, end, group_by
+
+
+def daily_counts(params, live=False):
+    """
+    Conteos por día (start <= día < end) agrupados por `group_by`. Con `live`
+    se calculan con un GROUP BY sobre Appointment y ArchivedAppointment en vez
+    del resumen.
+    """
+    start, end, group_by = parse_query(params)
+    filters = _filters(params)
+    if live:
+        rows = []
+        for model in (Appointment, ArchivedAppointment):
+            queryset = model.objects.filter(filters).annotate(day=TruncDate("start_time"))
+            if start:
+                queryset = queryset.filter(start_time__gte=_day_start(start))
+            if end:
+                queryset = queryset.filter(start_time__lt=_day_start(end))
+            rows.extend(queryset.values("day", *group_by).annotate(count=Count("id")).order_by())
+        return _merge_live(rows, group_by)
+    queryset = AppointmentRollup.objects.filter(filters, count__gt=0)
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lt=end)
+    results = []
+    for row in queryset.values("day", *group_by).annotate(count=Sum("count")).order_by("day", *group_by):
+        if "assigned_user_id" in row:
+            row["assigned_user_id"] = row["assigned_user_id"] or None
+        results.append(row)
+    return results
+
+
+def _merge_live(rows, group_by):
+    """
+    Suma los grupos de las dos tablas (y NULL con "": en el resumen son uno
+    solo, sin asignar) y los ordena como el resumen (sin asignar primero).
+    """
+    merged = {}
+    for row in rows:
+        if "assigned_user_id" in row:
+            row["assigned_user_id"] = row["assigned_user_id"] or None
+        key = (row["day"], *(row[f] for f in group_by))
+        if key in merged:
+            merged[key]["count"] += row["count"]
+        else:
+            merged[key] = row
+    return [merged[key] for key in sorted(merged, key=lambda key: [(v is not None, v) for v in key])]
@@ -0,0 +1,230 @@
+# appointments/search.py
+# Búsqueda de texto indexada sobre contactos (nombre, apellido, email) y citas
+# (título, notas), con prefijos: "ana gar" encuentra "Ana García".
+#
+# El índice depende del motor y lo mantiene la propia BD, así que ningún
+# camino de escritura (save, update(), bulk upserts, admin) lo puede saltar:
+#   - SQLite: tabla virtual FTS5 "external content" + triggers de
+#     INSERT/UPDATE/DELETE sobre la tabla original.
+#   - PostgreSQL: índice GIN sobre to_tsvector('simple', ...).
+#   - MySQL: índice FULLTEXT (MATCH ... AGAINST en modo booleano).
+# En otros motores (o SQLite sin FTS5) se cae a icontains.
+#
+# Emails y teléfonos no pasan por el índice de texto: se normalizan como en
+# la deduplicación y se buscan por igualdad en email_normalized / phone_normalized.
+import logging
+import re
+
+from django.db import OperationalError, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .dedup import normalize_email, normalize_phone
+from .models import Appointment, Contact
+
+logger = logging.getLogger(__name__)
+
+MAX_TERMS = 8
+_TERMS = re.compile(r"\w+")
+_PHONE_LIKE = re.compile(r"^\+?[\d\s().-]+$")
+
+
+class Spec:
+    """Columnas indexadas de un modelo y nombres de los objetos del índice."""
+
+    def __init__(self, model, columns, index_name):
+        self.model = model
+        self.columns = columns
+        self.index_name = index_name
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def fts_table(self):
+        return f"{self.table}_fts"
+
+
+CONTACTS = Spec(Contact, ("first_name", "last_name", "email"), "contact_search_idx")
+APPOINTMENTS = Spec(Appointment, ("title", "notes"), "appt_search_idx")
+SPECS = (CONTACTS, APPOINTMENTS)
+
+# (BD, tabla FTS) -> existe; se limpia al instalar/desinstalar
+_installed = {}
+
+
+def terms(query):
+    """Palabras de la búsqueda (en minúsculas, como máximo MAX_TERMS)."""
+    return _TERMS.findall(str(query).lower())[:MAX_TERMS]
+
+
+# === Instalación del índice (post_migrate y rebuild; la migración 0014 lleva su copia del DDL) ===
+
+def _sqlite_statements(spec):
+    table, fts = spec.table, spec.fts_table
+    cols = ", ".join(spec.columns)
+    new = ", ".join(f"new.{c}" for c in spec.columns)
+    old = ", ".join(f"old.{c}" for c in spec.columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        # Solo cuando cambian columnas indexadas (no en cada UPDATE de contact_ref o date_updated)
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def _pg_document(spec):
+    return " || ' ' || ".join(f"coalesce({c}, '')" for c in spec.columns)
+
+
+def _sqlite_triggers(cursor, spec):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [spec.table])
+    return {name for (name,) in cursor.fetchall()}
+
+
+def install(conn=None):
+    """
+    Crea el índice de texto de cada modelo si falta (idempotente). En SQLite
+    también recrea los triggers si una migración rehízo la tabla, y entonces
+    reconstruye el índice.
+    """
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        for spec in SPECS:
+            if conn.vendor == "sqlite":
+                expected = {f"{spec.fts_table}_{suffix}" for suffix in ("ai", "ad", "au")}
+                if expected <= _sqlite_triggers(cursor, spec):
+                    continue
+                try:
+                    for sql in _sqlite_statements(spec):
+                        cursor.execute(sql)
+                except OperationalError as e:
+                    # SQLite compilado sin FTS5: la búsqueda usa icontains
+                    logger.warning("no se pudo crear el índice FTS5", extra={"table": spec.table, "error": str(e)})
+                    return
+                cursor.execute(f"INSERT INTO {spec.fts_table}({spec.fts_table}) VALUES ('rebuild')")
+            elif conn.vendor == "postgresql":
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {spec.index_name} ON {spec.table} "
+                    f"USING GIN (to_tsvector('simple', {_pg_document(spec)}))"
+                )
+            elif conn.vendor == "mysql":
+                cursor.execute(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                    [spec.table, spec.index_name],
+                )
+                if cursor.fetchone() is None:
+                    cursor.execute(f"ALTER TABLE {spec.table} ADD FULLTEXT INDEX {spec.index_name} "
+                                   f"({', '.join(spec.columns)})")
+    _installed.clear()
+
+
+def uninstall(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        for spec in SPECS:
+            if conn.vendor == "sqlite":
+                for suffix in ("ai", "ad", "au"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {spec.fts_table}_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {spec.fts_table}")
+            elif conn.vendor == "postgresql":
+                cursor.execute(f"DROP INDEX IF EXISTS {spec.index_name}")
+            elif conn.vendor == "mysql":
+                cursor.execute(f"ALTER TABLE {spec.table} DROP INDEX {spec.index_name}")
+    _installed.clear()
+
+
+def rebuild():
+    """Reconstruye el índice FTS5 desde las tablas (solo SQLite; en otros motores es un índice normal)."""
+    if connection.vendor != "sqlite":
+        return False
+    install()
+    with connection.cursor() as cursor:
+        for spec in SPECS:
+            cursor.execute(f"INSERT INTO {spec.fts_table}({spec.fts_table}) VALUES ('rebuild')")
+    return True
+
+
+def on_post_migrate(sender, using="default", **kwargs):
+    """
+    En SQLite, las migraciones que rehacen una tabla (copia + rename) pierden
+    sus triggers: si el índice ya está instalado, se recrean y se reconstruye.
+    """
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return
+    tables = conn.introspection.table_names()
+    if all(spec.fts_table in tables for spec in SPECS):
+        install(conn)
+
+
+# === Consultas ===
+
+def _has_index(spec):
+    """¿Hay índice de texto utilizable para `spec` en la conexión actual?"""
+    if connection.vendor in ("postgresql", "mysql"):
+        return True
+    if connection.vendor != "sqlite":
+        return False
+    key = (connection.settings_dict["NAME"], spec.fts_table)
+    if key not in _installed:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [spec.fts_table])
+            _installed[key] = cursor.fetchone() is not None
+    return _installed[key]
+
+
+def _match_sql(spec, words):
+    """(sql, params) de una subconsulta con los id que contienen todas las palabras (como prefijo)."""
+    if connection.vendor == "sqlite":
+        expression = " AND ".join(f'"{word}"*' for word in words)
+        return f"SELECT rowid FROM {spec.fts_table} WHERE {spec.fts_table} MATCH %s", [expression]
+    if connection.vendor == "postgresql":
+        expression = " & ".join(f"{word}:*" for word in words)
+        return (f"SELECT id FROM {spec.table} WHERE to_tsvector('simple', {_pg_document(spec)}) "
+                f"@@ to_tsquery('simple', %s)"), [expression]
+    expression = " ".join(f"+{word}*" for word in words)
+    return (f"SELECT id FROM {spec.table} WHERE MATCH ({', '.join(spec.columns)}) "
+            f"AGAINST (%s IN BOOLEAN MODE)"), [expression]
+
+
+def text_filter(spec, query):
+    """Q con las filas de `spec` que contienen todas las palabras de `query` (como prefijo)."""
+    words = terms(query)
+    if not words:
+        return Q(pk__in=[])
+    if _has_index(spec):
+        sql, params = _match_sql(spec, words)
+        return Q(pk__in=RawSQL(sql, params))
+    condition = Q()
+    for word in words:
+        condition &= Q(*(Q(**{f"{column}__icontains": word}) for column in spec.columns), _connector=Q.OR)
+    return condition
+
+
+def search_contacts(queryset, query):
+    """
+    Un email o un teléfono se buscan normalizados (igualdad); cualquier otro
+    texto, en nombre/apellido/email por prefijo. También coincide el ghl_id exacto.
+    """
+    query = str(query).strip()
+    condition = Q(ghl_id=query)
+    if "@" in query:
+        condition |= Q(email_normalized=normalize_email(query))
+    elif _PHONE_LIKE.match(query) and normalize_phone(query):
+        condition |= Q(phone_normalized=normalize_phone(query))
+    else:
+        condition |= text_filter(CONTACTS, query)
+    return queryset.filter(condition)
+
+
+def search_appointments(queryset, query):
+    """Título y notas por prefijo; también el ghl_id o el contact_id exactos."""
+    query = str(query).strip()
+    return queryset.filter(Q(ghl_id=query) | Q(contact_id=query) | text_filter(APPOINTMENTS, query))
@@ -1,12 +1,38 @@
 from rest_framework import serializers
-from .models import Appointment, Contact
+from .models import Appointment, ArchivedAppointment, Contact, OutboundSync
 
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
-        fields = '__all__'
+        # Columnas internas: claves de deduplicación y versión de GHL
+        exclude = ['email_normalized', 'phone_normalized', 'ghl_date_updated']
 
 class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
+        # contact_ref va en ?expand=contact; el resto ordena los webhooks
+        exclude = ['contact_ref', 'ghl_date_updated', 'last_event_fingerprint']
+
+
+class ArchivedAppointmentSerializer(serializers.ModelSerializer):
+    """Cita archivada: los mismos campos que AppointmentSerializer más archived_at."""
+    class Meta:
+        model = ArchivedAppointment
+        exclude = ['ghl_date_updated', 'last_event_fingerprint']
+
+
+class ContactSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Contact
+        fields = ['ghl_id', 'first_name', 'last_name', 'email', 'phone']
+
+
+class AppointmentWithContactSerializer(AppointmentSerializer):
+    """Cita con los datos de su contacto embebidos (usar con select_related('contact_ref'))."""
+    contact = ContactSummarySerializer(source='contact_ref', read_only=True)
+
+
+class OutboundSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboundSync
         fields = '__all__'
@@ -0,0 +1,240 @@
+# appointments/services.py
+# Operaciones de citas contra GHL + sincronización de la BD local.
+# Las usan tanto las vistas (modo síncrono) como el worker del outbox.
+import logging
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from asgiref.sync import sync_to_async
+
+from . import availability, caching, rollups
+from .ghl_async import get_async_ghl_client
+from .ghl_client import get_ghl_client
+from .logs import Redacted, response_payload
+from .models import Appointment, ArchivedAppointment, Contact
+
+payload_logger = logging.getLogger("appointments.payload")
+
+APPOINTMENTS_PATH = "/calendars/events/appointments"
+
+
+def _to_datetime(iso_str):
+    """Convierte ISO8601 string a datetime aware o devuelve None."""
+    if not iso_str:
+        return None
+    dt = parse_datetime(iso_str)
+    if dt is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(dt):
+        tz = timezone.get_current_timezone()
+        dt = timezone.make_aware(dt, tz)
+    return dt
+
+
+def resolve_contact_refs(appointment_ghl_ids):
+    """
+    Sincroniza Appointment.contact_ref con contact_id para las citas indicadas:
+    lo enlaza si el contacto existe localmente y lo limpia si contact_id cambió.
+    """
+    appointments = Appointment.objects.filter(ghl_id__in=appointment_ghl_ids)
+    appointments.filter(contact_id__in=Contact.objects.values("ghl_id")).exclude(contact_ref_id=F("contact_id")).update(
+        contact_ref_id=F("contact_id")
+    )
+    appointments.filter(contact_ref__isnull=False).exclude(contact_ref_id=F("contact_id")).update(contact_ref=None)
+
+
+def link_contact_appointments(contact_ghl_ids):
+    """Enlaza las citas que ya apuntaban (por contact_id) a contactos recién guardados."""
+    Appointment.objects.filter(contact_id__in=contact_ghl_ids, contact_ref__isnull=True).update(
+        contact_ref_id=F("contact_id")
+    )
+
+
+def push_appointment(api_payload, location_id):
+    """Crea la cita en GHL (sin tocar la BD local). Devuelve el JSON de GHL."""
+    resp = get_ghl_client(location_id).post(APPOINTMENTS_PATH, location_id, json=api_payload)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def appointment_defaults(ghl_data, api_payload, location_id):
+    """Valores locales de la cita a partir de la respuesta de GHL (con fallback al payload enviado)."""
+    return {
+        "location_id": ghl_data.get("locationId") or location_id,
+        "calendar_id": ghl_data.get("calendarId") or api_payload["calendarId"],
+        "contact_id": ghl_data.get("contactId") or api_payload["contactId"],
+        "title": ghl_data.get("title") or api_payload.get("title", "Cita"),
+        "appointment_status": ghl_data.get("appointmentStatus") or api_payload.get("appointmentStatus", "confirmed"),
+        "assigned_user_id": ghl_data.get("assignedUserId") or api_payload.get("assignedUserId"),
+        "notes": ghl_data.get("notes") or None,
+        "start_time": _to_datetime(ghl_data.get("startTime") or api_payload["startTime"]),
+        "end_time": _to_datetime(ghl_data.get("endTime") or api_payload["endTime"]),
+        "source": ghl_data.get("source"),
+    }
+
+
+def create_appointment(api_payload, location_id):
+    """Crea la cita en GHL y la guarda (o actualiza) en la BD local."""
+    ghl_data = push_appointment(api_payload, location_id)
+    return save_created(ghl_data, api_payload, location_id)
+
+
+def save_created(ghl_data, api_payload, location_id):
+    """Guarda (o actualiza) localmente la cita que GHL acaba de crear (post_save la lleva al índice de horarios)."""
+    ghl_ids = [ghl_data.get("id")]
+    with rollups.tracking(ghl_ids), caching.tracking(caching.APPOINTMENTS, ghl_ids):
+        appointment, created = Appointment.objects.update_or_create(
+            ghl_id=ghl_data.get("id"),
+            defaults=appointment_defaults(ghl_data, api_payload, location_id),
+        )
+    resolve_contact_refs([appointment.ghl_id])
+    return appointment
+
+
+def save_update(appointment, update_data):
+    """Aplica en la BD local los campos que cambió el PUT a GHL."""
+    with rollups.tracking([appointment.ghl_id]):
+        Appointment.objects.filter(ghl_id=appointment.ghl_id).update(date_updated=timezone.now(), **update_data)
+    caching.invalidate_appointments([appointment.ghl_id], [appointment.location_id])
+    availability.appointments_changed([appointment.ghl_id])
+
+
+def save_cancel(appointment_id):
+    """Marca la cita como cancelada en la BD local (o en el archivo, si está archivada)."""
+    with rollups.tracking([appointment_id]):
+        fields = {"appointment_status": "cancelled", "date_updated": timezone.now()}
+        if not Appointment.objects.filter(ghl_id=appointment_id).update(**fields):
+            ArchivedAppointment.objects.filter(ghl_id=appointment_id).update(**fields)
+    caching.invalidate_appointments([appointment_id])
+    availability.appointments_changed([appointment_id])
+
+
+def update_appointment(appointment, ghl_payload, location_id):
+    """
+    Envía el PUT a GHL y sincroniza la BD local.
+    Devuelve (body, status_code) para responder al cliente.
+    """
+    client = get_ghl_client(location_id)
+    path = f"{APPOINTMENTS_PATH}/{appointment.ghl_id}"
+
+    payload_logger.debug("PUT a GHL", extra={"path": path, "payload": Redacted(ghl_payload)})
+    resp = client.put(path, location_id, json=ghl_payload)
+    payload_logger.debug("respuesta GHL", extra={"path": path, "status": resp.status_code,
+                                                 "payload": response_payload(resp)})
+    resp.raise_for_status()
+
+    response_has_body, data = _put_body(resp)
+    merged, update_data = _merge_update(appointment, ghl_payload, data)
+
+    if update_data:
+        save_update(appointment, update_data)
+
+    # Devolver lo mejor posible: si no hay body, devolver merged y 200
+    if response_has_body:
+        return data, resp.status_code
+    return merged, 200
+
+
+def _put_body(resp):
+    """(hay cuerpo, JSON del cuerpo o {}). Algunas respuestas PUT de GHL pueden devolver 204 o cuerpo vacío."""
+    if not (resp.content and resp.content.strip()):
+        return False, {}
+    try:
+        return True, resp.json()
+    except ValueError:
+        # Cuerpo no JSON; usar payload enviado como fuente de verdad
+        return True, {}
+
+
+def _merge_update(appointment, ghl_payload, data):
+    """Combina la respuesta del PUT con lo enviado. Devuelve (valores combinados, campos a actualizar en la BD local)."""
+    # Fallback a los valores enviados si el body viene vacío
+    merged = {
+        "title": data.get("title", ghl_payload.get("title", appointment.title)),
+        "appointmentStatus": data.get(
+            "appointmentStatus", ghl_payload.get("appointmentStatus", appointment.appointment_status)
+        ),
+        "assignedUserId": data.get("assignedUserId", ghl_payload.get("assignedUserId", appointment.assigned_user_id)),
+        "notes": data.get("notes", ghl_payload.get("notes", appointment.notes)),
+        "startTime": data.get("startTime", ghl_payload.get("startTime")),
+        "endTime": data.get("endTime", ghl_payload.get("endTime")),
+    }
+
+    start_dt = _to_datetime(merged.get("startTime"))
+    end_dt = _to_datetime(merged.get("endTime"))
+
+    # Solo actualizar campos que no sean None para evitar errores de constraint
+    update_data = {}
+    if merged.get("title") is not None:
+        update_data["title"] = merged.get("title")
+    if merged.get("appointmentStatus") is not None:
+        update_data["appointment_status"] = merged.get("appointmentStatus")
+    if merged.get("assignedUserId") is not None:
+        update_data["assigned_user_id"] = merged.get("assignedUserId")
+    if merged.get("notes") is not None:
+        update_data["notes"] = merged.get("notes")
+    if start_dt is not None:
+        update_data["start_time"] = start_dt
+    if end_dt is not None:
+        update_data["end_time"] = end_dt
+    return merged, update_data
+
+
+def cancel_appointment(appointment_id, location_id):
+    """Cancela la cita en GHL (PUT appointmentStatus=cancelled) y en la BD local."""
+    path = f"{APPOINTMENTS_PATH}/{appointment_id}"
+    resp = get_ghl_client(location_id).put(path, location_id, json={"appointmentStatus": "cancelled"})
+    payload_logger.debug("respuesta GHL", extra={"path": path, "status": resp.status_code,
+                                                 "payload": response_payload(resp)})
+    resp.raise_for_status()
+    save_cancel(appointment_id)
+    return resp.status_code
+
+
+# === Variantes async (vistas ASGI): GHL con httpx y BD con el ORM async ===
+# Las escrituras locales (save_*) van enteras en un hilo con sync_to_async y no
+# con aupdate()/aupdate_or_create(): actualizan el resumen de citas dentro de
+# la misma transacción (rollups.tracking, con select_for_update) y Django no
+# tiene transacciones async. Un salto de hilo por escritura, sin bloquear el loop.
+
+async def acreate_appointment(api_payload, location_id):
+    """Como create_appointment, sin bloquear el event loop mientras responde GHL."""
+    client = await get_async_ghl_client(location_id)
+    resp = await client.post(APPOINTMENTS_PATH, location_id, json=api_payload)
+    resp.raise_for_status()
+    ghl_data = resp.json()
+    return await sync_to_async(save_created)(ghl_data, api_payload, location_id)
+
+
+async def aupdate_appointment(appointment, ghl_payload, location_id):
+    """Como update_appointment. Devuelve (body, status_code)."""
+    path = f"{APPOINTMENTS_PATH}/{appointment.ghl_id}"
+    payload_logger.debug("PUT a GHL", extra={"path": path, "payload": Redacted(ghl_payload)})
+    client = await get_async_ghl_client(location_id)
+    resp = await client.put(path, location_id, json=ghl_payload)
+    payload_logger.debug("respuesta GHL", extra={"path": path, "status": resp.status_code,
+                                                 "payload": response_payload(resp)})
+    resp.raise_for_status()
+
+    response_has_body, data = _put_body(resp)
+    merged, update_data = _merge_update(appointment, ghl_payload, data)
+    if update_data:
+        await sync_to_async(save_update)(appointment, update_data)
+    if response_has_body:
+        return data, resp.status_code
+    return merged, 200
+
+
+async def acancel_appointment(appointment_id, location_id):
+    """Como cancel_appointment."""
+    path = f"{APPOINTMENTS_PATH}/{appointment_id}"
+    client = await get_async_ghl_client(location_id)
+    resp = await client.put(path, location_id, json={"appointmentStatus": "cancelled"})
+    payload_logger.debug("respuesta GHL", extra={"path": path, "status": resp.status_code,
+                                                 "payload": response_payload(resp)})
+    resp.raise_for_status()
+    await sync_to_async(save_cancel)(appointment_id)
+    return resp.status_code
@@ -0,0 +1,137 @@
+# appointments/tenancy.py
+# Varias sub-cuentas de GHL (locations) en un mismo servicio.
+#
+# Credenciales: cada location registrada (modelo Location) tiene su token,
+# versión de API y límites (peticiones/s, llamadas simultáneas, tamaño del
+# pool HTTP). Las no registradas usan GHL_API_KEY y los límites globales,
+# salvo con GHL_LOCATION_REGISTRY_STRICT. Se cachean por proceso durante
+# GHL_LOCATION_CACHE_TTL segundos (un cambio en el admin limpia la caché del
+# proceso que lo guarda; los demás lo ven al expirar).
+#
+# Lecturas: los listados, búsquedas, exportaciones y estadísticas se limitan
+# a una location (?location_id=, cabecera X-Location-Id o GHL_LOCATION_ID),
+# así usan los índices que empiezan por location_id.
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import ValidationError
+
+from .models import Location
+
+Credentials = namedtuple(
+    "Credentials",
+    "location_id api_key api_version rate_limit max_concurrency pool_size default_assigned_user_id",
+)
+
+# location_id -> (expira, Credentials o None)
+_cache = {}
+_lock = threading.Lock()
+
+
+def _load(location_id):
+    location = Location.objects.filter(location_id=location_id).first() if location_id else None
+    if location is not None:
+        if not location.is_active:
+            return None
+        return Credentials(
+            location_id=location.location_id,
+            api_key=location.api_key,
+            api_version=location.api_version or settings.GHL_API_VERSION,
+            rate_limit=(location.rate_limit_per_second if location.rate_limit_per_second is not None
+                        else settings.GHL_RATE_LIMIT_PER_SECOND),
+            max_concurrency=location.max_concurrency or settings.GHL_LOCATION_MAX_CONCURRENCY,
+            pool_size=location.pool_size or settings.GHL_HTTP_POOL_SIZE,
+            default_assigned_user_id=location.default_assigned_user_id or settings.GHL_ASSIGNED_USER_ID,
+        )
+    if not settings.GHL_API_KEY or (location_id and settings.GHL_LOCATION_REGISTRY_STRICT):
+        return None
+    return Credentials(
+        location_id=location_id or "",
+        api_key=settings.GHL_API_KEY,
+        api_version=settings.GHL_API_VERSION,
+        rate_limit=settings.GHL_RATE_LIMIT_PER_SECOND,
+        max_concurrency=settings.GHL_LOCATION_MAX_CONCURRENCY,
+        pool_size=settings.GHL_HTTP_POOL_SIZE,
+        default_assigned_user_id=settings.GHL_ASSIGNED_USER_ID,
+    )
+
+
+def _cached(location_id):
+    """(encontrado, credenciales) desde la caché del proceso."""
+    entry = _cache.get(location_id or "")
+    if entry is None or entry[0] < time.monotonic():
+        return False, None
+    return True, entry[1]
+
+
+def _store(location_id, credentials):
+    with _lock:
+        _cache[location_id or ""] = (time.monotonic() + settings.GHL_LOCATION_CACHE_TTL, credentials)
+    return credentials
+
+
+def credentials_for(location_id):
+    """Credenciales y límites de la location, o None si no hay con qué llamar a GHL."""
+    found, credentials = _cached(location_id)
+    if found:
+        return credentials
+    return _store(location_id, _load(location_id))
+
+
+async def acredentials_for(location_id):
+    """Como credentials_for, sin consultar la BD desde el event loop."""
+    found, credentials = _cached(location_id)
+    if found:
+        return credentials
+    return _store(location_id, await sync_to_async(_load)(location_id))
+
+
+def forget(location_id=None):
+    """Olvida las credenciales cacheadas de una location (o de todas)."""
+    with _lock:
+        if location_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(location_id, None)
+
+
+def on_location_change(sender, instance, **kwargs):
+    forget(instance.location_id)
+
+
+def missing_credentials_error(location_id):
+    """Cuerpo de error (500) cuando una location no tiene credenciales utilizables."""
+    # Con GHL_API_KEY solo falla una location inactiva o no registrada en modo estricto
+    if location_id and (settings.GHL_LOCATION_REGISTRY_STRICT or settings.GHL_API_KEY):
+        return {"error": "Location sin credenciales de GHL", "details": f"{location_id} no está registrada o está inactiva"}
+    return {"error": "Falta GHL_API_KEY en servidor"}
+
+
+# === Alcance de las lecturas ===
+
+def read_location(request):
+    """
+    location_id al que se limita una lectura: ?location_id=, cabecera
+    X-Location-Id o, con READS_REQUIRE_LOCATION, GHL_LOCATION_ID. Sin ninguno
+    (y READS_REQUIRE_LOCATION) lanza ValidationError; sin exigirlo devuelve None.
+    """
+    params = getattr(request, "query_params", request.GET)
+    location_id = params.get("location_id") or request.headers.get("X-Location-Id")
+    if location_id or not settings.READS_REQUIRE_LOCATION:
+        return location_id or None
+    if settings.GHL_LOCATION_ID:
+        return settings.GHL_LOCATION_ID
+    raise ValidationError({"location_id": "Parámetro requerido (o cabecera X-Location-Id)"})
+
+
+def scoped_params(request):
+    """Query params de la petición con location_id fijado al alcance de la lectura."""
+    params = getattr(request, "query_params", request.GET).copy()
+    location_id = read_location(request)
+    if location_id:
+        params["location_id"] = location_id
+    return params
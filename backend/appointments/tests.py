@@ -1,3 +1,949 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import serializers
+
+from benchmarks.stub_ghl import StubGHLHandler, StubGHLServer
+
+from . import (
+    archive,
+    availability,
+    dedup,
+    fastread,
+    ghl_client,
+    idempotency,
+    outbox,
+    reconcile,
+    rollups,
+    search,
+    tenancy,
+    webhooks,
+)
+from .models import (
+    Appointment,
+    AppointmentRollup,
+    ArchivedAppointment,
+    Contact,
+    IdempotencyKey,
+    Location,
+    OutboundSync,
+    SyncState,
+    WebhookEvent,
+)
+from .ratelimit import SharedTokenBucket, TokenBucket, fcntl, reset_buckets
+from .resilience import CircuitBreaker, GHLUnavailable, RetryBudget
+
+APPOINTMENT_PAYLOAD = {
+    "calendarId": "cal-1",
+    "contactId": "contact-1",
+    "title": "Consulta",
+    "startTime": "2030-01-07T15:00:00Z",
+    "endTime": "2030-01-07T15:30:00Z",
+}
+
+
+class FlakyGHLHandler(StubGHLHandler):
+    """GHL falso que responde `server.fail_with` a las próximas `server.failures` peticiones."""
+
+    def _handle(self):
+        if self.server.failures:
+            self.server.failures -= 1
+            self.server.requests_seen += 1
+            self._read_json()
+            return self._send(self.server.fail_with, {"message": "falla simulada"}, {"Retry-After": "0"})
+        return super()._handle()
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class StubGHLTestCase(TestCase):
+    """Tests contra un GHL falso local (benchmarks/stub_ghl.py), sin limitador ni reintentos del cliente."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ghl = StubGHLServer(handler=FlakyGHLHandler).start()
+        cls.ghl.failures, cls.ghl.fail_with = 0, 500
+        cls._settings = override_settings(
+            GHL_BASE_URL=cls.ghl.base_url,
+            GHL_API_KEY="test-key",
+            GHL_LOCATION_ID="loc-1",
+            GHL_ASSIGNED_USER_ID="user-1",
+            GHL_RATE_LIMIT_PER_SECOND=0,
+            GHL_MAX_RETRIES=0,
+            READ_CACHE_ENABLED=False,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        cls.ghl.stop()
+
+    def setUp(self):
+        # Clientes y credenciales con los settings de este test
+        tenancy.forget()
+        ghl_client.reset_ghl_client()
+        self.ghl.failures = 0
+        self.ghl.requests_seen = 0
+
+    def fail_next(self, status_code, count=1):
+        self.ghl.fail_with, self.ghl.failures = status_code, count
+
+
+class OutboxTests(StubGHLTestCase):
+    def process_next(self):
+        claimed = outbox.claim_batch(10)
+        self.assertEqual(len(claimed), 1)
+        return outbox.process_item(claimed[0])
+
+    def test_create_is_sent_and_saved_locally(self):
+        item = outbox.enqueue(OutboundSync.OP_CREATE, "loc-1", dict(APPOINTMENT_PAYLOAD))
+
+        item = self.process_next()
+
+        self.assertEqual(item.status, OutboundSync.STATUS_DONE)
+        self.assertEqual(item.result_status_code, 201)
+        appointment = Appointment.objects.get(ghl_id=item.ghl_id)
+        self.assertEqual(appointment.calendar_id, "cal-1")
+        self.assertEqual(item.result["ghl_id"], appointment.ghl_id)
+
+    def test_create_is_retried_after_429(self):
+        outbox.enqueue(OutboundSync.OP_CREATE, "loc-1", dict(APPOINTMENT_PAYLOAD))
+        self.fail_next(429)
+
+        item = self.process_next()
+
+        self.assertEqual(item.status, OutboundSync.STATUS_PENDING)
+        self.assertEqual(item.attempts, 1)
+        self.assertGreater(item.available_at, timezone.now())
+        self.assertFalse(Appointment.objects.exists())
+
+        OutboundSync.objects.filter(pk=item.pk).update(available_at=timezone.now())
+        item = self.process_next()
+
+        self.assertEqual(item.status, OutboundSync.STATUS_DONE)
+        self.assertEqual(self.ghl.requests_seen, 2)
+        self.assertTrue(Appointment.objects.filter(ghl_id=item.ghl_id).exists())
+
+    def test_create_is_not_retried_after_5xx(self):
+        outbox.enqueue(OutboundSync.OP_CREATE, "loc-1", dict(APPOINTMENT_PAYLOAD))
+        self.fail_next(502)
+
+        item = self.process_next()
+
+        # GHL pudo haber creado la cita: no se repite el POST
+        self.assertEqual(item.status, OutboundSync.STATUS_NEEDS_RECONCILE)
+        self.assertEqual(self.ghl.requests_seen, 1)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_cancel_is_retried_after_5xx(self):
+        outbox.enqueue(OutboundSync.OP_DELETE, "loc-1", {"appointmentStatus": "cancelled"}, ghl_id="appt-1")
+        self.fail_next(503)
+
+        item = self.process_next()
+
+        self.assertEqual(item.status, OutboundSync.STATUS_PENDING)
+
+    def test_abandoned_item_is_reclaimed(self):
+        stale = timezone.now() - timedelta(seconds=settings.GHL_OUTBOX_LOCK_TIMEOUT + 1)
+        abandoned = outbox.enqueue(OutboundSync.OP_CREATE, "loc-1", dict(APPOINTMENT_PAYLOAD))
+        in_progress = outbox.enqueue(OutboundSync.OP_CREATE, "loc-1", dict(APPOINTMENT_PAYLOAD))
+        OutboundSync.objects.filter(pk=abandoned.pk).update(status=OutboundSync.STATUS_PROCESSING, locked_at=stale)
+        OutboundSync.objects.filter(pk=in_progress.pk).update(
+            status=OutboundSync.STATUS_PROCESSING, locked_at=timezone.now()
+        )
+
+        self.assertEqual(outbox.claim_batch(10), [abandoned.pk])
+        item = outbox.process_item(abandoned.pk)
+
+        self.assertEqual(item.status, OutboundSync.STATUS_DONE)
+        self.assertIsNone(item.locked_at)
+
+
+class GHLClientResilienceTests(StubGHLTestCase):
+    def client_with(self, **options):
+        client = ghl_client.GHLClient("test-key", "2021-07-28", self.ghl.base_url, backoff_base=0, **options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_429_is_retried_even_for_post(self):
+        self.fail_next(429)
+
+        resp = self.client_with(max_retries=2).post("/contacts/", "loc-1", json={"firstName": "Ana"})
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self.ghl.requests_seen, 2)
+
+    def test_5xx_is_retried_only_for_idempotent_methods(self):
+        client = self.client_with(max_retries=2)
+        self.fail_next(502)
+        self.assertEqual(client.post("/contacts/", "loc-1", json={}).status_code, 502)
+        self.assertEqual(self.ghl.requests_seen, 1)
+
+        self.fail_next(502)
+        self.assertEqual(client.put("/contacts/c1", "loc-1", json={}).status_code, 201)
+        self.assertEqual(self.ghl.requests_seen, 3)
+
+    def test_breaker_opens_after_consecutive_5xx(self):
+        client = self.client_with(breaker_threshold=2, breaker_reset_timeout=60)
+        self.fail_next(503, count=2)
+        for _ in range(2):
+            self.assertEqual(client.get("/calendars/", "loc-1").status_code, 503)
+
+        with self.assertRaises(GHLUnavailable):
+            client.get("/calendars/", "loc-1")
+        self.assertEqual(self.ghl.requests_seen, 2)
+
+    def test_limiter_rejects_when_no_token_arrives_in_time(self):
+        self.addCleanup(reset_buckets)
+        client = self.client_with(rate_limit=1, rate_burst=1, rate_limit_max_wait=0)
+        client.get("/calendars/", "loc-1")
+
+        with self.assertRaises(GHLUnavailable):
+            client.get("/calendars/", "loc-1")
+        self.assertEqual((self.ghl.requests_seen, client.stats["throttled"]), (1, 1))
+
+
+class ResilienceTests(TestCase):
+    def test_half_open_lets_a_single_probe_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        breaker.before_call()
+        with self.assertRaises(GHLUnavailable):
+            breaker.before_call()
+        # La prueba terminó sin resultado de GHL: el siguiente puede probar
+        breaker.release_probe()
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_retry_budget_is_a_fraction_of_the_traffic(self):
+        budget = RetryBudget(ratio=0.5, min_tokens=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+    def test_token_bucket_burst_and_block(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual((bucket.try_acquire(), bucket.try_acquire()), (0.0, 0.0))
+        self.assertGreater(bucket.try_acquire(), 0)
+
+        bucket.block(30)
+        self.assertGreater(bucket.try_acquire(), 29)
+
+    def test_shared_bucket_is_shared_through_its_file(self):
+        if fcntl is None:
+            self.skipTest("sin flock")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/loc-1.bucket"
+        first, second = SharedTokenBucket(path, rate=1, capacity=2), SharedTokenBucket(path, rate=1, capacity=2)
+
+        self.assertEqual((first.try_acquire(), second.try_acquire()), (0.0, 0.0))
+        self.assertGreater(first.try_acquire(), 0)
+        second.block(30)
+        self.assertGreater(first.try_acquire(), 29)
+
+
+@override_settings(GHL_BULK_CONCURRENCY=1)
+class BulkCreateTests(StubGHLTestCase):
+    def post_bulk(self, count):
+        items = [dict(APPOINTMENT_PAYLOAD, title=f"Consulta {i}", startTime=f"2030-01-0{i + 1}T15:00:00Z",
+                      endTime=f"2030-01-0{i + 1}T15:30:00Z") for i in range(count)]
+        response = self.client.post("/api/appointments/bulk/", {"appointments": items}, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content[:300])
+        return response.json()
+
+    def test_items_are_created_and_saved_in_one_write(self):
+        body = self.post_bulk(3)
+
+        self.assertEqual((body["created"], body["failed"]), (3, 0))
+        ghl_ids = [result["ghl_id"] for result in body["results"]]
+        self.assertEqual(set(Appointment.objects.values_list("ghl_id", flat=True)), set(ghl_ids))
+
+    def test_429_is_reported_without_an_extra_retry_loop(self):
+        self.fail_next(429)
+
+        body = self.post_bulk(3)
+
+        # El cliente GHL decide los reintentos (GHL_MAX_RETRIES=0 aquí): una llamada por ítem
+        self.assertEqual((body["created"], body["failed"]), (2, 1))
+        self.assertEqual(body["results"][0]["status"], 429)
+        self.assertEqual(self.ghl.requests_seen, 3)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_created_items_reach_the_availability_index(self):
+        index = availability.get_index()
+        index.load()
+        self.addCleanup(availability.reset_index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            body = self.post_bulk(1)
+
+        start = datetime(2030, 1, 1, 15, 10, tzinfo=dt_timezone.utc)
+        self.assertEqual(index.conflicts(start, start + timedelta(minutes=5), calendar_id="cal-1"),
+                         [body["results"][0]["ghl_id"]])
+
+
+class IdempotencyTests(StubGHLTestCase):
+    def create(self, key, **fields):
+        return self.client.post("/api/appointments/create/", dict(APPOINTMENT_PAYLOAD, **fields),
+                                content_type="application/json", headers={idempotency.HEADER: key})
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.create("key-1")
+        retry = self.create("key-1")
+
+        self.assertEqual(first.status_code, 201, first.content[:200])
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry[idempotency.REPLAY_HEADER], "true")
+        self.assertEqual(self.ghl.requests_seen, 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_same_key_with_another_body_is_rejected(self):
+        self.create("key-1")
+
+        response = self.create("key-1", title="Otra")
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.ghl.requests_seen, 1)
+
+    def test_transient_failure_releases_the_key(self):
+        self.fail_next(500)
+
+        self.assertEqual(self.create("key-1").status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.create("key-1").status_code, 201)
+        self.assertEqual(self.ghl.requests_seen, 2)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_key_in_progress_answers_409(self):
+        digest = idempotency.fingerprint("POST", "/api/appointments/create/", APPOINTMENT_PAYLOAD)
+        IdempotencyKey.objects.create(scope="appointments.create", key="key-1", fingerprint=digest,
+                                      locked_at=timezone.now(), expires_at=timezone.now() + timedelta(hours=1))
+
+        response = self.create("key-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.ghl.requests_seen, 0)
+
+
+@override_settings(CONTACT_DEDUP_RESPONSE="409", CONTACT_DEFAULT_COUNTRY_CODE="51")
+class ContactDedupTests(StubGHLTestCase):
+    def setUp(self):
+        super().setUp()
+        Contact.objects.create(ghl_id="contact-1", location_id="loc-1", first_name="Ana", last_name="García",
+                               email="Ana@Example.com", phone="987 654 321")
+
+    def test_phone_is_normalized_to_e164(self):
+        cases = [
+            ("987 654 321", "+51987654321"),
+            ("51987654321", "+51987654321"),
+            ("+51 987-654-321", "+51987654321"),
+            ("0034 612 345 678", "+34612345678"),
+            ("51", None),
+            ("", None),
+        ]
+        for phone, expected in cases:
+            with self.subTest(phone=phone):
+                self.assertEqual(dedup.normalize_phone(phone), expected)
+
+    def test_known_duplicate_is_answered_without_calling_ghl(self):
+        response = self.client.post("/api/contacts/create/", {
+            "locationId": "loc-1", "firstName": "Ana", "lastName": "García", "phone": "+51 987654321",
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["existing_contact_id"], "contact-1")
+        self.assertEqual(response.json()["duplicate_field"], "phone")
+        self.assertEqual(self.ghl.requests_seen, 0)
+
+    def test_same_email_in_another_location_is_not_a_duplicate(self):
+        self.assertEqual(dedup.find_duplicate("loc-2", email="ana@example.com"), (None, None))
+
+    def test_match_many_keeps_candidate_order(self):
+        response = self.client.post("/api/contacts/match/", {"locationId": "loc-1", "candidates": [
+            {"email": "nadie@example.com"}, {"email": " ANA@example.com "}, {"phone": "51987654321"},
+        ]}, content_type="application/json")
+
+        body = response.json()
+        self.assertEqual(body["matched"], 2)
+        self.assertEqual([(r["contact_id"], r["matching_field"]) for r in body["results"]],
+                         [(None, None), ("contact-1", "email"), ("contact-1", "phone")])
+
+
+@override_settings(SLOTS_REFRESH_INTERVAL=3600)
+class AvailabilityIndexTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        for i in range(2):
+            Appointment.objects.create(ghl_id=f"appt-{i}", location_id="loc-1", calendar_id="cal-1",
+                                       contact_id="contact-1", start_time=self.start + timedelta(hours=i),
+                                       end_time=self.start + timedelta(hours=i, minutes=30))
+        self.index = availability.get_index()
+        self.index.load()
+        self.addCleanup(availability.reset_index)
+
+    def conflicts(self):
+        return self.index.conflicts(self.start, self.start + timedelta(hours=2), calendar_id="cal-1")
+
+    def test_loaded_rows_are_answered_from_memory(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.conflicts(), ["appt-0", "appt-1"])
+
+    def test_delete_in_another_process_is_dropped_after_refresh(self):
+        # Sin señales, como un borrado desde otro proceso
+        Appointment.objects.filter(ghl_id="appt-0")._raw_delete(Appointment.objects.db)
+
+        self.index.refresh(force=True)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.conflicts(), ["appt-1"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.conflicts(), ["appt-1"])
+
+    def test_archived_rows_leave_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_batch(Q(ghl_id="appt-1"), 10)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.conflicts(), ["appt-0"])
+
+
+def ghl_time(dt):
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+class ReconcileTests(StubGHLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(microsecond=0)
+        self.events = {}
+        self.contacts = {}
+
+    def ghl_event(self, ghl_id, start, updated, title="Consulta", status="confirmed"):
+        self.events[ghl_id] = {
+            "id": ghl_id, "locationId": "loc-1", "calendarId": "cal-1", "contactId": "contact-1", "title": title,
+            "appointmentStatus": status, "startTime": ghl_time(start),
+            "endTime": ghl_time(start + timedelta(minutes=30)), "dateUpdated": ghl_time(updated),
+        }
+
+    def ghl_contact(self, ghl_id, updated, first_name="Ana"):
+        self.contacts[ghl_id] = {
+            "id": ghl_id, "locationId": "loc-1", "firstName": first_name, "lastName": "García",
+            "email": f"{ghl_id}@example.com", "phone": None, "dateUpdated": ghl_time(updated),
+        }
+
+    def sync(self, entity, mode):
+        self.ghl.load(calendars=["cal-1"], events=self.events.values(), contacts=self.contacts.values())
+        self.ghl.requests_seen = 0
+        return reconcile.run(entity, "loc-1", mode=mode)
+
+    def high_water_mark(self, entity):
+        return SyncState.objects.get(name=f"{entity}:loc-1").high_water_mark
+
+    def test_appointments_full_then_incremental(self):
+        hour_ago = self.now - timedelta(hours=1)
+        self.ghl_event("past", self.now - timedelta(days=10), hour_ago)
+        self.ghl_event("soon", self.now + timedelta(days=1), hour_ago)
+        self.ghl_event("later", self.now + timedelta(days=20), hour_ago - timedelta(minutes=10))
+
+        stats = self.sync("appointments", reconcile.MODE_FULL)
+        full_requests = self.ghl.requests_seen
+
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (3, 0, 0))
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(self.high_water_mark("appointments"), hour_ago)
+
+        # Sin cambios en GHL: nada que aplicar, y sin pedir el año hacia atrás
+        stats = self.sync("appointments", reconcile.MODE_INCREMENTAL)
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (0, 0, 3))
+        self.assertLess(self.ghl.requests_seen, full_requests)
+
+        self.ghl_event("soon", self.now + timedelta(days=1), self.now, title="Reprogramada")
+        self.ghl_event("new", self.now + timedelta(days=3), self.now)
+        stats = self.sync("appointments", reconcile.MODE_INCREMENTAL)
+
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (1, 1, 2))
+        self.assertEqual(Appointment.objects.get(ghl_id="soon").title, "Reprogramada")
+        self.assertEqual(self.high_water_mark("appointments"), self.now)
+
+    def test_incremental_applies_status_change_of_started_appointment(self):
+        hour_ago = self.now - timedelta(hours=1)
+        self.ghl_event("yesterday", self.now - timedelta(days=1), hour_ago)
+        self.ghl_event("soon", self.now + timedelta(days=1), hour_ago)
+        self.sync("appointments", reconcile.MODE_FULL)
+
+        # Empezó antes de la marca de agua y se marca como no asistida después
+        self.ghl_event("yesterday", self.now - timedelta(days=1), self.now, status="noshow")
+        stats = self.sync("appointments", reconcile.MODE_INCREMENTAL)
+
+        self.assertEqual((stats["updated"], stats["unchanged"]), (1, 1))
+        self.assertEqual(Appointment.objects.get(ghl_id="yesterday").appointment_status, "noshow")
+        self.assertEqual(self.high_water_mark("appointments"), self.now)
+
+    def test_contacts_full_then_incremental(self):
+        hour_ago = self.now - timedelta(hours=1)
+        self.ghl_contact("c1", hour_ago)
+        self.ghl_contact("c2", hour_ago)
+
+        stats = self.sync("contacts", reconcile.MODE_FULL)
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (2, 0, 0))
+        self.assertEqual(self.high_water_mark("contacts"), hour_ago)
+        first_sync = Contact.objects.get(ghl_id="c1").date_updated
+
+        self.ghl_contact("c1", self.now, first_name="Ana María")
+        stats = self.sync("contacts", reconcile.MODE_INCREMENTAL)
+
+        # Solo se piden los cambiados desde la marca de agua (menos el solape)
+        self.assertEqual((stats["fetched"], stats["updated"], stats["unchanged"]), (2, 1, 1))
+        contact = Contact.objects.get(ghl_id="c1")
+        self.assertEqual(contact.first_name, "Ana María")
+        self.assertGreater(contact.date_updated, first_sync)
+        self.assertEqual(self.high_water_mark("contacts"), self.now)
+
+
+def webhook_event(ghl_id, updated, event_type="AppointmentCreate", webhook_id=None, **fields):
+    start = datetime(2030, 1, 7, 15, 0, tzinfo=dt_timezone.utc)
+    appointment = {
+        "id": ghl_id, "calendarId": "cal-1", "contactId": "contact-1", "title": "Consulta",
+        "appointmentStatus": "confirmed", "startTime": ghl_time(start),
+        "endTime": ghl_time(start + timedelta(minutes=30)), "dateAdded": ghl_time(updated),
+        "dateUpdated": ghl_time(updated), **fields,
+    }
+    event = {"type": event_type, "locationId": "loc-1", "appointment": appointment}
+    if webhook_id:
+        event["webhookId"] = webhook_id
+    return event
+
+
+@override_settings(GHL_WEBHOOK_MODE="deferred")
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        self.updated = timezone.now().replace(microsecond=0)
+
+    def post(self, event):
+        return self.client.post("/api/webhook/ghl/", event, content_type="application/json")
+
+    def test_event_is_queued_and_applied_by_drain(self):
+        response = self.post(webhook_event("appt-1", self.updated))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Appointment.objects.exists())
+
+        self.assertEqual(webhooks.drain(once=True), (1, 0))
+        self.assertEqual(Appointment.objects.get(ghl_id="appt-1").title, "Consulta")
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PROCESSED)
+
+    def test_create_then_cancel_in_one_batch_is_saved_cancelled(self):
+        self.post(webhook_event("appt-1", self.updated))
+        self.post(webhook_event("appt-1", self.updated + timedelta(minutes=1), event_type="AppointmentDelete"))
+
+        self.assertEqual(webhooks.drain(once=True), (2, 0))
+        self.assertEqual(Appointment.objects.get(ghl_id="appt-1").appointment_status, "cancelled")
+
+    def test_invalid_event_does_not_block_the_batch(self):
+        self.post(webhook_event("appt-1", self.updated))
+        self.post(webhook_event("appt-2", self.updated, title=None, startTime=None))
+
+        self.assertEqual(webhooks.drain(once=True), (1, 1))
+        self.assertTrue(Appointment.objects.filter(ghl_id="appt-1").exists())
+        failed = WebhookEvent.objects.get(ghl_id="appt-2")
+        self.assertEqual(failed.status, WebhookEvent.STATUS_FAILED)
+        self.assertIn("start_time", failed.error)
+
+    def test_abandoned_event_is_reclaimed(self):
+        self.post(webhook_event("appt-1", self.updated))
+        stale = timezone.now() - timedelta(seconds=settings.GHL_WEBHOOK_LOCK_TIMEOUT + 1)
+        WebhookEvent.objects.update(status=WebhookEvent.STATUS_PROCESSING, batch_id="caido", locked_at=stale)
+
+        self.assertEqual(webhooks.drain(once=True), (1, 0))
+        self.assertTrue(Appointment.objects.filter(ghl_id="appt-1").exists())
+
+
+class WebhookVersioningTests(TestCase):
+    def setUp(self):
+        self.updated = timezone.now().replace(microsecond=0)
+        self.earlier = self.updated - timedelta(minutes=5)
+
+    def post(self, event):
+        response = self.client.post("/api/webhook/ghl/", event, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return response.json()["status"]
+
+    def test_older_update_is_skipped(self):
+        self.post(webhook_event("appt-1", self.updated, title="Reprogramada"))
+
+        status = self.post(webhook_event("appt-1", self.earlier, event_type="AppointmentUpdate"))
+
+        self.assertEqual(status, webhooks.OUTCOME_STALE)
+        appointment = Appointment.objects.get(ghl_id="appt-1")
+        self.assertEqual(appointment.title, "Reprogramada")
+        self.assertEqual(appointment.ghl_date_updated, self.updated)
+
+    def test_older_cancel_does_not_cancel(self):
+        self.post(webhook_event("appt-1", self.updated))
+
+        status = self.post(webhook_event("appt-1", self.earlier, event_type="AppointmentDelete"))
+
+        self.assertEqual(status, webhooks.OUTCOME_STALE)
+        self.assertEqual(Appointment.objects.get(ghl_id="appt-1").appointment_status, "confirmed")
+
+    def test_repeated_event_is_skipped(self):
+        # Con webhookId y, sin él, por hash del contenido
+        for webhook_id in ("wh-1", None):
+            with self.subTest(webhook_id=webhook_id):
+                event = webhook_event(f"appt-{webhook_id}", self.updated, webhook_id=webhook_id)
+                self.assertEqual(self.post(event), "ok")
+                self.assertEqual(self.post(event), webhooks.OUTCOME_DUPLICATE)
+
+    def test_newer_update_is_applied(self):
+        self.post(webhook_event("appt-1", self.earlier))
+
+        status = self.post(webhook_event("appt-1", self.updated, event_type="AppointmentUpdate", title="Reprogramada"))
+
+        self.assertEqual(status, "ok")
+        self.assertEqual(Appointment.objects.get(ghl_id="appt-1").title, "Reprogramada")
+
+    def test_batch_skips_out_of_order_and_repeated_events(self):
+        newer = webhook_event("appt-1", self.updated, title="Reprogramada", webhook_id="wh-2")
+        events = [
+            WebhookEvent.objects.create(event_type="AppointmentCreate", ghl_id="appt-1", payload=payload)
+            for payload in (newer, webhook_event("appt-1", self.earlier, webhook_id="wh-1"), newer)
+        ]
+
+        before = webhooks.stats_snapshot()
+        webhooks.apply_batch(events)
+        after = webhooks.stats_snapshot()
+
+        self.assertEqual(Appointment.objects.get(ghl_id="appt-1").title, "Reprogramada")
+        self.assertEqual({outcome: after[outcome] - before[outcome] for outcome in after},
+                         {webhooks.OUTCOME_APPLIED: 1, webhooks.OUTCOME_STALE: 1, webhooks.OUTCOME_DUPLICATE: 1})
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.updated = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+
+    def apply(self, ghl_id, event_type="AppointmentCreate", minutes=0, **fields):
+        event = webhook_event(ghl_id, self.updated + timedelta(minutes=minutes), event_type=event_type, **fields)
+        body, code = webhooks.handle(event)
+        self.assertEqual(code, 200, body)
+
+    def rollup_rows(self):
+        return set(AppointmentRollup.objects.filter(count__gt=0).values_list(*rollups.KEY_FIELDS, "count"))
+
+    def test_incremental_deltas_match_a_rebuild(self):
+        self.apply("appt-1")
+        self.apply("appt-2", assignedUserId="user-1")
+        self.apply("appt-3", startTime="2030-01-08T15:00:00Z", endTime="2030-01-08T15:30:00Z")
+        # Cambio de estado, de día y cancelación: cada uno mueve el conteo de una clave a otra
+        self.apply("appt-1", "AppointmentUpdate", minutes=1, appointmentStatus="showed")
+        self.apply("appt-2", "AppointmentUpdate", minutes=1, startTime="2030-01-09T15:00:00Z",
+                   endTime="2030-01-09T15:30:00Z", assignedUserId="user-1")
+        self.apply("appt-3", "AppointmentDelete", minutes=1)
+        Appointment.objects.filter(ghl_id="appt-1").update(end_time=timezone.now() - timedelta(days=365))
+        archive.archive_batch(Q(ghl_id="appt-1"), 10)
+
+        params = {"group_by": "location_id,calendar_id,assigned_user_id,appointment_status"}
+        self.assertEqual(rollups.daily_counts(params), rollups.daily_counts(params, live=True))
+        incremental = self.rollup_rows()
+
+        rollups.rebuild()
+
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(sum(row[-1] for row in incremental), 3)
+
+    def test_stats_endpoint_reads_the_rollup(self):
+        self.apply("appt-1")
+        self.apply("appt-2", appointmentStatus="showed")
+
+        response = self.client.get("/api/appointments/stats/", {"group_by": "appointment_status"})
+
+        body = response.json()
+        self.assertEqual((body["source"], body["total"]), ("rollup", 2))
+        self.assertEqual({row["appointment_status"]: row["count"] for row in body["results"]},
+                         {"confirmed": 1, "showed": 1})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        Contact.objects.create(ghl_id="contact-1", location_id="loc-1", first_name="Ana", last_name="García",
+                               email="ana.garcia@example.com", phone="+51987654321")
+        Contact.objects.create(ghl_id="contact-2", location_id="loc-1", first_name="Luis", last_name="Garrido")
+        start = timezone.now() + timedelta(days=1)
+        Appointment.objects.create(ghl_id="appt-1", location_id="loc-1", calendar_id="cal-1", contact_id="contact-1",
+                                   title="Limpieza dental", notes="Traer radiografías", start_time=start,
+                                   end_time=start + timedelta(minutes=30))
+
+    def found(self, query):
+        return sorted(search.search_contacts(Contact.objects.all(), query).values_list("ghl_id", flat=True))
+
+    def found_appointments(self, query):
+        return list(search.search_appointments(Appointment.objects.all(), query).values_list("ghl_id", flat=True))
+
+    def assert_searches(self):
+        self.assertEqual(self.found("ana gar"), ["contact-1"])
+        self.assertEqual(self.found("gar"), ["contact-1", "contact-2"])
+        self.assertEqual(self.found("ANA.GARCIA@example.com"), ["contact-1"])
+        self.assertEqual(self.found("987 654 321"), ["contact-1"])
+        self.assertEqual(self.found("contact-2"), ["contact-2"])
+        self.assertEqual(self.found("pedro"), [])
+        self.assertEqual(self.found_appointments("radio"), ["appt-1"])
+        self.assertEqual(self.found_appointments("contact-1"), ["appt-1"])
+
+    def test_indexed_search(self):
+        self.assertTrue(search._has_index(search.CONTACTS))
+        self.assert_searches()
+        # Sin tildes también encuentra (el índice las quita)
+        self.assertEqual(self.found("garcia"), ["contact-1"])
+
+    def test_index_follows_updates_and_deletes(self):
+        Contact.objects.filter(ghl_id="contact-2").update(first_name="Pedro")
+        Contact.objects.filter(ghl_id="contact-1").delete()
+
+        self.assertEqual(self.found("pedro"), ["contact-2"])
+        self.assertEqual(self.found("ana"), [])
+
+    def test_icontains_fallback_without_index(self):
+        search.uninstall()
+        self.addCleanup(search.install)
+
+        self.assertFalse(search._has_index(search.CONTACTS))
+        self.assert_searches()
+
+
+@override_settings(GHL_API_KEY="global-key", GHL_LOCATION_ID="", GHL_LOCATION_REGISTRY_STRICT=False,
+                   READS_REQUIRE_LOCATION=False, READ_CACHE_ENABLED=False)
+class TenancyTests(TestCase):
+    def setUp(self):
+        tenancy.forget()
+        self.addCleanup(tenancy.forget)
+        self.addCleanup(ghl_client.reset_ghl_client)
+        start = timezone.now() + timedelta(days=1)
+        for ghl_id, location_id in (("appt-1", "loc-1"), ("appt-2", "loc-2")):
+            Appointment.objects.create(ghl_id=ghl_id, location_id=location_id, calendar_id="cal-1",
+                                       contact_id="contact-1", start_time=start, end_time=start + timedelta(minutes=30))
+
+    def listed(self, **kwargs):
+        response = self.client.get("/api/appointments/", **kwargs)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return [row["ghl_id"] for row in response.json()["results"]]
+
+    def test_reads_are_scoped_by_param_or_header(self):
+        self.assertEqual(self.listed(data={"location_id": "loc-2"}), ["appt-2"])
+        self.assertEqual(self.listed(headers={"X-Location-Id": "loc-1"}), ["appt-1"])
+        self.assertEqual(sorted(self.listed()), ["appt-1", "appt-2"])
+
+    def test_browsers_may_send_the_location_header(self):
+        response = self.client.options("/api/appointments/", headers={
+            "Origin": "http://localhost:5173", "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Headers": "x-location-id",
+        })
+
+        self.assertIn("x-location-id", response["Access-Control-Allow-Headers"])
+
+    @override_settings(READS_REQUIRE_LOCATION=True)
+    def test_required_location_falls_back_to_the_default(self):
+        self.assertEqual(self.client.get("/api/appointments/").status_code, 400)
+
+        with override_settings(GHL_LOCATION_ID="loc-2"):
+            self.assertEqual(self.listed(), ["appt-2"])
+
+    def test_registered_location_uses_its_own_credentials(self):
+        Location.objects.create(location_id="loc-1", api_key="loc-1-key", rate_limit_per_second=2)
+
+        registered, unregistered = tenancy.credentials_for("loc-1"), tenancy.credentials_for("loc-2")
+
+        self.assertEqual((registered.api_key, registered.rate_limit), ("loc-1-key", 2))
+        self.assertEqual(unregistered.api_key, "global-key")
+        self.assertIsNot(ghl_client.get_ghl_client("loc-1"), ghl_client.get_ghl_client("loc-2"))
+
+    def test_location_changes_rebuild_its_client(self):
+        location = Location.objects.create(location_id="loc-1", api_key="old-key")
+        old_client = ghl_client.get_ghl_client("loc-1")
+
+        location.api_key = "new-key"
+        location.save()
+        new_client = ghl_client.get_ghl_client("loc-1")
+
+        self.assertIsNot(new_client, old_client)
+        self.assertEqual(new_client.api_key, "new-key")
+
+        location.is_active = False
+        location.save()
+        with self.assertRaises(ghl_client.MissingCredentials):
+            ghl_client.get_ghl_client("loc-1")
+
+    @override_settings(GHL_LOCATION_REGISTRY_STRICT=True)
+    def test_strict_registry_rejects_unregistered_locations(self):
+        self.assertIsNone(tenancy.credentials_for("loc-2"))
+
+
+@override_settings(ARCHIVE_AFTER_DAYS=180, ARCHIVE_CANCELLED_AFTER_DAYS=30, READ_CACHE_ENABLED=False)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.add("old", self.now - timedelta(days=200))
+        self.add("recent", self.now - timedelta(days=10))
+        self.add("cancelled", self.now + timedelta(days=5), appointment_status="cancelled")
+        self.add("cancelled-today", self.now + timedelta(days=5), appointment_status="cancelled")
+        Appointment.objects.exclude(ghl_id="cancelled-today").update(date_updated=self.now - timedelta(days=40))
+
+    def add(self, ghl_id, start, **fields):
+        Appointment.objects.create(ghl_id=ghl_id, location_id="loc-1", calendar_id="cal-1", contact_id="contact-1",
+                                   start_time=start, end_time=start + timedelta(minutes=30), **fields)
+
+    def test_run_moves_past_and_long_cancelled_appointments(self):
+        self.assertEqual(archive.pending(self.now), {"past": 1, "cancelled": 1})
+
+        moved = archive.run(batch_size=1, now=self.now)
+
+        self.assertEqual(moved, {"past": 1, "cancelled": 1})
+        self.assertEqual(set(ArchivedAppointment.objects.values_list("ghl_id", flat=True)), {"old", "cancelled"})
+        self.assertEqual(set(Appointment.objects.values_list("ghl_id", flat=True)), {"recent", "cancelled-today"})
+        self.assertEqual(archive.pending(self.now), {"past": 0, "cancelled": 0})
+
+    def test_archived_appointment_is_still_readable(self):
+        archive.run(now=self.now)
+
+        listed = [row["ghl_id"] for row in self.client.get("/api/appointments/").json()["results"]]
+        archived = [row["ghl_id"] for row in self.client.get("/api/appointments/archive/").json()["results"]]
+        detail = self.client.get("/api/appointments/old/")
+
+        self.assertNotIn("old", listed)
+        self.assertIn("old", archived)
+        self.assertEqual((detail.status_code, detail.json()["ghl_id"]), (200, "old"))
+
+    def test_webhook_update_restores_the_appointment(self):
+        original_pk = Appointment.objects.get(ghl_id="old").pk
+        archive.run(now=self.now)
+
+        body, code = webhooks.handle(webhook_event("old", self.now, event_type="AppointmentUpdate", title="Reabierta"))
+
+        self.assertEqual(code, 200, body)
+        self.assertFalse(ArchivedAppointment.objects.filter(ghl_id="old").exists())
+        restored = Appointment.objects.get(ghl_id="old")
+        self.assertEqual((restored.pk, restored.title), (original_pk, "Reabierta"))
+
+    def test_webhook_cancel_stays_in_the_archive(self):
+        archive.run(now=self.now)
+
+        webhooks.handle(webhook_event("old", self.now, event_type="AppointmentDelete"))
+
+        self.assertFalse(Appointment.objects.filter(ghl_id="old").exists())
+        self.assertEqual(ArchivedAppointment.objects.get(ghl_id="old").appointment_status, "cancelled")
+
+
+INTERNAL_FIELDS = {"email_normalized", "phone_normalized", "ghl_date_updated", "last_event_fingerprint", "contact_ref"}
+
+
+@override_settings(READ_CACHE_ENABLED=False)
+class FastReadTests(TestCase):
+    """El camino rápido (.values() + plan + orjson) responde los mismos bytes que el serializer de DRF."""
+
+    LIST_URLS = [
+        ("/api/contacts/", {}),
+        ("/api/contacts/", {"location_id": "loc-1", "page_size": 2}),
+        ("/api/contacts/search/", {"q": "ana"}),
+        ("/api/appointments/", {}),
+        ("/api/appointments/", {"expand": "contact"}),
+        ("/api/appointments/", {"calendar_id": "cal-1", "page_size": 2}),
+        ("/api/appointments/search/", {"q": "consulta"}),
+        ("/api/appointments/archive/", {}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now().replace(microsecond=123456) + timedelta(days=1)
+        Contact.objects.create(ghl_id="contact-1", location_id="loc-1", first_name="Ana", last_name="García",
+                               email="ana@example.com", phone="+51987654321")
+        Contact.objects.create(ghl_id="contact-2", location_id="loc-1", first_name="Ánæ \u2028", last_name="Pérez")
+        Contact.objects.create(ghl_id="contact-3", location_id="loc-2", first_name="Luis", last_name="Díaz")
+        for i, (contact_id, notes) in enumerate([("contact-1", "Primera visita"), ("contact-2", None),
+                                                 ("sin-contacto", "Línea\u2029nueva"), ("contact-1", "")]):
+            Appointment.objects.create(
+                ghl_id=f"appt-{i}", location_id="loc-1", calendar_id="cal-1", contact_id=contact_id,
+                title=f"Consulta {i} 🦷", appointment_status="confirmed", notes=notes,
+                start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=30),
+            )
+        Appointment.objects.create(
+            ghl_id="appt-old", location_id="loc-1", calendar_id="cal-1", contact_id="contact-1", title="Consulta vieja",
+            appointment_status="showed", start_time=start - timedelta(days=400),
+            end_time=start - timedelta(days=400, minutes=-30),
+        )
+        from .services import resolve_contact_refs
+        resolve_contact_refs(list(Appointment.objects.values_list("ghl_id", flat=True)))
+        archive.archive_batch(Q(ghl_id="appt-old"), 10)
+
+    def get(self, url, params, fast):
+        with override_settings(FAST_READ_PATH_ENABLED=fast):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return response.content
+
+    def test_list_endpoints_match_serializer_bytes(self):
+        for url, params in self.LIST_URLS:
+            with self.subTest(url=url, params=params):
+                fast = self.get(url, params, fast=True)
+                self.assertEqual(fast, self.get(url, params, fast=False))
+                results = json.loads(fast)["results"]
+                self.assertTrue(results)
+                # Columnas internas (dedup y orden de webhooks) fuera de la API
+                self.assertFalse(set(results[0]) & INTERNAL_FIELDS)
+
+    def test_plan_with_a_single_column(self):
+        class GhlIdSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Contact
+                fields = ["ghl_id"]
+
+        plan = fastread.compile_plan(GhlIdSerializer)
+        rows = Contact.objects.order_by("ghl_id").values(*plan.all_columns)
+        self.assertEqual(plan.convert(rows), [{"ghl_id": "contact-1"}, {"ghl_id": "contact-2"}, {"ghl_id": "contact-3"}])
+
+
+@override_settings(
+    READ_CACHE_ENABLED=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-reads"}},
+)
+class ReadCacheTests(TestCase):
+    def ghl_event(self, location_id, updated):
+        start = timezone.now() + timedelta(days=1)
+        return {
+            "id": "appt-1", "locationId": location_id, "calendarId": "cal-1", "contactId": "contact-1",
+            "title": "Consulta", "appointmentStatus": "confirmed", "startTime": ghl_time(start),
+            "endTime": ghl_time(start + timedelta(minutes=30)), "dateUpdated": ghl_time(updated),
+        }
+
+    def listed(self, location_id):
+        response = self.client.get("/api/appointments/", {"location_id": location_id})
+        return [row["ghl_id"] for row in response.json()["results"]]
+
+    def test_moving_appointment_invalidates_previous_location(self):
+        now = timezone.now().replace(microsecond=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            reconcile.apply_appointments([self.ghl_event("loc-1", now - timedelta(minutes=5))])
+        self.assertEqual(self.listed("loc-1"), ["appt-1"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reconcile.apply_appointments([self.ghl_event("loc-2", now)])
+
+        self.assertEqual(self.listed("loc-1"), [])
+        self.assertEqual(self.listed("loc-2"), ["appt-1"])
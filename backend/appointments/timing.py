@@ -0,0 +1,140 @@
+# appointments/timing.py
+# Tiempo de cada petición repartido entre llamadas a GHL y consultas a la BD.
+# RequestTimingMiddleware abre un `Timings` en un contextvar; el cliente GHL
+# (sync y async) y un execute_wrapper de la BD suman ahí su tiempo. Al final
+# se responde con la cabecera Server-Timing y se registra en el log.
+#
+# El contextvar viaja con sync_to_async, así que las vistas async también
+# suman el tiempo de BD que se ejecuta en hilos.
+import logging
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+from .logs import sampled
+
+logger = logging.getLogger("appointments.request")
+
+_current = ContextVar("request_timings", default=None)
+
+
+class Timings:
+    """Acumula (segundos, llamadas) por tramo: "ghl", "db"."""
+
+    __slots__ = ("start", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}
+
+    def add(self, name, elapsed):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + elapsed, count + 1)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+class track:
+    """`with track("ghl"):` suma el bloque al tramo de la petición en curso (si la hay)."""
+
+    __slots__ = ("name", "timings", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add("db", time.perf_counter() - start)
+
+
+def on_connection_created(sender, connection, **kwargs):
+    """Instala el wrapper en cada conexión (una vez: el objeto sobrevive a reconexiones)."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def server_timing(timings, total):
+    parts = [f"total;dur={total * 1000:.1f}"]
+    for name, (spent, count) in timings.spans.items():
+        parts.append(f'{name};dur={spent * 1000:.1f};desc="{count}"')
+    return ", ".join(parts)
+
+
+def log_fields(request, response, timings, total):
+    fields = {
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(total * 1000, 2),
+    }
+    for name, (spent, count) in timings.spans.items():
+        fields[f"{name}_ms"] = round(spent * 1000, 2)
+        fields[f"{name}_calls"] = count
+    return fields
+
+
+class RequestTimingMiddleware:
+    """Mide cada petición; funciona bajo WSGI y ASGI sin adaptar la cadena."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = Timings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = Timings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = timings.elapsed()
+        metrics.observe_request(request, response, timings, total)
+        if settings.SERVER_TIMING_ENABLED:
+            response["Server-Timing"] = server_timing(timings, total)
+        if total * 1000 >= settings.LOG_SLOW_REQUEST_MS:
+            logger.warning("petición lenta", extra=log_fields(request, response, timings, total))
+        elif logger.isEnabledFor(logging.INFO) and sampled(settings.LOG_REQUEST_SAMPLE_RATE):
+            logger.info("petición", extra=log_fields(request, response, timings, total))
+        return response
@@ -1,17 +1,53 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import exports, views
+
+# Bajo ASGI (uvicorn) las vistas que llaman a GHL pueden ser async
+if settings.GHL_ASYNC_VIEWS:
+    from . import async_views
+
+    appointment_create = async_views.appointment_create
+    appointment_update = async_views.appointment_update
+    appointment_delete = async_views.appointment_delete
+    ghl_webhook = async_views.ghl_webhook
+else:
+    appointment_create = views.AppointmentCreateView.as_view()
+    appointment_update = views.AppointmentUpdateView.as_view()
+    appointment_delete = views.AppointmentDeleteView.as_view()
+    ghl_webhook = views.ghl_webhook
 
 urlpatterns = [
     # Contactos
     path('contacts/', views.ContactListView.as_view(), name='contact-list'),
     path('contacts/create/', views.ContactCreateView.as_view(), name='contact-create'),
+    path('contacts/match/', views.ContactMatchView.as_view(), name='contact-match'),
+    path('contacts/search/', views.ContactSearchView.as_view(), name='contact-search'),
+    path('contacts/export/', exports.export_contacts, name='contact-export'),
+    path('contacts/<str:contact_id>/', views.ContactDetailView.as_view(), name='contact-detail'),
     
     # Citas
     path('appointments/', views.AppointmentListView.as_view(), name='appointment-list'),
-    path('appointments/create/', views.AppointmentCreateView.as_view(), name='appointment-create'),
-    path('appointments/<str:appointment_id>/update/', views.AppointmentUpdateView.as_view(), name='appointment-update'),
-    path('appointments/<str:appointment_id>/delete/', views.AppointmentDeleteView.as_view(), name='appointment-delete'),
+    path('appointments/create/', appointment_create, name='appointment-create'),
+    path('appointments/bulk/', views.AppointmentBulkCreateView.as_view(), name='appointment-bulk-create'),
+    path('appointments/export/', exports.export_appointments, name='appointment-export'),
+    path('appointments/stats/', views.AppointmentStatsView.as_view(), name='appointment-stats'),
+    path('appointments/search/', views.AppointmentSearchView.as_view(), name='appointment-search'),
+    path('appointments/archive/', views.AppointmentArchiveListView.as_view(), name='appointment-archive-list'),
+    path('appointments/<str:appointment_id>/update/', appointment_update, name='appointment-update'),
+    path('appointments/<str:appointment_id>/delete/', appointment_delete, name='appointment-delete'),
+    path('appointments/<str:appointment_id>/', views.AppointmentDetailView.as_view(), name='appointment-detail'),
     
+    # Disponibilidad local
+    path('availability/', views.AvailabilityView.as_view(), name='availability'),
+    path('availability/check/', views.AvailabilityCheckView.as_view(), name='availability-check'),
+
+    # Estado de cambios encolados (modo async)
+    path('sync/<int:pk>/', views.OutboundSyncDetailView.as_view(), name='outbound-sync-detail'),
+
+    # Caché de lecturas
+    path('cache/stats/', views.read_cache_stats, name='read-cache-stats'),
+
     # Webhook
-    path('webhook/ghl/', views.ghl_webhook, name='ghl-webhook'),
+    path('webhook/ghl/', ghl_webhook, name='ghl-webhook'),
+    path('webhook/ghl/stats/', views.ghl_webhook_stats, name='ghl-webhook-stats'),
 ]
@@ -1,114 +1,187 @@
 # appointments/views.py
 # Vistas para la gestión de citas - GHL Sala 02
-import os
 import json
+import logging
+from datetime import timedelta
 import requests
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from dotenv import load_dotenv
-from .models import Appointment, Contact
-from .serializers import AppointmentSerializer, ContactSerializer
-from django.utils.dateparse import parse_datetime
-from django.utils import timezone
+from .models import Appointment, ArchivedAppointment, Contact, OutboundSync, WebhookEvent
+from .serializers import (AppointmentSerializer, AppointmentWithContactSerializer, ArchivedAppointmentSerializer,
+                          ContactSerializer, OutboundSyncSerializer)
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from .ghl_client import get_ghl_client
+from .resilience import GHLUnavailable
 from django.conf import settings
-from rest_framework.generics import ListAPIView
+from . import (availability, bulk, caching, dedup, fastread, idempotency, metrics, outbox, renderers, rollups, search,
+               services, tenancy, webhooks)
+from .filters import filter_appointments, filter_contacts, search_term
+from .logs import Redacted
+from .pagination import AppointmentCursorPagination, ContactCursorPagination
 
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Constantes GHL
-GHL_BASE_URL = "https://services.leadconnectorhq.com"
-GHL_API_VERSION = os.getenv("GHL_API_VERSION", "2021-04-15")
-GHL_API_KEY = os.getenv("GHL_API_KEY")
-GHL_LOCATION_ID = os.getenv("GHL_LOCATION_ID")  # fallback si viene vacío en el webhook
-GHL_DEFAULT_ASSIGNED_USER_ID = os.getenv("GHL_ASSIGNED_USER_ID")
-
-# Nota: No lanzar excepción en import. Validar token solo en endpoints que lo requieran.
-
-def _to_datetime(iso_str):
-    """Convierte ISO8601 string a datetime aware o devuelve None."""
-    if not iso_str:
-        return None
-    dt = parse_datetime(iso_str)
-    if dt is None:
-        return None
-    if settings.USE_TZ and timezone.is_naive(dt):
-        tz = timezone.get_current_timezone()
-        dt = timezone.make_aware(dt, tz)
-    return dt
+# Las credenciales de GHL son por location (ver tenancy.py): GHL_API_KEY,
+# GHL_LOCATION_ID y GHL_ASSIGNED_USER_ID de settings son solo los valores por defecto.
 
-class AppointmentCreateView(APIView):
-    """Crear una cita en GHL y guardarla en MySQL (ya lo tenías)."""
-    def post(self, request, *args, **kwargs):
-        if not GHL_API_KEY:
-            return Response({"error": "Falta GHL_API_KEY en servidor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        data = request.data or {}
-        required_fields = ["calendarId", "contactId", "startTime", "endTime"]
-        for field in required_fields:
-            if field not in data:
-                return Response({"error": f"Falta el campo: {field}"}, status=status.HTTP_400_BAD_REQUEST)
+payload_logger = logging.getLogger("appointments.payload")
 
-        location_id = data.get("locationId") or GHL_LOCATION_ID
-        if not location_id:
-            return Response({"error": "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"},
-                            status=status.HTTP_400_BAD_REQUEST)
+# Nota: No lanzar excepción en import. Validar credenciales solo en endpoints que las requieran.
 
-        # assignedUserId es requerido por algunas cuentas/configuraciones de GHL
-        assigned_user_id = data.get("assignedUserId") or GHL_DEFAULT_ASSIGNED_USER_ID
-        if not assigned_user_id:
-            return Response(
-                {"error": "Falta assignedUserId",
-                 "details": "Incluye assignedUserId en el payload o configura GHL_ASSIGNED_USER_ID en el .env"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+def _missing_credentials(location_id):
+    """500 si la location no tiene con qué autenticarse en GHL; None si las tiene."""
+    if tenancy.credentials_for(location_id) is None:
+        return Response(tenancy.missing_credentials_error(location_id), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return None
 
-        headers = {
-            "Authorization": f"Bearer {GHL_API_KEY}",
-            "Version": GHL_API_VERSION,
-            "Content-Type": "application/json",
-            "LocationId": location_id
-        }
 
-        api_payload = {
-            "calendarId": data["calendarId"],
-            "locationId": location_id,
-            "contactId": data["contactId"],
-            "startTime": data["startTime"],
-            "endTime": data["endTime"],
-            "title": data.get("title", "Cita creada desde API"),
-            "appointmentStatus": data.get("appointmentStatus", "confirmed"),
-            "assignedUserId": assigned_user_id,
-            "ignoreFreeSlotValidation": True,
-            "toNotify": True
-        }
+def _ghl_unavailable(exc):
+    """503 inmediato cuando el circuito está abierto o el limitador no dio turno."""
+    response = Response({"error": "GHL no disponible temporalmente", "details": str(exc)},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if exc.retry_after:
+        response["Retry-After"] = str(int(exc.retry_after + 0.999))
+    return response
 
-        try:
-            resp = requests.post(f"{GHL_BASE_URL}/calendars/events/appointments", json=api_payload, headers=headers, timeout=15)
-            resp.raise_for_status()
-            ghl_data = resp.json()
 
-            start_dt = _to_datetime(ghl_data.get("startTime") or api_payload["startTime"])
-            end_dt = _to_datetime(ghl_data.get("endTime") or api_payload["endTime"])
+def _build_create_payload(data):
+    """
+    Valida los datos de una cita nueva y arma el payload para GHL.
+    Devuelve (api_payload, location_id, None) o (None, None, error).
+    """
+    if not isinstance(data, dict):
+        return None, None, {"error": "Cada cita debe ser un objeto JSON"}
+    required_fields = ["calendarId", "contactId", "startTime", "endTime"]
+    for field in required_fields:
+        if field not in data:
+            return None, None, {"error": f"Falta el campo: {field}"}
+
+    location_id = data.get("locationId") or settings.GHL_LOCATION_ID
+    if not location_id:
+        return None, None, {"error": "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"}
+
+    # assignedUserId es requerido por algunas cuentas/configuraciones de GHL
+    assigned_user_id = data.get("assignedUserId") or _default_assigned_user(location_id)
+    if not assigned_user_id:
+        return None, None, {"error": "Falta assignedUserId",
+                            "details": "Incluye assignedUserId en el payload o configura GHL_ASSIGNED_USER_ID en el .env"}
+
+    api_payload = {
+        "calendarId": data["calendarId"],
+        "locationId": location_id,
+        "contactId": data["contactId"],
+        "startTime": data["startTime"],
+        "endTime": data["endTime"],
+        "title": data.get("title", "Cita creada desde API"),
+        "appointmentStatus": data.get("appointmentStatus", "confirmed"),
+        "assignedUserId": assigned_user_id,
+        "ignoreFreeSlotValidation": True,
+        "toNotify": True
+    }
+    return api_payload, location_id, None
+
+
+def _default_assigned_user(location_id):
+    credentials = tenancy.credentials_for(location_id)
+    return credentials.default_assigned_user_id if credentials else settings.GHL_ASSIGNED_USER_ID
+
+
+def _build_update_payload(appointment, data):
+    """
+    Payload del PUT a GHL: los campos requeridos salen de la cita local y se
+    pisan con los que vengan en `data`. Devuelve (payload, location_id, None) o (None, None, error).
+    """
+    location_id = appointment.location_id or settings.GHL_LOCATION_ID
+    if not location_id:
+        return None, None, {"error": "No se encontró locationId para la cita"}
+
+    # Preparar el payload para GHL con todos los campos requeridos
+    ghl_payload = {
+        "calendarId": appointment.calendar_id,
+        "locationId": location_id,
+        "contactId": appointment.contact_id,
+        "assignedUserId": appointment.assigned_user_id or _default_assigned_user(location_id),
+        "appointmentStatus": appointment.appointment_status,
+        "toNotify": True,
+        "ignoreFreeSlotValidation": True
+    }
+
+    # Actualizar solo los campos que se envían en el request
+    for field in ("title", "startTime", "endTime", "appointmentStatus", "assignedUserId", "notes"):
+        if field in data:
+            ghl_payload[field] = data[field]
+    return ghl_payload, location_id, None
+
+
+def _wants_slot_validation(request):
+    flag = request.GET.get("validate_slot")
+    if flag is not None:
+        return flag.lower() in ("1", "true", "yes")
+    return settings.GHL_LOCAL_SLOT_VALIDATION
+
+
+def _slot_conflicts(payload, exclude=None, current=None):
+    """
+    Citas locales que se solapan con el horario del payload (mismo calendario
+    o mismo usuario asignado). Lista vacía si está libre o no se puede decidir
+    localmente (fechas inválidas, fuera de la ventana del índice).
+    """
+    if payload.get("appointmentStatus") in availability.NON_BLOCKING_STATUSES:
+        return []
+    start = services._to_datetime(payload.get("startTime")) or (current.start_time if current else None)
+    end = services._to_datetime(payload.get("endTime")) or (current.end_time if current else None)
+    if start is None or end is None or end <= start:
+        return []
+    try:
+        return availability.get_index().conflicts(
+            start, end, calendar_id=payload.get("calendarId"),
+            assigned_user_id=payload.get("assignedUserId"), exclude=exclude,
+        )
+    except ValueError:
+        return []
+
 
-            appointment, created = Appointment.objects.update_or_create(
-                ghl_id=ghl_data.get("id"),
-                defaults={
-                    "location_id": ghl_data.get("locationId") or location_id,
-                    "calendar_id": ghl_data.get("calendarId") or api_payload["calendarId"],
-                    "contact_id": ghl_data.get("contactId") or api_payload["contactId"],
-                    "title": ghl_data.get("title") or api_payload.get("title", "Cita"),
-                    "appointment_status": ghl_data.get("appointmentStatus") or api_payload.get("appointmentStatus", "confirmed"),
-                    "assigned_user_id": ghl_data.get("assignedUserId") or api_payload.get("assignedUserId"),
-                    "notes": ghl_data.get("notes") or None,
-                    "start_time": start_dt,
-                    "end_time": end_dt,
-                    "source": ghl_data.get("source")
-                }
-            )
+def _precheck_write(request, op, payload, location_id, appointment=None):
+    """
+    Comprobaciones comunes antes de crear o actualizar una cita en GHL:
+    credenciales de la location, choque de horario (si se pidió) y modo async
+    (encola el cambio). Devuelve (body, status) de la respuesta a dar ya, o None.
+    """
+    if tenancy.credentials_for(location_id) is None:
+        return tenancy.missing_credentials_error(location_id), status.HTTP_500_INTERNAL_SERVER_ERROR
+    ghl_id = appointment.ghl_id if appointment else None
+    if _wants_slot_validation(request):
+        conflicts = _slot_conflicts(payload, exclude=ghl_id, current=appointment)
+        if conflicts:
+            return {"error": "El horario se cruza con otra cita", "conflicts": conflicts}, status.HTTP_409_CONFLICT
+    if outbox.wants_async(request):
+        item = outbox.enqueue(op, location_id, payload, ghl_id=ghl_id)
+        return outbox.accepted_body(item), status.HTTP_202_ACCEPTED
+    return None
+
+
+class AppointmentCreateView(APIView):
+    """Crear una cita en GHL y guardarla en la BD local (ya lo tenías)."""
+    @idempotency.idempotent("appointments.create")
+    def post(self, request, *args, **kwargs):
+        api_payload, location_id, error = _build_create_payload(request.data or {})
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+        precheck = _precheck_write(request, OutboundSync.OP_CREATE, api_payload, location_id)
+        if precheck:
+            return Response(*precheck)
+
+        try:
+            appointment = services.create_appointment(api_payload, location_id)
 
             serializer = AppointmentSerializer(appointment)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -118,191 +191,99 @@ class AppointmentCreateView(APIView):
             details = resp.text if resp is not None else str(http_err)
             code = resp.status_code if resp is not None else 500
             return Response({"error": "Error HTTP al crear cita en GHL", "details": details}, status=code)
+        except GHLUnavailable as e:
+            return _ghl_unavailable(e)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error conexión GHL", "details": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({"error": "Error interno", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@csrf_exempt
-@api_view(['POST'])
-def ghl_webhook(request):
+class AppointmentBulkCreateView(APIView):
     """
-    Endpoint público que recibe los webhooks de GHL.
-    Maneja AppointmentCreate, AppointmentUpdate y AppointmentDelete.
+    Crear muchas citas en una sola llamada (POST /api/appointments/bulk/).
+    Se validan todas antes de llamar a GHL; si alguna es inválida no se envía ninguna.
     """
-    event = request.data or {}
-    print("=== Webhook recibido de GHL ===")
-    print(json.dumps(event, indent=2, ensure_ascii=False))
-
-    # Payload típico: { "type": "...", "locationId": "...", "appointment": { ... } }
-    appointment_data = event.get("appointment") if "appointment" in event else event
-    event_type = event.get("type") or request.headers.get("X-GHL-Event")
-    ghl_id = appointment_data.get("id") if isinstance(appointment_data, dict) else None
-
-    # location puede venir en la raíz o dentro de appointment
-    location_id = event.get("locationId") or (appointment_data.get("locationId") if isinstance(appointment_data, dict) else None) or GHL_LOCATION_ID
-
-    # Validaciones básicas
-    if not isinstance(appointment_data, dict) or not ghl_id:
-        return Response({"error": "Payload inválido: no se encontró appointment.id"}, status=status.HTTP_400_BAD_REQUEST)
+    @idempotency.idempotent("appointments.bulk")
+    def post(self, request, *args, **kwargs):
+        data = request.data
+        items = data.get("appointments") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Enviar una lista de citas en 'appointments'"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.GHL_BULK_MAX_ITEMS:
+            return Response({"error": f"Máximo {settings.GHL_BULK_MAX_ITEMS} citas por llamada"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-    # convertir fechas si vienen
-    start_dt = _to_datetime(appointment_data.get("startTime"))
-    end_dt = _to_datetime(appointment_data.get("endTime"))
-    date_added_dt = _to_datetime(appointment_data.get("dateAdded"))
-    date_updated_dt = _to_datetime(appointment_data.get("dateUpdated"))
+        payloads, errors = [], []
+        validate_slots = _wants_slot_validation(request)
+        for index, item in enumerate(items):
+            api_payload, location_id, error = _build_create_payload(item)
+            conflicts = _slot_conflicts(api_payload) if not error and validate_slots else []
+            if error:
+                errors.append(dict(error, index=index))
+            elif conflicts:
+                errors.append({"error": "El horario se cruza con otra cita", "conflicts": conflicts, "index": index})
+            else:
+                payloads.append((api_payload, location_id))
+        if errors:
+            return Response({"error": "Citas inválidas", "items": errors}, status=status.HTTP_400_BAD_REQUEST)
+        for location_id in {location_id for _, location_id in payloads}:
+            missing = _missing_credentials(location_id)
+            if missing:
+                return missing
 
-    try:
-        # === DELETE / CANCEL ===
-        if event_type == "AppointmentDelete" or appointment_data.get("appointmentStatus") == "cancelled":
-            # Opción 1: marcar como cancelada
-            Appointment.objects.filter(ghl_id=ghl_id).update(appointment_status="cancelled")
-            print("🟡 Marcada como cancelled en BD:", ghl_id)
+        results = bulk.create_many(payloads)
+        created = sum(1 for r in results if r["status"] == 201)
+        return Response({"created": created, "failed": len(results) - created, "results": results},
+                        status=status.HTTP_200_OK)
 
-            # Opción 2 (si prefieres borrarla de la tabla)
-            # Appointment.objects.filter(ghl_id=ghl_id).delete()
-            # print("❌ Eliminada de la BD:", ghl_id)
 
-            return Response({"status": "cancelled", "ghl_id": ghl_id}, status=status.HTTP_200_OK)
+@csrf_exempt
+@api_view(['POST'])
+def ghl_webhook(request):
+    """
+    Endpoint público que recibe los webhooks de GHL.
+    Maneja AppointmentCreate, AppointmentUpdate y AppointmentDelete.
 
-        # === CREATE / UPDATE ===
-        if event_type in ["AppointmentCreate", "AppointmentUpdate"] or appointment_data.get("id"):
-            appointment, created = Appointment.objects.update_or_create(
-                ghl_id=ghl_id,
-                defaults={
-                    "location_id": location_id,
-                    "calendar_id": appointment_data.get("calendarId"),
-                    "contact_id": appointment_data.get("contactId"),
-                    "title": appointment_data.get("title"),
-                    "appointment_status": appointment_data.get("appointmentStatus"),
-                    "assigned_user_id": appointment_data.get("assignedUserId"),
-                    "notes": appointment_data.get("notes") or None,
-                    "start_time": start_dt,
-                    "end_time": end_dt,
-                    "source": appointment_data.get("source"),
-                    "date_added": date_added_dt,
-                    "date_updated": date_updated_dt,
-                }
-            )
-            print("✅ Guardada/actualizada en MySQL:", appointment.ghl_id)
-            return Response({"status": "ok", "ghl_id": ghl_id}, status=status.HTTP_200_OK)
+    Con GHL_WEBHOOK_MODE=deferred solo se guarda el evento en el inbox y se
+    responde 202; `manage.py process_webhooks` lo aplica después por lotes.
+    """
+    body, code = webhooks.handle(request.data or {}, request.headers.get("X-GHL-Event"))
+    return Response(body, status=code)
 
-        # === Evento no esperado ===
-        print("⚠️ Evento no manejado:", event_type)
-        return Response({"status": "ignored", "event_type": event_type}, status=status.HTTP_200_OK)
+@api_view(['GET'])
+def ghl_webhook_stats(request):
+    """Contadores de webhooks aplicados/descartados (por proceso) y tamaño del inbox."""
+    stats = webhooks.stats_snapshot()
+    stats["inbox_pending"] = WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING).count()
+    return Response(stats)
 
-    except Exception as e:
-        print("❌ Error al procesar webhook:", str(e))
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class AppointmentUpdateView(APIView):
     """Actualizar cita en GHL y sincronizar BD local."""
     def put(self, request, appointment_id):
-        if not GHL_API_KEY:
-            return Response({"error": "Falta GHL_API_KEY en servidor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
         # Verificar que la cita existe en la BD local
         appointment = Appointment.objects.filter(ghl_id=appointment_id).first()
         if not appointment:
             return Response({"error": "Cita no encontrada en la base de datos local"}, status=status.HTTP_404_NOT_FOUND)
         
-        location_id = appointment.location_id or GHL_LOCATION_ID
-        if not location_id:
-            return Response({"error": "No se encontró locationId para la cita"}, status=status.HTTP_400_BAD_REQUEST)
-
-        headers = {
-            "Authorization": f"Bearer {GHL_API_KEY}",
-            "Version": GHL_API_VERSION,
-            "Content-Type": "application/json",
-            "LocationId": location_id
-        }
-        url = f"{GHL_BASE_URL}/calendars/events/appointments/{appointment_id}"
-
-        # Preparar el payload para GHL con todos los campos requeridos
-        ghl_payload = {
-            "calendarId": appointment.calendar_id,
-            "locationId": location_id,
-            "contactId": appointment.contact_id,
-            "assignedUserId": appointment.assigned_user_id or GHL_DEFAULT_ASSIGNED_USER_ID,
-            "appointmentStatus": appointment.appointment_status,
-            "toNotify": True,
-            "ignoreFreeSlotValidation": True
-        }
-
-        # Actualizar solo los campos que se envían en el request
-        if "title" in request.data:
-            ghl_payload["title"] = request.data["title"]
-        if "startTime" in request.data:
-            ghl_payload["startTime"] = request.data["startTime"]
-        if "endTime" in request.data:
-            ghl_payload["endTime"] = request.data["endTime"]
-        if "appointmentStatus" in request.data:
-            ghl_payload["appointmentStatus"] = request.data["appointmentStatus"]
-        if "assignedUserId" in request.data:
-            ghl_payload["assignedUserId"] = request.data["assignedUserId"]
-        if "notes" in request.data:
-            ghl_payload["notes"] = request.data["notes"]
+        ghl_payload, location_id, error = _build_update_payload(appointment, request.data)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+        precheck = _precheck_write(request, OutboundSync.OP_UPDATE, ghl_payload, location_id, appointment)
+        if precheck:
+            return Response(*precheck)
 
         try:
-            print(f"Enviando PUT a GHL: {url}")
-            print(f"Payload: {json.dumps(ghl_payload, indent=2)}")
-            
-            resp = requests.put(url, headers=headers, json=ghl_payload, timeout=15)
-            print(f"Respuesta GHL - Status: {resp.status_code}")
-            print(f"Respuesta GHL - Body: {resp.text}")
-            
-            resp.raise_for_status()
-
-            # Algunas respuestas PUT de GHL pueden devolver 204 o cuerpo vacío.
-            response_has_body = bool(resp.content and resp.content.strip())
-            if response_has_body:
-                try:
-                    data = resp.json()
-                except ValueError:
-                    # Cuerpo no JSON; usar payload enviado como fuente de verdad
-                    data = {}
-            else:
-                data = {}
-
-            # Fallback a los valores enviados si el body viene vacío
-            merged = {
-                "title": data.get("title", ghl_payload.get("title", appointment.title)),
-                "appointmentStatus": data.get("appointmentStatus", ghl_payload.get("appointmentStatus", appointment.appointment_status)),
-                "assignedUserId": data.get("assignedUserId", ghl_payload.get("assignedUserId", appointment.assigned_user_id)),
-                "notes": data.get("notes", ghl_payload.get("notes", appointment.notes)),
-                "startTime": data.get("startTime", ghl_payload.get("startTime")),
-                "endTime": data.get("endTime", ghl_payload.get("endTime")),
-            }
-
-            start_dt = _to_datetime(merged.get("startTime"))
-            end_dt = _to_datetime(merged.get("endTime"))
-
-            # Solo actualizar campos que no sean None para evitar errores de constraint
-            update_data = {}
-            if merged.get("title") is not None:
-                update_data["title"] = merged.get("title")
-            if merged.get("appointmentStatus") is not None:
-                update_data["appointment_status"] = merged.get("appointmentStatus")
-            if merged.get("assignedUserId") is not None:
-                update_data["assigned_user_id"] = merged.get("assignedUserId")
-            if merged.get("notes") is not None:
-                update_data["notes"] = merged.get("notes")
-            if start_dt is not None:
-                update_data["start_time"] = start_dt
-            if end_dt is not None:
-                update_data["end_time"] = end_dt
-
-            if update_data:
-                Appointment.objects.filter(ghl_id=appointment_id).update(**update_data)
-
-            # Devolver lo mejor posible: si no hay body, devolver merged y 200
-            return Response(data if response_has_body else merged, status=resp.status_code if response_has_body else status.HTTP_200_OK)
+            body, code = services.update_appointment(appointment, ghl_payload, location_id)
+            return Response(body, status=code)
         except requests.exceptions.HTTPError as http_err:
             resp = http_err.response
             details = resp.text if resp is not None else str(http_err)
             code = resp.status_code if resp is not None else 500
             return Response({"error": "Error al actualizar cita en GHL", "details": details}, status=code)
+        except GHLUnavailable as e:
+            return _ghl_unavailable(e)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error al actualizar cita en GHL", "details": str(e)}, status=500)
         except Exception as e:
@@ -313,55 +294,60 @@ class AppointmentUpdateView(APIView):
 class AppointmentDeleteView(APIView):
     """Cancelar cita en GHL (PUT appointmentStatus=cancelled)."""
     def delete(self, request, appointment_id):
-        if not GHL_API_KEY:
-            return Response({"error": "Falta GHL_API_KEY en servidor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        appointment = Appointment.objects.filter(ghl_id=appointment_id).first()
-        location_id = appointment.location_id if appointment else GHL_LOCATION_ID
-
-        headers = {
-            "Authorization": f"Bearer {GHL_API_KEY}",
-            "Version": GHL_API_VERSION,
-            "Content-Type": "application/json",
-            "LocationId": location_id
-        }
-        url = f"{GHL_BASE_URL}/calendars/events/appointments/{appointment_id}"
-
-        payload = {"appointmentStatus": "cancelled"}
+        appointment = (Appointment.objects.filter(ghl_id=appointment_id).first()
+                       or ArchivedAppointment.objects.filter(ghl_id=appointment_id).first())
+        location_id = appointment.location_id if appointment else settings.GHL_LOCATION_ID
+        missing = _missing_credentials(location_id)
+        if missing:
+            return missing
+
+        if outbox.wants_async(request):
+            item = outbox.enqueue(OutboundSync.OP_DELETE, location_id, {"appointmentStatus": "cancelled"},
+                                  ghl_id=appointment_id)
+            return Response(outbox.accepted_body(item), status=status.HTTP_202_ACCEPTED)
 
         try:
-            resp = requests.put(url, headers=headers, json=payload, timeout=15)
-            print("PUT GHL status:", resp.status_code)
-            print("PUT GHL body:", resp.text)
-            resp.raise_for_status()
-            # Actualizar BD local
-            Appointment.objects.filter(ghl_id=appointment_id).update(appointment_status="cancelled")
-            return Response({"message": "Cita cancelada correctamente"}, status=resp.status_code)
+            code = services.cancel_appointment(appointment_id, location_id)
+            return Response({"message": "Cita cancelada correctamente"}, status=code)
+        except GHLUnavailable as e:
+            return _ghl_unavailable(e)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error al cancelar cita en GHL", "details": str(e)}, status=500)
 
+
+def _existing_contact(contact, matching_field):
+    """Respuesta para un contacto que ya existe (409 como el error de GHL, o 200 según CONTACT_DEDUP_RESPONSE)."""
+    if settings.CONTACT_DEDUP_RESPONSE == "200":
+        return Response({
+            "message": "El contacto ya existía",
+            "contact": ContactSerializer(contact).data,
+            "duplicate_field": matching_field,
+        }, status=status.HTTP_200_OK)
+    return Response({
+        "error": "Este contacto ya existe",
+        "details": f"Ya existe un contacto con el mismo {matching_field}",
+        "existing_contact_id": contact.ghl_id,
+        "duplicate_field": matching_field,
+    }, status=status.HTTP_409_CONFLICT)
+
+
 class ContactCreateView(APIView):
     """Crear un contacto ficticio en GHL y guardarlo en la BD local."""
+    @idempotency.idempotent("contacts.create")
     def post(self, request, *args, **kwargs):
-        if not GHL_API_KEY:
-            return Response({"error": "Falta GHL_API_KEY en servidor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
         data = request.data or {}
         required_fields = ["firstName", "lastName"]
         for field in required_fields:
             if field not in data:
                 return Response({"error": f"Falta el campo: {field}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        location_id = data.get("locationId") or GHL_LOCATION_ID
+        location_id = data.get("locationId") or settings.GHL_LOCATION_ID
         if not location_id:
             return Response({"error": "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"},
                             status=status.HTTP_400_BAD_REQUEST)
-
-        headers = {
-            "Authorization": f"Bearer {GHL_API_KEY}",
-            "Version": GHL_API_VERSION,
-            "Content-Type": "application/json",
-            "LocationId": location_id
-        }
+        missing = _missing_credentials(location_id)
+        if missing:
+            return missing
 
         # Preparar payload para GHL
         api_payload = {
@@ -376,15 +362,21 @@ class ContactCreateView(APIView):
 
         # Remover campos None del payload
         api_payload = {k: v for k, v in api_payload.items() if v is not None}
-        
-        print(f"🔍 Payload enviado a GHL: {api_payload}")
+
+        # Duplicado conocido localmente: responder sin ir a GHL
+        if settings.CONTACT_DEDUP_ENABLED:
+            existing, matching_field = dedup.find_duplicate(location_id, data.get("email"), data.get("phone"))
+            if existing is not None:
+                return _existing_contact(existing, matching_field)
+
+        payload_logger.debug("POST contacto a GHL", extra={"payload": Redacted(api_payload)})
 
         try:
-            resp = requests.post(f"{GHL_BASE_URL}/contacts/", json=api_payload, headers=headers, timeout=15)
+            resp = get_ghl_client(location_id).post("/contacts/", location_id, json=api_payload)
             resp.raise_for_status()
             ghl_data = resp.json()
             
-            print(f"🔍 Respuesta de GHL: {ghl_data}")
+            payload_logger.debug("respuesta GHL", extra={"status": resp.status_code, "payload": Redacted(ghl_data)})
             
             # Extraer datos del contacto de la respuesta de GHL
             contact_data = ghl_data.get("contact", {})
@@ -408,6 +400,7 @@ class ContactCreateView(APIView):
                     "source": contact_data.get("source") or data.get("source", "API")
                 }
             )
+            services.link_contact_appointments([contact.ghl_id])
 
             serializer = ContactSerializer(contact)
             return Response({
@@ -442,18 +435,248 @@ class ContactCreateView(APIView):
                     }, status=status.HTTP_409_CONFLICT)
             
             return Response({"error": "Error HTTP al crear contacto en GHL", "details": details}, status=code)
+        except GHLUnavailable as e:
+            return _ghl_unavailable(e)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error conexión GHL", "details": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({"error": "Error interno", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ContactListView(ListAPIView):
-    """Listar todos los contactos de la BD local."""
+class ContactMatchView(APIView):
+    """
+    Cruza muchos candidatos {email, phone} con los contactos locales de una
+    location (POST /api/contacts/match/) sin llamar a GHL.
+    """
+    def post(self, request, *args, **kwargs):
+        data = request.data if isinstance(request.data, dict) else {}
+        candidates = data.get("candidates")
+        if not isinstance(candidates, list) or not all(isinstance(c, dict) for c in candidates):
+            return Response({"error": "Enviar una lista de objetos {email, phone} en 'candidates'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(candidates) > settings.CONTACT_MATCH_MAX_ITEMS:
+            return Response({"error": f"Máximo {settings.CONTACT_MATCH_MAX_ITEMS} candidatos por llamada"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        location_id = data.get("locationId") or settings.GHL_LOCATION_ID
+        if not location_id:
+            return Response({"error": "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = dedup.match_many(location_id, candidates)
+        matched = sum(1 for r in results if r["matched"])
+        return Response({"location_id": location_id, "matched": matched, "results": results})
+
+
+class ContactListView(caching.CachedReadMixin, fastread.FastListMixin, ListAPIView):
+    """Listar contactos de una location (paginado por cursor, filtros en query params)."""
+    cache_namespace = caching.CONTACTS
+    renderer_classes = renderers.READ_RENDERER_CLASSES
     queryset = Contact.objects.all().order_by('-date_added')
     serializer_class = ContactSerializer
+    pagination_class = ContactCursorPagination
+
+    def get_queryset(self):
+        return filter_contacts(super().get_queryset(), tenancy.scoped_params(self.request))
+
+
+class ContactSearchView(ContactListView):
+    """
+    Buscar contactos (GET /api/contacts/search/?q=): nombre/apellido por
+    prefijo, o email/teléfono normalizados. Admite los mismos filtros del listado.
+    """
+
+    def get_queryset(self):
+        return search.search_contacts(super().get_queryset(), search_term(self.request.query_params))
 
 
-class AppointmentListView(ListAPIView):
+class ContactDetailView(caching.CachedReadMixin, RetrieveAPIView):
+    """Detalle de un contacto por ghl_id (GET /api/contacts/<id>/)."""
+    cache_namespace = caching.CONTACTS
+    cache_lookup_kwarg = 'contact_id'
+    renderer_classes = renderers.READ_RENDERER_CLASSES
+    queryset = Contact.objects.all()
+    serializer_class = ContactSerializer
+    lookup_field = 'ghl_id'
+    lookup_url_kwarg = 'contact_id'
+
+
+class AppointmentListView(caching.CachedReadMixin, fastread.FastListMixin, ListAPIView):
+    """
+    Listar citas de una location (paginado por cursor, filtros en query params).
+    Con ?expand=contact embebe el contacto con un JOIN (sin una consulta por fila).
+    """
+    cache_namespace = caching.APPOINTMENTS
+    renderer_classes = renderers.READ_RENDERER_CLASSES
     queryset = Appointment.objects.all().order_by('-start_time')
     serializer_class = AppointmentSerializer
+    pagination_class = AppointmentCursorPagination
+
+    def _expand_contact(self):
+        return self.request.query_params.get("expand") == "contact"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self._expand_contact():
+            queryset = queryset.select_related('contact_ref')
+        return filter_appointments(queryset, tenancy.scoped_params(self.request))
+
+    def get_serializer_class(self):
+        if self._expand_contact():
+            return AppointmentWithContactSerializer
+        return AppointmentSerializer
+
+
+class AppointmentSearchView(AppointmentListView):
+    """Buscar citas por título/notas (GET /api/appointments/search/?q=), con los filtros del listado."""
+
+    def get_queryset(self):
+        return search.search_appointments(super().get_queryset(), search_term(self.request.query_params))
+
+
+class AppointmentArchiveListView(AppointmentListView):
+    """
+    Listar citas archivadas de una location (GET /api/appointments/archive/),
+    con los filtros y la paginación del listado (sin ?expand=contact).
+    """
+    queryset = ArchivedAppointment.objects.all().order_by('-start_time')
+
+    def _expand_contact(self):
+        return False
+
+    def get_serializer_class(self):
+        return ArchivedAppointmentSerializer
+
+
+class AppointmentDetailView(caching.CachedReadMixin, RetrieveAPIView):
+    """Detalle de una cita por ghl_id (GET /api/appointments/<id>/), también si está archivada."""
+    cache_namespace = caching.APPOINTMENTS
+    cache_lookup_kwarg = 'appointment_id'
+    renderer_classes = renderers.READ_RENDERER_CLASSES
+    queryset = Appointment.objects.all()
+    serializer_class = AppointmentSerializer
+    lookup_field = 'ghl_id'
+    lookup_url_kwarg = 'appointment_id'
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            return get_object_or_404(ArchivedAppointment, ghl_id=self.kwargs['appointment_id'])
+
+    def get_serializer(self, instance=None, *args, **kwargs):
+        if isinstance(instance, ArchivedAppointment):
+            kwargs.setdefault('context', self.get_serializer_context())
+            return ArchivedAppointmentSerializer(instance, *args, **kwargs)
+        return super().get_serializer(instance, *args, **kwargs)
+
+
+class AvailabilityView(APIView):
+    """
+    Horarios libres según las citas locales (GET /api/availability/).
+    Params: calendar_id y/o assigned_user_id, start, end (ISO8601), duration y
+    step en minutos (por defecto 30 y = duration).
+    """
+    def get(self, request):
+        params = request.query_params
+        calendar_id = params.get("calendar_id")
+        user_id = params.get("assigned_user_id")
+        if not calendar_id and not user_id:
+            return Response({"error": "Indicar calendar_id o assigned_user_id"}, status=status.HTTP_400_BAD_REQUEST)
+        start = services._to_datetime(params.get("start"))
+        end = services._to_datetime(params.get("end"))
+        if start is None or end is None or end <= start:
+            return Response({"error": "start y end deben ser fechas ISO8601 con start < end"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            duration = timedelta(minutes=int(params.get("duration", 30)))
+            step = timedelta(minutes=int(params["step"])) if params.get("step") else None
+        except ValueError:
+            return Response({"error": "duration y step deben ser minutos enteros"}, status=status.HTTP_400_BAD_REQUEST)
+        if duration.total_seconds() <= 0 or (step is not None and step.total_seconds() <= 0):
+            return Response({"error": "duration y step deben ser mayores que 0"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start) / (step or duration) > settings.SLOTS_MAX_RESULTS:
+            return Response({"error": f"Ventana demasiado grande (máx. {settings.SLOTS_MAX_RESULTS} huecos)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            busy, slots = availability.get_index().free_slots(
+                start, end, duration, step, calendar_id=calendar_id, assigned_user_id=user_id
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "calendar_id": calendar_id,
+            "assigned_user_id": user_id,
+            "busy": [{"start": s, "end": e} for s, e in busy],
+            "slots": [{"start": s, "end": e} for s, e in slots],
+        })
+
+
+class AvailabilityCheckView(APIView):
+    """
+    ¿Se cruza esta cita con otra? (GET /api/availability/check/?calendar_id=&start=&end=).
+    `exclude` omite una cita (la que se está editando).
+    """
+    def get(self, request):
+        params = request.query_params
+        calendar_id = params.get("calendar_id")
+        user_id = params.get("assigned_user_id")
+        start = services._to_datetime(params.get("start"))
+        end = services._to_datetime(params.get("end"))
+        if (not calendar_id and not user_id) or start is None or end is None or end <= start:
+            return Response({"error": "Indicar calendar_id o assigned_user_id, y start < end en ISO8601"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            conflicts = availability.get_index().conflicts(
+                start, end, calendar_id=calendar_id, assigned_user_id=user_id, exclude=params.get("exclude")
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"available": not conflicts, "conflicts": conflicts})
+
+
+class AppointmentStatsView(APIView):
+    """
+    Citas por día para dashboards (GET /api/appointments/stats/).
+
+    Query params: start/end (YYYY-MM-DD, end exclusivo), location_id (o
+    cabecera X-Location-Id), filtros exactos por calendar_id,
+    assigned_user_id y appointment_status, y
+    group_by (por defecto calendar_id,assigned_user_id,appointment_status).
+    Sale del resumen AppointmentRollup; con ?live=1 (o ROLLUPS_ENABLED=False)
+    se calcula con un GROUP BY sobre la tabla de citas.
+    """
+
+    def get(self, request):
+        live = request.query_params.get("live", "").lower() in ("1", "true", "yes") or not settings.ROLLUPS_ENABLED
+        try:
+            results = rollups.daily_counts(tenancy.scoped_params(request), live=live)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "source": "live" if live else "rollup",
+            "total": sum(row["count"] for row in results),
+            "results": results,
+        })
+
+
+@api_view(['GET'])
+def read_cache_stats(request):
+    """Aciertos, fallos, 304 y ratio de aciertos de la caché de lecturas (por proceso)."""
+    return Response(caching.stats_snapshot())
+
+
+@require_GET
+def metrics_view(request):
+    """Métricas de todos los procesos en formato de texto de Prometheus (GET /metrics)."""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    body = metrics.render(metrics.collect(), metrics.queue_depths())
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class OutboundSyncDetailView(RetrieveAPIView):
+    """Estado de un cambio encolado en modo async (GET /api/sync/<id>/)."""
+    queryset = OutboundSync.objects.all()
+    serializer_class = OutboundSyncSerializer
@@ -0,0 +1,407 @@
+# appointments/webhooks.py
+# Procesamiento de webhooks de GHL: normalización del payload y consumo por
+# lotes del inbox (WebhookEvent) con bulk upserts sobre Appointment.ghl_id.
+#
+# Cada evento se versiona con su dateUpdated y una huella (webhookId o hash
+# del contenido): los eventos viejos o repetidos se descartan sin escribir.
+#
+# Las citas archivadas (archive.py) también se versionan: una cancelación se
+# marca en el archivo y un upsert restaura la cita a Appointment antes de escribir.
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import archive, caching, metrics, rollups
+from .logs import Redacted
+from .models import Appointment, ArchivedAppointment, WebhookEvent
+from .services import _to_datetime, resolve_contact_refs
+
+logger = logging.getLogger(__name__)
+payload_logger = logging.getLogger("appointments.payload")
+
+CANCEL_EVENT = "AppointmentDelete"
+UPSERT_EVENTS = ("AppointmentCreate", "AppointmentUpdate")
+
+# Campos que un webhook reescribe en un upsert (date_added conserva la fecha de alta local)
+UPSERT_FIELDS = [
+    "location_id",
+    "calendar_id",
+    "contact_id",
+    "title",
+    "appointment_status",
+    "assigned_user_id",
+    "notes",
+    "start_time",
+    "end_time",
+    "source",
+    "date_updated",
+    "ghl_date_updated",
+    "last_event_fingerprint",
+]
+REQUIRED_FIELDS = ["location_id", "calendar_id", "contact_id", "title", "appointment_status", "start_time", "end_time"]
+
+
+OUTCOME_APPLIED = "applied"
+OUTCOME_STALE = "skipped_stale"
+OUTCOME_DUPLICATE = "skipped_duplicate"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record(outcome, count=1, event_type=None):
+    """Suma `count` al contador de resultados de webhooks (por proceso) y a la métrica por tipo."""
+    with _stats_lock:
+        _stats[outcome] += count
+    metrics.inc("webhook_events_total", count, type=metrics.webhook_type(event_type), outcome=outcome)
+
+
+def stats_snapshot():
+    with _stats_lock:
+        snapshot = {OUTCOME_APPLIED: 0, OUTCOME_STALE: 0, OUTCOME_DUPLICATE: 0}
+        snapshot.update(_stats)
+    return snapshot
+
+
+def fingerprint(event, appointment_data):
+    """Id del evento si GHL lo envía; si no, hash estable del contenido de la cita."""
+    event_id = event.get("webhookId") or event.get("eventId")
+    if event_id:
+        return str(event_id)[:64]
+    raw = json.dumps(appointment_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def check_version(parsed, stored):
+    """
+    Compara el evento con la versión guardada (ghl_date_updated, last_event_fingerprint).
+    Devuelve None si debe aplicarse, o el motivo para descartarlo.
+    """
+    if stored is None:
+        return None
+    stored_version, stored_fingerprint = stored
+    if stored_fingerprint and stored_fingerprint == parsed["fingerprint"]:
+        return OUTCOME_DUPLICATE
+    version = parsed["version"]
+    if version is not None and stored_version is not None and version < stored_version:
+        return OUTCOME_STALE
+    return None
+
+
+def stored_versions(ghl_ids):
+    """{ghl_id: (ghl_date_updated, last_event_fingerprint)} de las citas existentes (o archivadas)."""
+    versions = {}
+    for model in (Appointment, ArchivedAppointment):
+        missing = [g for g in ghl_ids if g not in versions]
+        if not missing:
+            break
+        rows = model.objects.filter(ghl_id__in=missing).values_list(
+            "ghl_id", "ghl_date_updated", "last_event_fingerprint"
+        )
+        versions.update((ghl_id, (version, fp)) for ghl_id, version, fp in rows)
+    return versions
+
+
+def mark_cancelled(ghl_id, fields):
+    """Marca la cita como cancelada en Appointment o, si no está, en el archivo."""
+    if not Appointment.objects.filter(ghl_id=ghl_id).update(appointment_status="cancelled", **fields):
+        ArchivedAppointment.objects.filter(ghl_id=ghl_id).update(appointment_status="cancelled", **fields)
+
+
+def version_fields(parsed):
+    """Campos de versión a escribir junto con el cambio."""
+    # date_updated explícito: los .update() no disparan auto_now
+    fields = {"last_event_fingerprint": parsed["fingerprint"], "date_updated": timezone.now()}
+    if parsed["version"] is not None:
+        fields["ghl_date_updated"] = parsed["version"]
+    return fields
+
+
+def parse_event(event, header_event_type=None):
+    """
+    Normaliza un webhook de GHL.
+
+    Payload típico: { "type": "...", "locationId": "...", "appointment": { ... } }
+    Devuelve None si no hay appointment.id; si no, un dict con event_type,
+    ghl_id, is_cancel y los valores del modelo (`defaults`).
+    """
+    if not isinstance(event, dict):
+        return None
+    appointment_data = event.get("appointment") if "appointment" in event else event
+    if not isinstance(appointment_data, dict) or not appointment_data.get("id"):
+        return None
+
+    event_type = event.get("type") or header_event_type
+    # location puede venir en la raíz o dentro de appointment
+    location_id = event.get("locationId") or appointment_data.get("locationId") or settings.GHL_LOCATION_ID
+    date_updated_dt = _to_datetime(appointment_data.get("dateUpdated"))
+
+    return {
+        "event_type": event_type,
+        "ghl_id": appointment_data["id"],
+        "is_cancel": event_type == CANCEL_EVENT or appointment_data.get("appointmentStatus") == "cancelled",
+        "version": date_updated_dt,
+        "fingerprint": fingerprint(event, appointment_data),
+        "defaults": {
+            "location_id": location_id,
+            "calendar_id": appointment_data.get("calendarId"),
+            "contact_id": appointment_data.get("contactId"),
+            "title": appointment_data.get("title"),
+            "appointment_status": appointment_data.get("appointmentStatus"),
+            "assigned_user_id": appointment_data.get("assignedUserId"),
+            "notes": appointment_data.get("notes") or None,
+            "start_time": _to_datetime(appointment_data.get("startTime")),
+            "end_time": _to_datetime(appointment_data.get("endTime")),
+            "source": appointment_data.get("source"),
+            "date_added": _to_datetime(appointment_data.get("dateAdded")),
+            "date_updated": date_updated_dt,
+        },
+    }
+
+
+def enqueue(event, header_event_type=None):
+    """Guarda el webhook crudo en el inbox. Devuelve el WebhookEvent o None si es inválido."""
+    parsed = parse_event(event, header_event_type)
+    if parsed is None:
+        return None
+    return WebhookEvent.objects.create(
+        event_type=parsed["event_type"],
+        ghl_id=parsed["ghl_id"],
+        payload=event,
+    )
+
+
+def handle(event, header_event_type=None):
+    """
+    Atiende un webhook recibido por HTTP y devuelve (body, status_code).
+
+    Con GHL_WEBHOOK_MODE=deferred solo se guarda el evento en el inbox (202);
+    si no, se aplica en el momento.
+    """
+    if settings.GHL_WEBHOOK_MODE == "deferred":
+        queued = enqueue(event, header_event_type)
+        if queued is None:
+            _count_rejected(event, header_event_type)
+            return {"error": "Payload inválido: no se encontró appointment.id"}, 400
+        metrics.inc("webhook_events_total", type=metrics.webhook_type(queued.event_type), outcome="queued")
+        return {"status": "queued", "ghl_id": queued.ghl_id}, 202
+
+    payload_logger.debug("webhook recibido de GHL", extra={"payload": Redacted(event)})
+
+    # Validaciones básicas
+    parsed = parse_event(event, header_event_type)
+    if parsed is None:
+        _count_rejected(event, header_event_type)
+        return {"error": "Payload inválido: no se encontró appointment.id"}, 400
+
+    ghl_id = parsed["ghl_id"]
+    event_type = parsed["event_type"]
+
+    try:
+        # === Evento viejo (dateUpdated menor al guardado) o repetido: no escribir ===
+        skip = check_version(parsed, stored_versions([ghl_id]).get(ghl_id))
+        if skip:
+            record(skip, event_type=event_type)
+            return {"status": skip, "ghl_id": ghl_id}, 200
+
+        # === DELETE / CANCEL ===
+        if parsed["is_cancel"]:
+            # Opción 1: marcar como cancelada
+            with rollups.tracking([ghl_id]):
+                mark_cancelled(ghl_id, version_fields(parsed))
+            caching.invalidate_appointments([ghl_id])
+            record(OUTCOME_APPLIED, event_type=event_type)
+            logger.debug("cita marcada como cancelled", extra={"ghl_id": ghl_id})
+
+            # Opción 2 (si prefieres borrarla de la tabla)
+            # Appointment.objects.filter(ghl_id=ghl_id).delete()
+            # logger.debug("cita eliminada", extra={"ghl_id": ghl_id})
+
+            return {"status": "cancelled", "ghl_id": ghl_id}, 200
+
+        # === CREATE / UPDATE ===
+        if event_type in UPSERT_EVENTS or ghl_id:
+            with rollups.tracking([ghl_id]), caching.tracking(caching.APPOINTMENTS, [ghl_id]):
+                archive.restore([ghl_id])
+                appointment, created = Appointment.objects.update_or_create(
+                    ghl_id=ghl_id, defaults={**parsed["defaults"], **version_fields(parsed)}
+                )
+            resolve_contact_refs([ghl_id])
+            record(OUTCOME_APPLIED, event_type=event_type)
+            logger.debug("cita guardada", extra={"ghl_id": appointment.ghl_id, "created": created})
+            return {"status": "ok", "ghl_id": ghl_id}, 200
+
+        # === Evento no esperado ===
+        metrics.inc("webhook_events_total", type="ignored", outcome="ignored")
+        logger.warning("evento de webhook no manejado", extra={"event_type": event_type})
+        return {"status": "ignored", "event_type": event_type}, 200
+
+    except Exception as e:
+        metrics.inc("webhook_events_total", type=metrics.webhook_type(event_type), outcome="error")
+        logger.exception("error al procesar webhook", extra={"ghl_id": ghl_id, "event_type": event_type})
+        return {"error": str(e)}, 500
+
+
+def _count_rejected(event, header_event_type):
+    event_type = event.get("type") if isinstance(event, dict) else None
+    metrics.inc("webhook_events_total", type=metrics.webhook_type(event_type or header_event_type), outcome="invalid")
+
+
+def claim_batch(limit):
+    """
+    Reserva hasta `limit` eventos pendientes (en orden de llegada) con un
+    batch_id único. También recupera los que quedaron en processing por un
+    consumidor caído (locked_at más viejo que GHL_WEBHOOK_LOCK_TIMEOUT).
+    """
+    batch_id = uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.GHL_WEBHOOK_LOCK_TIMEOUT)
+    claimable = Q(status=WebhookEvent.STATUS_PENDING) | Q(status=WebhookEvent.STATUS_PROCESSING, locked_at__lt=stale)
+    pks = list(WebhookEvent.objects.filter(claimable).order_by("id").values_list("id", flat=True)[:limit])
+    if not pks:
+        return batch_id, []
+    WebhookEvent.objects.filter(claimable, pk__in=pks).update(
+        status=WebhookEvent.STATUS_PROCESSING, batch_id=batch_id, locked_at=now, attempts=F("attempts") + 1
+    )
+    return batch_id, list(WebhookEvent.objects.filter(batch_id=batch_id).order_by("id"))
+
+
+def _fold(events):
+    """
+    Reduce los eventos del lote a una operación final por ghl_id.
+
+    Un upsert seguido de una cancelación dentro del mismo lote se guarda ya
+    cancelado; una cancelación sin upsert previo solo marca la fila existente.
+    Los eventos viejos o repetidos (contra la BD o contra el propio lote) se
+    descartan. Devuelve (upserts, cancels, failed, outcomes) donde cancels es
+    {ghl_id: campos de versión}, failed es {pk: error} y outcomes cuenta
+    (resultado, tipo de evento).
+    """
+    parsed_events = [(event, parse_event(event.payload, event.event_type)) for event in events]
+    versions = stored_versions({parsed["ghl_id"] for _, parsed in parsed_events if parsed})
+
+    upserts, cancels, failed, outcomes = {}, {}, {}, Counter()
+    for event, parsed in parsed_events:
+        if parsed is None:
+            failed[event.pk] = "Payload inválido: no se encontró appointment.id"
+            continue
+        ghl_id = parsed["ghl_id"]
+        skip = check_version(parsed, versions.get(ghl_id))
+        if skip:
+            outcomes[skip, parsed["event_type"]] += 1
+            continue
+        previous_version = versions.get(ghl_id, (None, None))[0]
+        if parsed["is_cancel"]:
+            if ghl_id in upserts:
+                upserts[ghl_id].update(version_fields(parsed), appointment_status="cancelled")
+            else:
+                cancels[ghl_id] = version_fields(parsed)
+        else:
+            missing = [f for f in REQUIRED_FIELDS if parsed["defaults"][f] is None]
+            if missing:
+                failed[event.pk] = f"Faltan campos obligatorios: {', '.join(missing)}"
+                continue
+            # bulk_create reescribe todas las columnas: conservar la versión si el evento no trae dateUpdated
+            upserts[ghl_id] = {**parsed["defaults"], "ghl_date_updated": previous_version, **version_fields(parsed)}
+            cancels.pop(ghl_id, None)
+        outcomes[OUTCOME_APPLIED, parsed["event_type"]] += 1
+        versions[ghl_id] = (parsed["version"] or previous_version, parsed["fingerprint"])
+    return upserts, cancels, failed, outcomes
+
+
+def apply_batch(events):
+    """Aplica un lote de eventos con un bulk upsert y un UPDATE por cancelación."""
+    upserts, cancels, failed, outcomes = _fold(events)
+    with (transaction.atomic(), rollups.tracking([*upserts, *cancels]),
+          caching.tracking(caching.APPOINTMENTS, [*upserts, *cancels])):
+        if upserts:
+            archive.restore(list(upserts))
+            Appointment.objects.bulk_create(
+                [Appointment(ghl_id=ghl_id, **fields) for ghl_id, fields in upserts.items()],
+                update_conflicts=True,
+                unique_fields=["ghl_id"],
+                update_fields=UPSERT_FIELDS,
+            )
+            resolve_contact_refs(list(upserts))
+        for ghl_id, fields in cancels.items():
+            mark_cancelled(ghl_id, fields)
+
+        now = timezone.now()
+        ok_pks = [e.pk for e in events if e.pk not in failed]
+        WebhookEvent.objects.filter(pk__in=ok_pks).update(status=WebhookEvent.STATUS_PROCESSED, processed_at=now)
+        for pk, error in failed.items():
+            WebhookEvent.objects.filter(pk=pk).update(status=WebhookEvent.STATUS_FAILED, error=error, processed_at=now)
+    for (outcome, event_type), count in outcomes.items():
+        record(outcome, count, event_type)
+    for event in events:
+        if event.pk in failed:
+            metrics.inc("webhook_events_total", type=metrics.webhook_type(event.event_type), outcome="invalid")
+    return len(ok_pks), len(failed)
+
+
+def _give_back(event, error):
+    """
+    Devuelve a pendiente un evento que falló al aplicarse o, si ya agotó
+    GHL_WEBHOOK_MAX_ATTEMPTS, lo deja fallido. Devuelve 1 si quedó fallido.
+    """
+    fields = {"error": str(error), "batch_id": None, "locked_at": None}
+    if event.attempts >= settings.GHL_WEBHOOK_MAX_ATTEMPTS:
+        WebhookEvent.objects.filter(pk=event.pk).update(
+            status=WebhookEvent.STATUS_FAILED, processed_at=timezone.now(), **fields
+        )
+        metrics.inc("webhook_events_total", type=metrics.webhook_type(event.event_type), outcome="error")
+        return 1
+    WebhookEvent.objects.filter(pk=event.pk).update(status=WebhookEvent.STATUS_PENDING, **fields)
+    return 0
+
+
+def _apply_one_by_one(events):
+    """Aplica los eventos de un lote fallido por separado. Devuelve (procesados, fallidos)."""
+    processed = failed = 0
+    for event in events:
+        try:
+            ok, ko = apply_batch([event])
+        except Exception as e:
+            logger.exception("error al aplicar webhook del inbox", extra={"ghl_id": event.ghl_id})
+            ok, ko = 0, _give_back(event, e)
+        processed += ok
+        failed += ko
+    return processed, failed
+
+
+def drain(batch_size=500, once=False, poll_interval=1.0, delete_processed=False):
+    """Consume el inbox por lotes. Con `once` termina al vaciarlo. Devuelve (procesados, fallidos)."""
+    processed = failed = 0
+    while True:
+        close_old_connections()
+        batch_id, events = claim_batch(batch_size)
+        if events:
+            try:
+                ok, ko = apply_batch(events)
+            except Exception as e:
+                if len(events) == 1:
+                    logger.exception("error al aplicar webhook del inbox", extra={"ghl_id": events[0].ghl_id})
+                    ok, ko = 0, _give_back(events[0], e)
+                else:
+                    # Un evento que falla no debe frenar al resto: aplicarlos de a uno
+                    logger.warning("lote de webhooks fallido, se aplica evento por evento",
+                                   extra={"batch_id": batch_id, "error": str(e)})
+                    ok, ko = _apply_one_by_one(events)
+            processed += ok
+            failed += ko
+            if delete_processed:
+                WebhookEvent.objects.filter(batch_id=batch_id, status=WebhookEvent.STATUS_PROCESSED).delete()
+            continue
+        if once:
+            return processed, failed
+        time.sleep(poll_interval)
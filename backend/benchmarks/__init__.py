@@ -0,0 +1,2 @@
+# Benchmarks y utilidades de carga (servidor GHL falso, datos sintéticos).
+# Se ejecutan desde backend/:  python -m benchmarks.<script>
@@ -0,0 +1,128 @@
+# benchmarks/bench_archive.py
+# Citas calientes y frías: tamaño de la tabla Appointment (con sus índices) y
+# latencia de los listados y exportaciones antes y después de mover las
+# citas viejas a ArchivedAppointment (archive.py), y cuántas filas/s archiva
+# `archive.run` con distintos tamaños de lote.
+#
+# El dataset cubre 2024-2025; se archiva como si hoy fuera --now, así con
+# ARCHIVE_AFTER_DAYS=180 queda caliente solo el último semestre.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_archive --appointments 500000 --repeat 20
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.harness import django_environment, latency_summary
+
+# Lecturas típicas (sin location, READS_REQUIRE_LOCATION=False en el harness)
+QUERIES = {
+    "listado_location": ("/api/appointments/", {"location_id": "loc-3"}),
+    "listado_calendario_estado": ("/api/appointments/", {"calendar_id": "cal-3-1", "appointment_status": "noshow"}),
+    "listado_contacto": ("/api/appointments/", {"contact_id": "contact-123"}),
+    "export_location": ("/api/appointments/export/", {"location_id": "loc-3"}),
+}
+
+
+def table_size(model):
+    """(filas, bytes de la tabla + sus índices) según dbstat de SQLite."""
+    from django.db import connection
+
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = %s AND type IN ('table', 'index'))",
+            [table],
+        )
+        size = cursor.fetchone()[0]
+    return {"rows": model.objects.count(), "mib": round(size / 2**20, 1)}
+
+
+def time_queries(client, repeat):
+    results, bodies = {}, {}
+    for name, (path, params) in QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            resp = client.get(path, params)
+            body = b"".join(resp.streaming_content) if resp.streaming else resp.content
+            samples.append(time.perf_counter() - start)
+            assert resp.status_code == 200, body[:200]
+        results[name] = latency_summary(samples)
+        bodies[name] = body
+    return results, bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--now", default="2026-01-01", help="fecha con la que se aplican las reglas")
+    parser.add_argument("--after-days", type=int, default=180, help="ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--batch-sizes", default="100,1000,5000", help="lotes para medir el archivado")
+    args = parser.parse_args()
+    now = datetime.fromisoformat(args.now).replace(tzinfo=timezone.utc)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    with django_environment(ARCHIVE_AFTER_DAYS=args.after_days, ARCHIVE_CANCELLED_AFTER_DAYS=0):
+        from django.test import Client
+
+        from appointments import archive
+        from appointments.models import Appointment, ArchivedAppointment
+        from benchmarks.datasets import dimensions, seed_appointments
+
+        seed_appointments(args.appointments, dims=dimensions(contacts=50000),
+                          progress=lambda n: n % 100000 == 0 and print(f"citas: {n}", file=sys.stderr))
+        client = Client()
+        before = {"hot": table_size(Appointment)}
+        before_latency, before_bodies = time_queries(client, args.repeat)
+        print(json.dumps({"before": before}), file=sys.stderr)
+
+        # Archivar por tramos: cada tamaño de lote mueve una parte de las citas a archivar
+        condition = archive.rules(now)["past"]
+        pending = Appointment.objects.filter(condition).count()
+        throughput = []
+        for i, batch_size in enumerate(batch_sizes):
+            share = pending // len(batch_sizes) if i < len(batch_sizes) - 1 else pending
+            moved, start = 0, time.perf_counter()
+            while moved < share:
+                count = archive.archive_batch(condition, min(batch_size, share - moved), now)
+                if not count:
+                    break
+                moved += count
+            elapsed = time.perf_counter() - start
+            pending -= moved
+            throughput.append({"batch_size": batch_size, "rows": moved,
+                               "rows_per_s": round(moved / elapsed) if elapsed else None})
+            print(json.dumps(throughput[-1]), file=sys.stderr)
+
+        after = {"hot": table_size(Appointment), "archive": table_size(ArchivedAppointment)}
+        after_latency, after_bodies = time_queries(client, args.repeat)
+        # La primera página por location (las citas más recientes) no cambia
+        assert before_bodies["listado_location"] == after_bodies["listado_location"]
+
+    queries = []
+    for name in QUERIES:
+        p50_before, p50_after = before_latency[name]["p50_ms"], after_latency[name]["p50_ms"]
+        queries.append({
+            "query": name,
+            "before": before_latency[name],
+            "after": after_latency[name],
+            "speedup_p50": round(p50_before / p50_after, 1) if p50_after else None,
+        })
+    print(json.dumps({
+        "appointments": args.appointments,
+        "now": args.now,
+        "after_days": args.after_days,
+        "before": before,
+        "after": after,
+        "archive_throughput": throughput,
+        "queries": queries,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
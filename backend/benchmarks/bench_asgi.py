@@ -0,0 +1,174 @@
+# benchmarks/bench_asgi.py
+# Concurrencia bajo uvicorn: vistas síncronas vs async (GHL_ASYNC_VIEWS) con
+# un GHL falso que tarda --latency segundos. Mide peticiones/s y latencia de
+# POST /api/appointments/create/ con 50, 200 y 500 clientes simultáneos.
+#
+# Bajo ASGI cada vista síncrona ocupa un hilo del executor por defecto
+# (min(32, CPUs + 4)) mientras espera a GHL, así que la concurrencia real
+# queda acotada por ese pool; las async esperan en el event loop sin ocupar
+# ningún hilo.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_asgi --latency 0.1 --duration 15 --clients 50,200,500
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.harness import BACKEND_DIR, latency_summary, persistent_sqlite
+from benchmarks.stub_ghl import StubGHLServer
+
+
+def create_app():
+    """Factory para `uvicorn --factory`: Django contra la BD del benchmark (BENCH_DB)."""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mi_proyecto.settings")
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+    from django.db import connections
+
+    connections["default"].settings_dict["NAME"] = os.environ["BENCH_DB"]
+    settings.ALLOWED_HOSTS = ["*"]
+    return get_asgi_application()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, db_path, ghl_url):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        BENCH_DB=db_path,
+        GHL_ASYNC_VIEWS=str(mode == "async"),
+        GHL_BASE_URL=ghl_url,
+        GHL_API_KEY="bench",
+        GHL_LOCATION_ID="loc-bench",
+        GHL_ASSIGNED_USER_ID="user-bench",
+        GHL_RATE_LIMIT_PER_SECOND="0",
+        GHL_ASYNC_POOL_SIZE="1000",
+        READ_CACHE_ENABLED="False",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_asgi:create_app", "--factory",
+         "--port", str(port), "--log-level", "warning", "--no-access-log", "--backlog", "2048"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("uvicorn no arrancó")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        # Peticiones canceladas a medias retrasan el apagado ordenado
+        proc.kill()
+        proc.wait()
+
+
+def payload(i):
+    day, minute = 1 + i % 28, 30 * (i % 20)
+    return {
+        "calendarId": f"cal-{i % 10}",
+        "contactId": f"contact-{i}",
+        "startTime": f"2025-05-{day:02d}T{8 + minute // 60:02d}:{minute % 60:02d}:00Z",
+        "endTime": f"2025-05-{day:02d}T{8 + minute // 60:02d}:{minute % 60 + 29:02d}:00Z",
+    }
+
+
+async def load(base_url, clients, duration):
+    """`clients` clientes en bucle durante `duration` segundos; cuenta solo lo que termina a tiempo."""
+    samples, errors = [], 0
+    counter = iter(range(10 ** 9))
+    deadline = time.monotonic() + duration
+
+    async def client_loop(http):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = await http.post("/api/appointments/create/", json=payload(next(counter)))
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if time.monotonic() > deadline:
+                return
+            if resp.status_code == 201:
+                samples.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=duration + 30) as http:
+        tasks = [asyncio.create_task(client_loop(http)) for _ in range(clients)]
+        await asyncio.sleep(duration)
+        await asyncio.sleep(0.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "clients": clients,
+        "completed": len(samples),
+        "errors": errors,
+        "requests_per_s": round(len(samples) / duration, 1),
+        **latency_summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.1, help="latencia simulada de GHL (segundos)")
+    parser.add_argument("--duration", type=float, default=15.0, help="segundos por nivel de concurrencia")
+    parser.add_argument("--clients", default="50,200,500")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    stub = StubGHLServer(latency=args.latency).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="ghl-asgi-") as tmp:
+            db_path = os.path.join(tmp, "asgi.sqlite3")
+            with persistent_sqlite(db_path):
+                pass
+            for mode in args.modes.split(","):
+                for clients in (int(c) for c in args.clients.split(",")):
+                    # Servidor nuevo por nivel: que la cola del anterior no contamine la medida
+                    proc, base_url = start_server(mode, db_path, stub.base_url)
+                    try:
+                        row = asyncio.run(load(base_url, clients, args.duration))
+                    finally:
+                        stop_server(proc)
+                    results.append(dict(row, mode=mode))
+                    print(json.dumps(results[-1]), file=sys.stderr)
+    finally:
+        stub.stop()
+    print(json.dumps({"ghl_latency_s": args.latency, "duration_s": args.duration, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
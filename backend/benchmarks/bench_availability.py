@@ -0,0 +1,106 @@
+# benchmarks/bench_availability.py
+# Motor local de disponibilidad: "¿se cruza?" y "huecos libres" con el índice
+# en memoria frente a la consulta equivalente en SQL.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_availability --appointments 100000 --calendars 200
+import argparse
+import json
+import random
+import time
+from datetime import timedelta
+
+from benchmarks.harness import django_environment, latency_summary
+
+
+def seed(n, calendars, users, rnd):
+    from django.db.models import F
+    from django.utils import timezone
+
+    from appointments.models import Appointment
+
+    base = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=20)
+    rows = []
+    for i in range(n):
+        start = base + timedelta(minutes=30 * rnd.randrange(48 * 180))
+        rows.append(Appointment(
+            ghl_id=f"appt-{i}", location_id="loc-0", calendar_id=f"cal-{rnd.randrange(calendars)}",
+            contact_id=f"contact-{i}", assigned_user_id=f"user-{rnd.randrange(users)}",
+            appointment_status="cancelled" if rnd.random() < 0.1 else "confirmed",
+            start_time=start, end_time=start + timedelta(minutes=rnd.choice([30, 60, 90])),
+        ))
+    Appointment.objects.bulk_create(rows, batch_size=5000)
+    # Tabla "antigua": date_updated repartido (auto_now los deja todos en el mismo
+    # segundo y el refresco incremental releería la tabla entera)
+    Appointment.objects.update(date_updated=F("start_time") - timedelta(days=200))
+    return base
+
+
+def sql_conflicts(calendar_id, user_id, start, end):
+    from django.db.models import Q
+
+    from appointments.models import Appointment
+
+    return list(
+        Appointment.objects.filter(Q(calendar_id=calendar_id) | Q(assigned_user_id=user_id),
+                                   start_time__lt=end, end_time__gt=start)
+        .exclude(appointment_status__in=["cancelled", "invalid"])
+        .values_list("ghl_id", flat=True)
+    )
+
+
+def timed(fn, queries):
+    samples = []
+    for args in queries:
+        t = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t)
+    return latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--calendars", type=int, default=200)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rnd = random.Random(5)
+    with django_environment():
+        from django.test import override_settings
+
+        from appointments import availability
+
+        base = seed(args.appointments, args.calendars, args.users, rnd)
+        index = availability.get_index()
+        start = time.perf_counter()
+        index.load()
+        load_s = time.perf_counter() - start
+
+        queries = []
+        for _ in range(args.queries):
+            s = base + timedelta(days=21, minutes=30 * rnd.randrange(48 * 150))
+            queries.append((f"cal-{rnd.randrange(args.calendars)}", f"user-{rnd.randrange(args.users)}",
+                            s, s + timedelta(minutes=60)))
+
+        def local(calendar_id, user_id, s, e):
+            return index.conflicts(s, e, calendar_id=calendar_id, assigned_user_id=user_id)
+
+        def week(calendar_id, user_id, s, e):
+            return index.free_slots(s, s + timedelta(days=7), timedelta(minutes=30), calendar_id=calendar_id)
+
+        results = {"sql_overlap_query": timed(sql_conflicts, queries)}
+        with override_settings(SLOTS_REFRESH_INTERVAL=0):
+            results["index_conflicts_refresh_each_query"] = timed(local, queries)
+        with override_settings(SLOTS_REFRESH_INTERVAL=1.0):
+            results["index_conflicts_refresh_1s"] = timed(local, queries)
+            results["index_free_slots_week_30min"] = timed(week, queries[:500])
+        for (calendar_id, user_id, s, e) in queries[:200]:
+            assert sorted(sql_conflicts(calendar_id, user_id, s, e)) == local(calendar_id, user_id, s, e)
+    print(json.dumps({"appointments": args.appointments, "index_load_s": round(load_s, 2),
+                      "indexed_rows": index.stats()["appointments"], "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
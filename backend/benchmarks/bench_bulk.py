@@ -0,0 +1,68 @@
+# benchmarks/bench_bulk.py
+# Throughput del alta masiva frente a N llamadas a /appointments/create/,
+# contra un GHL falso con latencia simulada.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_bulk --items 500 --latency 0.05
+import argparse
+import json
+import time
+
+from benchmarks.harness import django_environment
+from benchmarks.stub_ghl import StubGHLServer
+
+
+def items(n, offset=0):
+    return [
+        {
+            "calendarId": f"cal-{i % 5}",
+            "contactId": f"contact-{i}",
+            "startTime": f"2025-05-{1 + i % 28:02d}T{8 + i % 10:02d}:00:00Z",
+            "endTime": f"2025-05-{1 + i % 28:02d}T{8 + i % 10:02d}:30:00Z",
+            "title": f"Cita {offset + i}",
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="latencia simulada de GHL (s)")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--rate", type=float, default=0, help="GHL_RATE_LIMIT_PER_SECOND (0 = sin limitador)")
+    args = parser.parse_args()
+
+    server = StubGHLServer(latency=args.latency).start()
+    env = {"GHL_BASE_URL": server.base_url, "GHL_API_KEY": "bench", "GHL_LOCATION_ID": "loc-bench",
+           "GHL_ASSIGNED_USER_ID": "user-bench", "GHL_RATE_LIMIT_PER_SECOND": args.rate}
+    results = []
+    try:
+        with django_environment(**env):
+            from django.test import Client, override_settings
+
+            client = Client()
+            start = time.perf_counter()
+            for body in items(args.items):
+                resp = client.post("/api/appointments/create/", json.dumps(body), content_type="application/json")
+                assert resp.status_code == 201, resp.content
+            elapsed = time.perf_counter() - start
+            results.append({"mode": "create_uno_a_uno", "items": args.items, "seconds": round(elapsed, 2),
+                            "items_per_s": round(args.items / elapsed, 1)})
+
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                with override_settings(GHL_BULK_CONCURRENCY=concurrency):
+                    body = {"appointments": items(args.items, offset=args.items * (concurrency + 1))}
+                    start = time.perf_counter()
+                    resp = client.post("/api/appointments/bulk/", json.dumps(body), content_type="application/json")
+                    elapsed = time.perf_counter() - start
+                    assert resp.status_code == 200 and resp.json()["failed"] == 0, resp.content[:300]
+                results.append({"mode": f"bulk_concurrency_{concurrency}", "items": args.items,
+                                "seconds": round(elapsed, 2), "items_per_s": round(args.items / elapsed, 1)})
+    finally:
+        server.stop()
+    print(json.dumps({"ghl_latency_s": args.latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
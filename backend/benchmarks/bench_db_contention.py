@@ -0,0 +1,124 @@
+# benchmarks/bench_db_contention.py
+# Contención de escritura: N hilos disparan webhooks (modo sync, que escribe
+# en la BD en cada evento) a la vez, con distintas configuraciones de la BD.
+# Cuenta los eventos/s y los errores ("database is locked" llega como 500).
+#
+# Cada configuración corre en su propio proceso porque los settings de la BD
+# se leen al arrancar Django.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_db_contention --threads 8 --events 4000
+#   python -m benchmarks.bench_db_contention --database-url postgres://u:p@localhost/ghl
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.bench_webhooks import synthetic_events
+from benchmarks.harness import BACKEND_DIR, django_environment, latency_summary
+
+CONFIGS = {
+    # Django por defecto: rollback journal, transacciones DEFERRED, timeout 5s
+    "sqlite-default": {"SQLITE_TUNING": "False"},
+    # Perfil de settings.py: WAL, synchronous=NORMAL, IMMEDIATE, busy_timeout
+    "sqlite-tuned": {"SQLITE_TUNING": "True"},
+    # Igual pero con fsync en cada commit, para ver lo que aporta NORMAL
+    "sqlite-tuned-full-sync": {"SQLITE_TUNING": "True", "SQLITE_SYNCHRONOUS": "FULL"},
+}
+
+
+def writer(client_factory, events, samples, statuses, lock):
+    from django.db import connection
+
+    client = client_factory()
+    local_samples, local_statuses = [], Counter()
+    for event in events:
+        start = time.perf_counter()
+        resp = client.post("/api/webhook/ghl/", json.dumps(event), content_type="application/json")
+        local_samples.append(time.perf_counter() - start)
+        local_statuses[resp.status_code] += 1
+    connection.close()
+    with lock:
+        samples.extend(local_samples)
+        statuses.update(local_statuses)
+
+
+def run_worker(name, threads, n_events, distinct):
+    """Corre una configuración (ya aplicada en el entorno) y devuelve el resultado."""
+    events = list(synthetic_events(n_events, distinct))
+    with django_environment(GHL_WEBHOOK_MODE="sync") as settings:
+        from django.db import connection
+        from django.test import Client
+
+        from appointments.models import Appointment
+
+        db = settings.DATABASES["default"]
+        pragmas = {}
+        if db["ENGINE"].endswith("sqlite3"):
+            with connection.cursor() as cursor:
+                for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+                    pragmas[pragma] = cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+
+        samples, statuses, lock = [], Counter(), threading.Lock()
+        chunks = [events[i::threads] for i in range(threads)]
+        workers = [
+            threading.Thread(target=writer, args=(Client, chunk, samples, statuses, lock))
+            for chunk in chunks
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        ok = sum(count for code, count in statuses.items() if code < 500)
+        return {
+            "config": name,
+            "engine": db["ENGINE"].rsplit(".", 1)[-1],
+            "pragmas": pragmas,
+            "threads": threads,
+            "events": len(events),
+            "ok": ok,
+            "errors": len(events) - ok,
+            "events_per_s": round(ok / elapsed, 1),
+            "elapsed_s": round(elapsed, 3),
+            "appointments": Appointment.objects.count(),
+            **latency_summary(samples),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--events", type=int, default=4000)
+    parser.add_argument("--distinct", type=int, default=1000, help="citas distintas en la ráfaga")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--database-url", help="añade una configuración contra este servidor (Postgres/MySQL)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.threads, args.events, args.distinct)))
+        return
+
+    configs = {name: CONFIGS[name] for name in args.configs.split(",")}
+    if args.database_url:
+        configs["server"] = {"DATABASE_URL": args.database_url}
+    results = []
+    for name, env in configs.items():
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_db_contention", "--worker", name,
+             "--threads", str(args.threads), "--events", str(args.events), "--distinct", str(args.distinct)],
+            cwd=BACKEND_DIR, env=dict(os.environ, **env), capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        print(json.dumps(results[-1]), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_dedup.py
+# Deduplicación local de contactos: latencia de POST /api/contacts/create/
+# cuando el contacto ya existe (sin GHL) y de POST /api/contacts/match/ con
+# miles de candidatos.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_dedup --contacts 200000 --candidates 5000
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import django_environment, latency_summary
+
+
+def timed_post(client, url, bodies):
+    samples, last = [], None
+    for body in bodies:
+        start = time.perf_counter()
+        last = client.post(url, body, format="json")
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples), last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--contacts", type=int, default=200000)
+    parser.add_argument("--candidates", type=int, default=5000)
+    parser.add_argument("--reps", type=int, default=20)
+    args = parser.parse_args()
+
+    rnd = random.Random(3)
+    with django_environment(GHL_API_KEY="bench", GHL_LOCATION_ID="loc-0") as settings:
+        from rest_framework.test import APIClient
+
+        from appointments.models import Contact
+        from benchmarks.datasets import dimensions, seed_contacts
+
+        settings.CONTACT_MATCH_MAX_ITEMS = max(settings.CONTACT_MATCH_MAX_ITEMS, args.candidates)
+        seed_contacts(args.contacts, dims=dimensions(contacts=args.contacts))
+        in_loc = list(Contact.objects.filter(location_id="loc-0").values_list("email", "phone")[:args.candidates])
+        client = APIClient()
+
+        # Mitad existentes (email en mayúsculas, teléfono sin prefijo), mitad nuevos
+        candidates = []
+        for i in range(args.candidates):
+            if i % 2 == 0 and in_loc:
+                email, phone = in_loc[(i // 2) % len(in_loc)]
+                candidates.append({"email": email.upper()} if i % 4 == 0 else {"phone": phone[3:]})
+            else:
+                candidates.append({"email": f"nuevo{i}@example.com", "phone": f"9{rnd.randrange(10 ** 8):08d}1"})
+
+        dupes = [{"firstName": "A", "lastName": "B", "locationId": "loc-0", "email": email}
+                 for email, _ in in_loc[:args.reps]]
+        create_dup, resp = timed_post(client, "/api/contacts/create/", dupes)
+        assert resp.status_code == 409, resp.content[:200]
+        match, resp = timed_post(client, "/api/contacts/match/",
+                                 [{"locationId": "loc-0", "candidates": candidates}] * args.reps)
+        assert resp.status_code == 200, resp.content[:200]
+        matched = resp.json()["matched"]
+
+    print(json.dumps({
+        "contacts": args.contacts,
+        "candidates": args.candidates,
+        "matched": matched,
+        "create_duplicate_local": create_dup,
+        "match_endpoint": match,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_export.py
+# Pico de memoria (RSS) al exportar toda la tabla de citas: streaming NDJSON/CSV
+# frente a serializar todo con DRF de una vez. Cada modo corre en su propio
+# proceso para que el pico medido sea solo el suyo.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_export --appointments 1000000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import persistent_sqlite
+
+MODES = ["ndjson", "csv", "drf_full"]
+
+
+def _maxrss_mb():
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def worker(mode, db_path):
+    with persistent_sqlite(db_path):
+        from django.test import Client
+
+        baseline = _maxrss_mb()
+        start = time.perf_counter()
+        size = 0
+        if mode == "drf_full":
+            from rest_framework.renderers import JSONRenderer
+
+            from appointments.models import Appointment
+            from appointments.serializers import AppointmentSerializer
+
+            data = AppointmentSerializer(Appointment.objects.order_by("pk"), many=True).data
+            size = len(JSONRenderer().render(data))
+        else:
+            resp = Client().get(f"/api/appointments/export/?output={mode}")
+            for chunk in resp.streaming_content:
+                size += len(chunk)
+        elapsed = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "seconds": round(elapsed, 2),
+                "bytes": size,
+                "baseline_rss_mb": round(baseline, 1),
+                "peak_rss_mb": round(_maxrss_mb(), 1),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.worker, args.db)
+
+    with tempfile.TemporaryDirectory(prefix="ghl-export-") as tmp:
+        db_path = os.path.join(tmp, "export.sqlite3")
+        with persistent_sqlite(db_path):
+            from benchmarks.datasets import seed_appointments
+
+            seed_appointments(args.appointments)
+
+        results = []
+        for mode in args.modes.split(","):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_export", "--worker", mode, "--db", db_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps({"appointments": args.appointments, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
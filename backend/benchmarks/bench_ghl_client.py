@@ -0,0 +1,87 @@
+# benchmarks/bench_ghl_client.py
+# Latencia p50/p99 de llamadas a GHL con y sin reutilización de conexiones.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_ghl_client --requests 500 --latency 0.002
+import argparse
+import json
+import statistics
+import time
+
+import requests
+
+from appointments.ghl_client import GHLClient
+from benchmarks.stub_ghl import StubGHLServer
+
+PAYLOAD = {
+    "calendarId": "cal-bench",
+    "locationId": "loc-bench",
+    "contactId": "contact-bench",
+    "startTime": "2025-01-01T10:00:00Z",
+    "endTime": "2025-01-01T11:00:00Z",
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, samples):
+    return {
+        "mode": name,
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def run_without_pool(base_url, n):
+    """Comportamiento anterior: requests.post suelto, conexión nueva por llamada."""
+    headers = {"Authorization": "Bearer bench", "Version": "2021-04-15", "LocationId": "loc-bench"}
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        resp = requests.post(f"{base_url}/calendars/events/appointments", json=PAYLOAD, headers=headers, timeout=15)
+        resp.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_with_pool(base_url, n):
+    client = GHLClient(api_key="bench", api_version="2021-04-15", base_url=base_url, pool_size=4)
+    samples = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            resp = client.post("/calendars/events/appointments", "loc-bench", json=PAYLOAD)
+            resp.raise_for_status()
+            samples.append(time.perf_counter() - start)
+    finally:
+        client.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="latencia simulada del stub (segundos)")
+    args = parser.parse_args()
+
+    server = StubGHLServer(latency=args.latency).start()
+    try:
+        # calentamiento
+        run_with_pool(server.base_url, 10)
+        results = [
+            summarize("sin_pool", run_without_pool(server.base_url, args.requests)),
+            summarize("con_pool", run_with_pool(server.base_url, args.requests)),
+        ]
+    finally:
+        server.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_indexes.py
+# Tiempo de los endpoints de listado/filtro con y sin los índices compuestos.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_indexes --appointments 1000000 --contacts 200000
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.harness import django_environment, latency_summary
+
+SCENARIOS = [
+    ("appointments_first_page", "/api/appointments/"),
+    ("appointments_by_location", "/api/appointments/?location_id=loc-3"),
+    ("appointments_by_location_window", "/api/appointments/?location_id=loc-3&start=2024-06-01&end=2024-06-08"),
+    ("appointments_by_calendar", "/api/appointments/?calendar_id=cal-2-1"),
+    ("appointments_by_contact", "/api/appointments/?contact_id=contact-123"),
+    ("appointments_by_user", "/api/appointments/?assigned_user_id=user-4-2"),
+    ("appointments_by_status", "/api/appointments/?appointment_status=cancelled"),
+    ("appointments_location_status", "/api/appointments/?location_id=loc-1&appointment_status=noshow"),
+    ("contacts_first_page", "/api/contacts/"),
+    ("contacts_by_location", "/api/contacts/?location_id=loc-5"),
+    ("contacts_by_source", "/api/contacts/?source=web"),
+]
+
+
+def measure(client, reps):
+    results = {}
+    for name, url in SCENARIOS:
+        client.get(url)  # calentar caché de páginas de SQLite
+        samples = []
+        for _ in range(reps):
+            start = time.perf_counter()
+            resp = client.get(url)
+            samples.append(time.perf_counter() - start)
+            assert resp.status_code == 200, resp.content[:200]
+        results[name] = latency_summary(samples)
+    return results
+
+
+def set_indexes(enabled):
+    """Quita o crea los índices declarados en Meta.indexes. Devuelve el tiempo empleado."""
+    from django.db import connection
+
+    from appointments.models import Appointment, Contact
+
+    start = time.perf_counter()
+    with connection.schema_editor() as editor:
+        for model in (Appointment, Contact):
+            for index in model._meta.indexes:
+                if enabled:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("ANALYZE")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--contacts", type=int, default=200000)
+    parser.add_argument("--reps", type=int, default=20)
+    args = parser.parse_args()
+
+    with django_environment():
+        from django.test import Client
+
+        from benchmarks.datasets import seed_appointments, seed_contacts
+
+        def progress(done):
+            print(f"  sembradas {done} filas", file=sys.stderr)
+
+        seed_start = time.perf_counter()
+        seed_appointments(args.appointments, progress=progress)
+        seed_contacts(args.contacts, progress=progress)
+        seed_s = time.perf_counter() - seed_start
+
+        client = Client()
+        set_indexes(False)
+        before = measure(client, args.reps)
+        build_s = set_indexes(True)
+        after = measure(client, args.reps)
+
+    report = {
+        "appointments": args.appointments,
+        "contacts": args.contacts,
+        "seed_s": round(seed_s, 1),
+        "index_build_s": round(build_s, 2),
+        "scenarios": {
+            name: {"sin_indices": before[name], "con_indices": after[name]} for name, _ in SCENARIOS
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_read_cache.py
+# Caché de lecturas: latencia de los listados/detalle con y sin caché bajo una
+# mezcla de lecturas (con If-None-Match, como un navegador) y escrituras por
+# webhook, y ratio de aciertos resultante.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_read_cache --appointments 50000 --requests 3000 --write-ratio 0.05
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import django_environment, latency_summary
+
+URLS = (
+    ["/api/appointments/", "/api/contacts/", "/api/appointments/?expand=contact"]
+    + [f"/api/appointments/?location_id=loc-{i}" for i in range(10)]
+    + [f"/api/appointments/?calendar_id=cal-{i}-0" for i in range(10)]
+    + [f"/api/contacts/?location_id=loc-{i}" for i in range(5)]
+    + [f"/api/appointments/appt-{i}/" for i in range(20)]
+)
+
+
+def webhook_update(client, rnd, n_appointments, seq):
+    from appointments.models import Appointment
+
+    appt = Appointment.objects.get(ghl_id=f"appt-{rnd.randrange(n_appointments)}")
+    event = {
+        "type": "AppointmentUpdate",
+        "appointment": {
+            "id": appt.ghl_id, "locationId": appt.location_id, "calendarId": appt.calendar_id,
+            "contactId": appt.contact_id, "title": f"Editada {seq}", "appointmentStatus": "confirmed",
+            "startTime": appt.start_time.isoformat(), "endTime": appt.end_time.isoformat(),
+            "dateAdded": appt.date_added.isoformat(), "webhookId": f"bench-{seq}",
+        },
+    }
+    resp = client.post("/api/webhook/ghl/", json.dumps(event), content_type="application/json")
+    assert resp.status_code == 200, resp.content[:200]
+
+
+def run(client, args, enabled):
+    from django.test import override_settings
+
+    from appointments import caching
+
+    caching.reset_stats()
+    rnd = random.Random(11)
+    weights = [1.0 / (rank + 1) for rank in range(len(URLS))]  # popularidad tipo Zipf
+    etags = {}
+    samples, statuses = [], {}
+    with override_settings(READ_CACHE_ENABLED=enabled):
+        for seq in range(args.requests):
+            if rnd.random() < args.write_ratio:
+                webhook_update(client, rnd, args.appointments, seq)
+                continue
+            url = rnd.choices(URLS, weights)[0]
+            headers = {"HTTP_IF_NONE_MATCH": etags[url]} if url in etags else {}
+            start = time.perf_counter()
+            resp = client.get(url, **headers)
+            samples.append(time.perf_counter() - start)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            if resp.has_header("ETag"):
+                etags[url] = resp["ETag"]
+    return {"cache": enabled, "reads": latency_summary(samples), "status_codes": statuses,
+            "cache_stats": caching.stats_snapshot() if enabled else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=50000)
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with django_environment():
+        from django.test import Client
+
+        from benchmarks.datasets import dimensions, seed_appointments, seed_contacts
+
+        dims = dimensions(contacts=args.contacts)
+        seed_contacts(args.contacts, dims=dims)
+        seed_appointments(args.appointments, dims=dims)
+        client = Client()
+        results = [run(client, args, enabled=False), run(client, args, enabled=True)]
+    print(json.dumps({"appointments": args.appointments, "requests": args.requests,
+                      "write_ratio": args.write_ratio, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
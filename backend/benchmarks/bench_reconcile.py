@@ -0,0 +1,99 @@
+# benchmarks/bench_reconcile.py
+# Reconciliación completa e incremental contra un GHL falso en memoria.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_reconcile --events 20000 --contacts 20000 --changed 0.01
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.harness import django_environment
+from benchmarks.stub_ghl import StubGHLServer
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _iso(dt):
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def build_dataset(n_events, n_contacts, calendars, seed=3):
+    rnd = random.Random(seed)
+    updated = _iso(NOW - timedelta(days=2))
+    contacts = [
+        {"id": f"contact-{i}", "locationId": "loc-bench", "firstName": "Ana", "lastName": f"Pérez {i}",
+         "email": f"ana{i}@example.com", "phone": f"+519{i:08d}", "dateUpdated": updated}
+        for i in range(n_contacts)
+    ]
+    events = []
+    for i in range(n_events):
+        start = NOW + timedelta(days=rnd.randrange(-20, 300), hours=rnd.randrange(24))
+        events.append({
+            "id": f"evt-{i}", "locationId": "loc-bench", "calendarId": rnd.choice(calendars),
+            "contactId": f"contact-{rnd.randrange(max(1, n_contacts))}", "title": "Consulta",
+            "appointmentStatus": "confirmed", "assignedUserId": "user-1",
+            "startTime": _iso(start), "endTime": _iso(start + timedelta(minutes=30)),
+            "dateAdded": updated, "dateUpdated": updated,
+        })
+    return events, contacts
+
+
+def touch(items, fraction, seed=4):
+    """Simula cambios en GHL: nuevo dateUpdated en una fracción de los elementos."""
+    rnd = random.Random(seed)
+    changed = rnd.sample(range(len(items)), int(len(items) * fraction))
+    for i in changed:
+        items[i] = dict(items[i], title="Reprogramada", dateUpdated=_iso(NOW))
+    return len(changed)
+
+
+def timed_run(server, mode, workers):
+    from appointments import reconcile
+
+    before = server.requests_seen
+    start = time.perf_counter()
+    stats = {
+        entity: reconcile.run(entity, "loc-bench", mode=mode, workers=workers)
+        for entity in ("contacts", "appointments")
+    }
+    return {"mode": mode, "seconds": round(time.perf_counter() - start, 2),
+            "ghl_requests": server.requests_seen - before, "stats": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--calendars", type=int, default=5)
+    parser.add_argument("--changed", type=float, default=0.01, help="fracción modificada entre corridas")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    calendars = [f"cal-{i}" for i in range(args.calendars)]
+    events, contacts = build_dataset(args.events, args.contacts, calendars)
+    server = StubGHLServer(latency=args.latency)
+    server.load(calendars, events, contacts)
+    server.start()
+    env = {"GHL_BASE_URL": server.base_url, "GHL_API_KEY": "bench", "GHL_LOCATION_ID": "loc-bench"}
+    try:
+        with django_environment(**env):
+            from appointments.models import Appointment, Contact
+
+            runs = [timed_run(server, "full", args.workers)]
+            changed_events = touch(events, args.changed)
+            changed_contacts = touch(contacts, args.changed, seed=5)
+            server.load(calendars, events, contacts)
+            runs.append(timed_run(server, "incremental", args.workers))
+            runs.append(timed_run(server, "incremental", args.workers))
+            totals = {"appointments": Appointment.objects.count(), "contacts": Contact.objects.count()}
+    finally:
+        server.stop()
+    print(json.dumps({"changed": {"events": changed_events, "contacts": changed_contacts},
+                      "runs": runs, "local_rows": totals}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
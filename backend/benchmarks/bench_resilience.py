@@ -0,0 +1,99 @@
+# benchmarks/bench_resilience.py
+# Limitador compartido y circuit breaker frente a un GHL falso que responde 429
+# al superar su cuota y 503 cuando está "caído".
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_resilience --processes 4 --requests 60 --quota 20
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+
+from benchmarks.stub_ghl import StubGHLServer
+
+
+def _worker(args):
+    base_url, n, client_kwargs = args
+    from appointments.ghl_client import GHLClient
+
+    client = GHLClient("bench", "2021-04-15", base_url, **client_kwargs)
+    ok = limited = 0
+    for i in range(n):
+        resp = client.post("/contacts/", "loc-bench", json={"firstName": f"Ana {i}"})
+        if resp.status_code == 429:
+            limited += 1
+        else:
+            ok += 1
+    return ok, limited, client.stats["retries"]
+
+
+def rate_limit_scenario(label, processes, n, quota, client_kwargs):
+    server = StubGHLServer(rate_limit=quota, rate_window=1.0).start()
+    try:
+        start = time.perf_counter()
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            results = pool.map(_worker, [(server.base_url, n, client_kwargs)] * processes)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    return {
+        "mode": label,
+        "seconds": round(elapsed, 2),
+        "ok": sum(r[0] for r in results),
+        "failed_429": sum(r[1] for r in results),
+        "client_retries": sum(r[2] for r in results),
+        "server_429": server.status_counts[429],
+        "requests_per_s": round(sum(r[0] for r in results) / elapsed, 1),
+    }
+
+
+def breaker_scenario(label, n, latency, threshold):
+    from appointments.ghl_client import GHLClient
+    from appointments.resilience import GHLUnavailable
+
+    server = StubGHLServer(latency=latency, error_rate=1.0).start()
+    client = GHLClient("bench", "2021-04-15", server.base_url, breaker_threshold=threshold,
+                       breaker_reset_timeout=60)
+    fast_failures = 0
+    try:
+        start = time.perf_counter()
+        for _ in range(n):
+            try:
+                client.get("/calendars/", "loc-bench")
+            except GHLUnavailable:
+                fast_failures += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    return {"mode": label, "requests": n, "seconds": round(elapsed, 2),
+            "reached_ghl": server.requests_seen, "failed_fast": fast_failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=60, help="peticiones por proceso")
+    parser.add_argument("--quota", type=int, default=20, help="peticiones/s que acepta el GHL falso")
+    parser.add_argument("--latency", type=float, default=0.2, help="latencia del GHL caído (s)")
+    args = parser.parse_args()
+
+    shared_dir = tempfile.mkdtemp(prefix="ghl-ratelimit-")
+    rate = {"rate_limit": args.quota, "rate_burst": args.quota}
+    scenarios = [
+        ("sin_limitador", {}),
+        ("limitador_por_proceso", dict(rate)),
+        ("limitador_por_proceso+reintentos", dict(rate, max_retries=3, backoff_base=0.2)),
+        ("limitador_compartido+reintentos", dict(rate, max_retries=3, backoff_base=0.2, rate_limit_dir=shared_dir)),
+    ]
+    limiter = [rate_limit_scenario(label, args.processes, args.requests, args.quota, kwargs)
+               for label, kwargs in scenarios]
+    breaker = [
+        breaker_scenario("sin_circuit_breaker", 30, args.latency, threshold=10**9),
+        breaker_scenario("circuit_breaker_5_fallos", 30, args.latency, threshold=5),
+    ]
+    print(json.dumps({"rate_limit": limiter, "circuit_breaker": breaker}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
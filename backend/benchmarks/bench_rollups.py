@@ -0,0 +1,104 @@
+# benchmarks/bench_rollups.py
+# Dashboard de citas por día: /api/appointments/stats/ servido desde el
+# resumen (AppointmentRollup) frente al GROUP BY en vivo sobre Appointment
+# (?live=1), y lo que cuesta mantener el resumen en cada webhook.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_rollups --appointments 1000000 --repeat 20
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks.harness import django_environment, latency_summary
+from benchmarks.suite import webhook_event
+
+# Consultas típicas de un dashboard (el dataset cubre 2024-2025 en 10 locations)
+QUERIES = {
+    "location_30_dias": {"location_id": "loc-3", "start": "2025-03-01", "end": "2025-03-31"},
+    "location_7_dias_por_estado": {"location_id": "loc-3", "start": "2025-03-01", "end": "2025-03-08",
+                                   "group_by": "appointment_status"},
+    "calendario_90_dias": {"calendar_id": "cal-3-1", "start": "2025-01-01", "end": "2025-04-01",
+                           "group_by": "assigned_user_id,appointment_status"},
+    "todas_las_locations_1_año": {"start": "2024-01-01", "end": "2025-01-01", "group_by": "location_id,appointment_status"},
+}
+
+
+def time_query(client, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        resp = client.get("/api/appointments/stats/", params)
+        samples.append(time.perf_counter() - start)
+        assert resp.status_code == 200, resp.content[:200]
+    return samples, resp.json()
+
+
+def webhook_cost(client, n_appointments, events):
+    """Latencia de webhooks con y sin mantener el resumen, alternando evento a evento."""
+    from django.test import override_settings
+
+    rnd = random.Random(5)
+    samples = {True: [], False: []}
+    for seq in range(events):
+        enabled = seq % 2 == 0
+        event = webhook_event(rnd, n_appointments, 3_000_000 + seq)
+        with override_settings(ROLLUPS_ENABLED=enabled):
+            start = time.perf_counter()
+            resp = client.post("/api/webhook/ghl/", json.dumps(event), content_type="application/json")
+            samples[enabled].append(time.perf_counter() - start)
+        assert resp.status_code == 200, resp.content[:200]
+    return {"sin_resumen": latency_summary(samples[False]), "con_resumen": latency_summary(samples[True])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--events", type=int, default=1000, help="webhooks para medir el costo de mantener el resumen")
+    args = parser.parse_args()
+
+    with django_environment():
+        from django.test import Client
+
+        from appointments import rollups
+        from appointments.models import AppointmentRollup
+        from benchmarks.datasets import dimensions, seed_appointments
+
+        seed_appointments(args.appointments, dims=dimensions(contacts=args.appointments),
+                          progress=lambda n: n % 200000 == 0 and print(f"citas: {n}", file=sys.stderr))
+        start = time.perf_counter()
+        rollups.rebuild()
+        rebuild_s = time.perf_counter() - start
+        rollup_rows = AppointmentRollup.objects.count()
+        client = Client()
+
+        queries = []
+        for name, params in QUERIES.items():
+            rollup_samples, rollup_body = time_query(client, params, args.repeat)
+            live_samples, live_body = time_query(client, dict(params, live=1), max(1, args.repeat // 4))
+            assert rollup_body["results"] == live_body["results"], name
+            rollup_p50 = latency_summary(rollup_samples)["p50_ms"]
+            live_p50 = latency_summary(live_samples)["p50_ms"]
+            queries.append({
+                "query": name,
+                "rows": len(rollup_body["results"]),
+                "rollup": latency_summary(rollup_samples),
+                "live": latency_summary(live_samples),
+                "speedup_p50": round(live_p50 / rollup_p50, 1) if rollup_p50 else None,
+            })
+            print(json.dumps(queries[-1]), file=sys.stderr)
+
+        writes = webhook_cost(client, args.appointments, args.events)
+    print(json.dumps({
+        "appointments": args.appointments,
+        "rollup_rows": rollup_rows,
+        "rebuild_s": round(rebuild_s, 2),
+        "queries": queries,
+        "webhook_latency": writes,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
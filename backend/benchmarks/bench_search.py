@@ -0,0 +1,107 @@
+# benchmarks/bench_search.py
+# Búsqueda de contactos con el índice de texto (search.py: FTS5 en SQLite)
+# frente a la búsqueda anterior del admin (icontains en cada columna de
+# search_fields). Mide la primera página (50 filas, -date_added), el conteo
+# que muestra el admin y el costo del índice en las inserciones.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_search --contacts 500000 --repeat 10
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.harness import django_environment, latency_summary
+
+LEGACY_FIELDS = ("ghl_id", "first_name", "last_name", "email", "phone")
+
+
+def queries(n):
+    rare = n // 2
+    return {
+        "nombre_comun": "ana gar",
+        "prefijo_email_raro": f"contacto{rare // 10}",
+        "email_exacto": f"CONTACTO{rare}@example.com",
+        "telefono": f"+51 9{rare:08d}",
+        "sin_resultados": "zzyzx",
+    }
+
+
+def legacy(queryset, term):
+    """Búsqueda por defecto del ModelAdmin: cada palabra en alguna columna (icontains)."""
+    from django.db.models import Q
+
+    for word in term.split():
+        queryset = queryset.filter(Q(*(Q(**{f"{f}__icontains": word}) for f in LEGACY_FIELDS), _connector=Q.OR))
+    return queryset
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples), result
+
+
+def insert_rate(n_rows, offset):
+    from benchmarks.datasets import _contact, _seed
+
+    start = time.perf_counter()
+    _seed(lambda i, rnd, dims: _contact(offset + i, rnd, dims), n_rows, 5000, 9, None, None)
+    return round(n_rows / (time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--contacts", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--inserts", type=int, default=50000, help="filas para medir el costo del índice al insertar")
+    args = parser.parse_args()
+
+    with django_environment():
+        from django.db import connection
+
+        from appointments import search
+        from appointments.models import Contact
+        from benchmarks.datasets import seed_contacts
+
+        seed_contacts(args.contacts, progress=lambda n: n % 100000 == 0 and print(f"contactos: {n}", file=sys.stderr))
+        base = Contact.objects.order_by("-date_added")
+        results = []
+        for name, term in queries(args.contacts).items():
+            indexed_page, page = timed(lambda: [c.ghl_id for c in search.search_contacts(base, term)[:50]], args.repeat)
+            legacy_page, old_page = timed(lambda: [c.ghl_id for c in legacy(base, term)[:50]], max(1, args.repeat // 2))
+            indexed_count, count = timed(lambda: search.search_contacts(base, term).count(), args.repeat)
+            legacy_count, old_count = timed(lambda: legacy(base, term).count(), max(1, args.repeat // 2))
+            results.append({
+                "query": name,
+                "term": term,
+                "matches": count,
+                "legacy_matches": old_count,
+                "page": {"indexed": indexed_page, "icontains": legacy_page,
+                         "speedup_p50": round(legacy_page["p50_ms"] / indexed_page["p50_ms"], 1)},
+                "count": {"indexed": indexed_count, "icontains": legacy_count,
+                          "speedup_p50": round(legacy_count["p50_ms"] / indexed_count["p50_ms"], 1)},
+            })
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+        # Inserciones con y sin los triggers del índice
+        with_index = insert_rate(args.inserts, args.contacts)
+        search.uninstall(connection)
+        without_index = insert_rate(args.inserts, args.contacts + args.inserts)
+        start = time.perf_counter()
+        search.install(connection)
+        install_s = time.perf_counter() - start
+    print(json.dumps({
+        "contacts": args.contacts,
+        "backend": "sqlite-fts5",
+        "queries": results,
+        "inserts_per_s": {"with_index": with_index, "without_index": without_index},
+        "build_index_s": round(install_s, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_serialization.py
+# Camino de lectura de los listados: serializers de DRF (modelos + campos +
+# json.dumps) frente al camino rápido (fastread.py: .values() + plan
+# precompilado, y renderers.FastJSONRenderer). Mide filas/s de cada etapa y
+# la memoria asignada (pico de tracemalloc) por página, y comprueba que los
+# bytes de salida sean idénticos.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_serialization --rows 1000 --repeat 20
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.harness import django_environment
+
+
+def serializer_path(queryset, serializer_class):
+    from rest_framework.renderers import JSONRenderer
+
+    def fetch():
+        return serializer_class(list(queryset), many=True).data
+
+    return fetch, JSONRenderer()
+
+
+def fast_path(queryset, serializer_class):
+    from appointments import fastread
+    from appointments.renderers import FastJSONRenderer
+
+    plan = fastread.compile_plan(serializer_class)
+
+    def fetch():
+        return plan.convert(list(queryset.values(*plan.all_columns)))
+
+    return fetch, FastJSONRenderer()
+
+
+def measure(fetch, renderer, rows, repeat):
+    fetch_s = render_s = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = fetch()
+        middle = time.perf_counter()
+        body = renderer.render(data)
+        fetch_s += middle - start
+        render_s += time.perf_counter() - middle
+    tracemalloc.start()
+    renderer.render(fetch())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = rows * repeat
+    return {
+        "rows_per_s": round(total / (fetch_s + render_s)),
+        "fetch_convert_rows_per_s": round(total / fetch_s),
+        "render_rows_per_s": round(total / render_s),
+        "peak_alloc_kib": round(peak / 1024),
+    }, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000, help="filas por página (max_page_size del listado)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with django_environment():
+        from django.db.models import F
+
+        from appointments.models import Appointment, Contact
+        from appointments.serializers import AppointmentSerializer, AppointmentWithContactSerializer, ContactSerializer
+        from benchmarks.datasets import dimensions, seed_appointments, seed_contacts
+
+        seed_contacts(args.rows)
+        seed_appointments(args.rows, dims=dimensions(contacts=args.rows))
+        # Con ?expand=contact: citas con y sin contacto local
+        Appointment.objects.filter(contact_id__in=Contact.objects.values("ghl_id")).update(contact_ref_id=F("contact_id"))
+        cases = {
+            "contacts": (Contact.objects.order_by("-date_added")[:args.rows], ContactSerializer),
+            "appointments": (Appointment.objects.order_by("-start_time")[:args.rows], AppointmentSerializer),
+            "appointments_expand_contact": (
+                Appointment.objects.select_related("contact_ref").order_by("-start_time")[:args.rows],
+                AppointmentWithContactSerializer,
+            ),
+        }
+        results = []
+        for name, (queryset, serializer_class) in cases.items():
+            slow, slow_body = measure(*serializer_path(queryset, serializer_class), args.rows, args.repeat)
+            fast, fast_body = measure(*fast_path(queryset, serializer_class), args.rows, args.repeat)
+            assert slow_body == fast_body, f"{name}: la salida difiere"
+            results.append({
+                "case": name,
+                "bytes": len(fast_body),
+                "serializer": slow,
+                "fast": fast,
+                "speedup": round(fast["rows_per_s"] / slow["rows_per_s"], 1),
+            })
+            print(json.dumps(results[-1]), file=sys.stderr)
+    print(json.dumps({"rows": args.rows, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
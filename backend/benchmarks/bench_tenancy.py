@@ -0,0 +1,125 @@
+# benchmarks/bench_tenancy.py
+# Aislamiento entre locations: un pool de hilos fijo (como un worker gthread)
+# recibe peticiones a ritmo constante para varias locations, y una de ellas
+# ("loc-slow") tiene GHL lento o limitado (429). Compara un cliente único
+# compartido (como antes de tenancy.py) con un cliente por location con tope
+# de llamadas simultáneas: latencia (desde la llegada, con la espera en cola)
+# y éxito de las locations sanas, y rechazos de la lenta.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_tenancy --fault slow --duration 5
+#   python -m benchmarks.bench_tenancy --fault 429
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import django_environment, latency_summary
+from benchmarks.stub_ghl import StubGHLHandler, StubGHLServer
+
+SLOW_LOCATION = "loc-slow"
+
+
+class FaultyLocationHandler(StubGHLHandler):
+    """Como el GHL falso, pero la location lenta tarda `slow_latency` o responde 429."""
+
+    def _handle(self):
+        if self.headers.get("LocationId") == SLOW_LOCATION:
+            if self.server.fault == "429":
+                self.server.requests_seen += 1
+                self.server.status_counts[429] += 1
+                return self._send(429, {"message": "Too many requests"}, {"Retry-After": "1"})
+            time.sleep(self.server.slow_latency)
+        return super()._handle()
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+def run(client_for, args):
+    """Llegadas a ritmo fijo durante `duration` s; devuelve (latencias sanas, resultados por tipo)."""
+    fast_latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+    locations = [f"loc-{i}" for i in range(args.locations)]
+
+    def call(location_id, arrived):
+        try:
+            resp = client_for(location_id).get("/calendars/", location_id)
+            outcome = resp.status_code
+        except Exception as e:  # GHLUnavailable (sin turno / circuito) o error de conexión
+            outcome = type(e).__name__
+        elapsed = time.perf_counter() - arrived
+        kind = "slow" if location_id == SLOW_LOCATION else "fast"
+        with lock:
+            outcomes[f"{kind}:{outcome}"] += 1
+            if kind == "fast":
+                fast_latencies.append(elapsed if outcome == 200 else float("inf"))
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        start = time.perf_counter()
+        total = int(args.rate * args.duration)
+        slow_every = max(1, round(1 / args.slow_share)) if args.slow_share else 0
+        for i in range(total):
+            arrival = start + i / args.rate
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            location_id = SLOW_LOCATION if slow_every and i % slow_every == 0 else locations[i % len(locations)]
+            pool.submit(call, location_id, arrival)
+    return fast_latencies, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fault", choices=["slow", "429"], default="slow")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rate", type=float, default=150, help="peticiones/s entre todas las locations")
+    parser.add_argument("--slow-share", type=float, default=0.25, help="fracción que va a la location lenta")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.005, help="latencia de las locations sanas")
+    parser.add_argument("--locations", type=int, default=5, help="locations sanas")
+    parser.add_argument("--threads", type=int, default=16, help="hilos del proceso (gthread)")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="GHL_LOCATION_MAX_CONCURRENCY")
+    parser.add_argument("--queue-timeout", type=float, default=0.1, help="GHL_LOCATION_QUEUE_TIMEOUT")
+    args = parser.parse_args()
+
+    server = StubGHLServer(latency=args.latency, handler=FaultyLocationHandler).start()
+    server.fault, server.slow_latency = args.fault, args.slow_latency
+    env = {
+        "GHL_BASE_URL": server.base_url,
+        "GHL_API_KEY": "bench",
+        "GHL_LOCATION_MAX_CONCURRENCY": args.max_concurrency,
+        "GHL_LOCATION_QUEUE_TIMEOUT": args.queue_timeout,
+        # Sin abrir el circuito: se mide el aislamiento por turnos, no el breaker
+        "GHL_BREAKER_FAILURE_THRESHOLD": 10**9,
+    }
+    results = []
+    try:
+        with django_environment(**env):
+            from appointments import ghl_client, tenancy
+
+            # Antes: un solo cliente (un pool, un breaker, sin turnos) para todas las locations
+            shared = ghl_client._build_client(tenancy.credentials_for(None)._replace(max_concurrency=0))
+            for name, client_for in [("shared_client", lambda location_id: shared),
+                                     ("per_location", ghl_client.get_ghl_client)]:
+                fast, outcomes = run(client_for, args)
+                ok = sum(1 for latency in fast if latency != float("inf"))
+                results.append({
+                    "scenario": name,
+                    "fast_ok_ratio": round(ok / len(fast), 4) if fast else None,
+                    "fast_latency": latency_summary([latency for latency in fast if latency != float("inf")]),
+                    "outcomes": dict(sorted(outcomes.items())),
+                })
+                print(json.dumps(results[-1]), file=sys.stderr)
+                ghl_client.reset_ghl_client()
+            shared.close()
+    finally:
+        server.shutdown()
+    print(json.dumps({"fault": args.fault, "rate": args.rate, "slow_share": args.slow_share,
+                      "threads": args.threads, "max_concurrency": args.max_concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/bench_webhooks.py
+# Prueba de carga del webhook: N eventos sintéticos en modo sync vs deferred.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.bench_webhooks --events 10000
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import django_environment
+
+EVENT_TYPES = ["AppointmentCreate", "AppointmentUpdate", "AppointmentUpdate", "AppointmentDelete"]
+
+
+def synthetic_events(n, distinct_ids, seed=7):
+    """Ráfaga de webhooks sobre `distinct_ids` citas (crea, reprograma y cancela)."""
+    rnd = random.Random(seed)
+    for i in range(n):
+        ghl_id = f"bench-appt-{i % distinct_ids}"
+        event_type = EVENT_TYPES[0] if i < distinct_ids else rnd.choice(EVENT_TYPES[1:])
+        day = 1 + rnd.randrange(28)
+        hour = 8 + rnd.randrange(10)
+        yield {
+            "type": event_type,
+            "locationId": "loc-bench",
+            "appointment": {
+                "id": ghl_id,
+                "calendarId": f"cal-{rnd.randrange(20)}",
+                "contactId": f"contact-{rnd.randrange(5000)}",
+                "title": "Consulta",
+                "appointmentStatus": "cancelled" if event_type == "AppointmentDelete" else "confirmed",
+                "assignedUserId": f"user-{rnd.randrange(10)}",
+                "startTime": f"2025-03-{day:02d}T{hour:02d}:00:00Z",
+                "endTime": f"2025-03-{day:02d}T{hour:02d}:30:00Z",
+                "dateAdded": "2025-01-15T00:00:00Z",
+                "dateUpdated": f"2025-02-01T00:00:{i % 60:02d}Z",
+            },
+        }
+
+
+def fire(client, events):
+    start = time.perf_counter()
+    for event in events:
+        resp = client.post("/api/webhook/ghl/", json.dumps(event), content_type="application/json")
+        assert resp.status_code in (200, 202), resp.content
+    return time.perf_counter() - start
+
+
+def run_mode(mode, events, batch_size):
+    from django.test import Client, override_settings
+
+    from appointments.models import Appointment, WebhookEvent
+    from appointments.webhooks import drain
+
+    Appointment.objects.all().delete()
+    WebhookEvent.objects.all().delete()
+    client = Client()
+    with override_settings(GHL_WEBHOOK_MODE=mode):
+        ingest = fire(client, events)
+        drain_time = 0.0
+        if mode == "deferred":
+            start = time.perf_counter()
+            drain(batch_size=batch_size, once=True)
+            drain_time = time.perf_counter() - start
+    total = ingest + drain_time
+    return {
+        "mode": mode,
+        "events": len(events),
+        "ingest_s": round(ingest, 3),
+        "drain_s": round(drain_time, 3),
+        "ack_events_per_s": round(len(events) / ingest, 1),
+        "end_to_end_events_per_s": round(len(events) / total, 1),
+        "appointments": Appointment.objects.count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--distinct", type=int, default=2000, help="citas distintas en la ráfaga")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    events = list(synthetic_events(args.events, args.distinct))
+    with django_environment():
+        results = [run_mode("sync", events, args.batch_size), run_mode("deferred", events, args.batch_size)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
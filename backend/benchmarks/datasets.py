@@ -0,0 +1,79 @@
+# benchmarks/datasets.py
+# Datos sintéticos deterministas para benchmarks (citas y contactos).
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+
+SEED_START = datetime(2024, 1, 1, 8, 0, tzinfo=timezone.utc)
+STATUSES = ["confirmed"] * 6 + ["cancelled", "showed", "noshow", "new"]
+
+
+def dimensions(locations=10, calendars_per_location=5, users_per_location=4, contacts=50000):
+    return {
+        "locations": [f"loc-{i}" for i in range(locations)],
+        "calendars_per_location": calendars_per_location,
+        "users_per_location": users_per_location,
+        "contacts": contacts,
+    }
+
+
+def _appointment(i, rnd, dims):
+    from appointments.models import Appointment
+
+    loc = rnd.randrange(len(dims["locations"]))
+    start = SEED_START + timedelta(minutes=30 * rnd.randrange(2 * 24 * 365 * 2))
+    return Appointment(
+        ghl_id=f"appt-{i}",
+        location_id=dims["locations"][loc],
+        calendar_id=f"cal-{loc}-{rnd.randrange(dims['calendars_per_location'])}",
+        contact_id=f"contact-{rnd.randrange(dims['contacts'])}",
+        title="Consulta",
+        appointment_status=rnd.choice(STATUSES),
+        assigned_user_id=f"user-{loc}-{rnd.randrange(dims['users_per_location'])}",
+        notes=None,
+        start_time=start,
+        end_time=start + timedelta(minutes=30),
+        source="bench",
+    )
+
+
+def _contact(i, rnd, dims):
+    from appointments.models import Contact
+
+    return Contact(
+        ghl_id=f"contact-{i}",
+        location_id=rnd.choice(dims["locations"]),
+        first_name=rnd.choice(["Ana", "Luis", "María", "José", "Lucía", "Carlos", "Rosa", "Jorge"]),
+        last_name=rnd.choice(["García", "Pérez", "Quispe", "Flores", "Rojas", "Torres", "Mendoza"]),
+        email=f"contacto{i}@example.com",
+        phone=f"+519{i:08d}",
+        source=rnd.choice(["API", "web", "import"]),
+    ).fill_lookup_keys()
+
+
+def _seed(factory, n, batch_size, seed, dims, progress):
+    from appointments.models import Appointment, Contact  # noqa: F401  (asegura apps cargadas)
+
+    rnd = random.Random(seed)
+    dims = dims or dimensions()
+    created = 0
+    while created < n:
+        size = min(batch_size, n - created)
+        objs = [factory(created + k, rnd, dims) for k in range(size)]
+        with transaction.atomic():
+            type(objs[0]).objects.bulk_create(objs, batch_size=batch_size)
+        created += size
+        if progress:
+            progress(created)
+    return created
+
+
+def seed_appointments(n, batch_size=5000, seed=1, dims=None, progress=None):
+    """Inserta `n` citas repartidas en varias locations, calendarios y usuarios."""
+    return _seed(_appointment, n, batch_size, seed, dims, progress)
+
+
+def seed_contacts(n, batch_size=5000, seed=2, dims=None, progress=None):
+    """Inserta `n` contactos con email y teléfono únicos."""
+    return _seed(_contact, n, batch_size, seed, dims, progress)
@@ -0,0 +1,107 @@
+# benchmarks/harness.py
+# Arranque de Django para benchmarks: BD de prueba en archivo SQLite temporal.
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _setup_django(env):
+    """Variables de entorno comunes a los benchmarks (más `env`, que manda) y django.setup()."""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mi_proyecto.settings")
+    # El GHL falso no limita: sin limitador ni tope de llamadas por location salvo que el benchmark lo pida
+    os.environ.setdefault("GHL_RATE_LIMIT_PER_SECOND", "0")
+    os.environ.setdefault("GHL_LOCATION_MAX_CONCURRENCY", "0")
+    # Los benchmarks de lectura miden también los listados de todas las locations
+    os.environ.setdefault("READS_REQUIRE_LOCATION", "False")
+    # Medir la BD, no la caché de lecturas (bench_read_cache la activa)
+    os.environ.setdefault("READ_CACHE_ENABLED", "False")
+    # Si un benchmark la activa, caché del proceso: la de archivo sobrevive a la BD temporal
+    os.environ.setdefault("READ_CACHE_BACKEND", "locmem")
+    # Sin una línea de log por petición medida
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Métricas solo en memoria del proceso (sin ficheros compartidos)
+    os.environ.setdefault("METRICS_DIR", "")
+    os.environ.update({k: str(v) for k, v in env.items()})
+
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def django_environment(file_db=True, **env):
+    """
+    Configura Django con una BD de prueba recién migrada y la elimina al salir.
+
+    Por defecto usa un archivo SQLite temporal (no en memoria) para que los
+    commits y fsync cuesten lo mismo que en un despliegue real.
+    """
+    _setup_django(env)
+
+    from django.conf import settings
+    from django.db import connections
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    tmpdir = None
+    if file_db and settings.DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        tmpdir = tempfile.TemporaryDirectory(prefix="ghl-bench-")
+        connections["default"].settings_dict["TEST"]["NAME"] = os.path.join(tmpdir.name, "bench.sqlite3")
+
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ["*"]
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        yield settings
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+@contextlib.contextmanager
+def persistent_sqlite(path, **env):
+    """
+    Configura Django contra un archivo SQLite concreto (se migra si hace falta).
+    Sirve para sembrar una vez y medir luego desde otros procesos.
+    """
+    _setup_django(env)
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connections
+
+    connections["default"].settings_dict["NAME"] = str(path)
+    settings.ALLOWED_HOSTS = ["*"]
+    call_command("migrate", verbosity=0, interactive=False)
+    try:
+        yield settings
+    finally:
+        connections.close_all()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples):
+    """p50/p95/p99/mean en milisegundos."""
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3) if samples else 0.0,
+    }
@@ -0,0 +1,171 @@
+# benchmarks/stub_ghl.py
+# Servidor HTTP local que imita los endpoints de GHL usados por la API
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _epoch_ms(iso_str):
+    return int(datetime.fromisoformat(iso_str.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+class StubGHLHandler(BaseHTTPRequestHandler):
+    """Responde como GHL: citas y contactos con un id nuevo, con latencia opcional."""
+
+    protocol_version = "HTTP/1.1"  # necesario para keep-alive
+
+    def setup(self):
+        super().setup()
+        # Sin Nagle: headers y cuerpo van en escrituras separadas
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send(self, code, body, headers=None):
+        raw = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _handle(self):
+        self.server.requests_seen += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        limited, rate_headers = self.server.check_rate_limit()
+        if limited:
+            self.server.status_counts[429] += 1
+            return self._send(429, {"message": "Too many requests"}, rate_headers)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.status_counts[503] += 1
+            return self._send(503, {"message": "Service unavailable"})
+        self.server.status_counts[200] += 1
+        self._rate_headers = rate_headers
+        payload = self._read_json()
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self.command == "GET" and url.path.rstrip("/") == "/calendars":
+            return self._send(200, {"calendars": [{"id": c} for c in self.server.dataset["calendars"]]})
+        if self.command == "GET" and url.path.rstrip("/") == "/calendars/events":
+            return self._send(200, {"events": self._events(query)})
+        if self.command == "POST" and url.path.rstrip("/") == "/contacts/search":
+            return self._send(200, self._contacts_page(payload))
+        if self.path.startswith("/contacts"):
+            contact = dict(payload, id=uuid.uuid4().hex)
+            return self._send(201, {"contact": contact})
+        if self.path.startswith("/calendars/events/appointments"):
+            parts = self.path.rstrip("/").split("/")
+            ghl_id = parts[-1] if len(parts) > 4 else uuid.uuid4().hex
+            return self._send(200 if self.command == "PUT" else 201, dict(payload, id=ghl_id))
+        return self._send(404, {"message": "not found"})
+
+    def end_headers(self):
+        for name, value in getattr(self, "_rate_headers", {}).items():
+            self.send_header(name, value)
+        self._rate_headers = {}
+        super().end_headers()
+
+    def _events(self, query):
+        start, end = int(query.get("startTime", 0)), int(query.get("endTime", 2**62))
+        calendar_id = query.get("calendarId")
+        return [
+            {k: v for k, v in event.items() if k != "_start_ms"}
+            for event in self.server.dataset["events"]
+            if event["calendarId"] == calendar_id and start <= event["_start_ms"] < end
+        ]
+
+    def _contacts_page(self, payload):
+        contacts = self.server.dataset["contacts"]
+        for f in payload.get("filters", []):
+            if f.get("field") == "dateUpdated" and f.get("operator") == "range":
+                gte = f["value"].get("gte")
+                contacts = [c for c in contacts if c["dateUpdated"] >= gte]
+        page, limit = int(payload.get("page", 1)), int(payload.get("pageLimit", 100))
+        return {"contacts": contacts[(page - 1) * limit: page * limit], "total": len(contacts)}
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class StubGHLServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones pendientes amplia: los benchmarks async abren cientos a la vez
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, handler=StubGHLHandler,
+                 error_rate=0.0, rate_limit=None, rate_window=1.0):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.requests_seen = 0
+        self.dataset = {"calendars": [], "events": [], "contacts": []}
+        # Fallos simulados: fracción de 503 y límite de `rate_limit` peticiones por ventana (429)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.status_counts = Counter()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._rate_lock = threading.Lock()
+
+    def check_rate_limit(self):
+        """Cuenta la petición en la ventana actual. Devuelve (limitada, headers X-RateLimit-*)."""
+        if not self.rate_limit:
+            return False, {}
+        with self._rate_lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            remaining = max(0, self.rate_limit - self._window_count)
+            headers = {
+                "X-RateLimit-Max": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Interval-Milliseconds": str(int(self.rate_window * 1000)),
+            }
+            if self._window_count > self.rate_limit:
+                reset = self._window_start + self.rate_window - now
+                return True, dict(headers, **{"Retry-After": f"{reset:.3f}"})
+            return False, headers
+
+    def load(self, calendars=(), events=(), contacts=()):
+        """Datos que devuelven los endpoints de lectura (calendarios, eventos, contactos)."""
+        self.dataset = {
+            "calendars": list(calendars),
+            "events": [dict(e, _start_ms=_epoch_ms(e["startTime"])) for e in events],
+            "contacts": sorted(contacts, key=lambda c: c["dateUpdated"]),
+        }
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,393 @@
+# benchmarks/suite.py
+# Suite de carga de toda la API contra un GHL falso (latencia, 503 y 429
+# configurables) sobre un dataset sembrado de 10k/100k/1m citas y contactos.
+# Saca un JSON con throughput, p50/p95/p99 y consultas a la BD por petición de
+# cada escenario, para guardar una línea base y comparar commits en CI.
+#
+# Escenarios (en este orden, sobre la misma BD):
+#   list_polling   listados con filtros y detalle (dashboard que refresca)
+#   webhook_storm  ráfaga de webhooks: altas nuevas y cambios/cancelaciones de citas existentes
+#   bulk_create    altas por /appointments/bulk/ que van a GHL
+#   mixed          lecturas con un --write-ratio de escrituras (create hacia GHL y webhooks)
+#
+# El dataset se siembra una vez por tamaño en --cache-dir y cada corrida trabaja
+# sobre una copia, así todas parten del mismo estado.
+#
+# Uso (desde backend/):
+#   python -m benchmarks.suite --dataset 10k --output baseline.json
+#   python -m benchmarks.suite --dataset 100k --latency 0.05 --error-rate 0.02 --rate-limit 200
+#   python -m benchmarks.suite --dataset 10k --compare baseline.json --max-regression 0.25
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.harness import BACKEND_DIR, latency_summary, percentile, persistent_sqlite
+from benchmarks.stub_ghl import StubGHLServer
+
+DATASETS = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SCENARIOS = ["list_polling", "webhook_storm", "bulk_create", "mixed"]
+LOCATIONS = 10
+
+# Altas hacia GHL en 2027: el dataset sembrado ocupa 2024-2025 y cada alta usa
+# un hueco distinto, así la validación local de horarios nunca las rechaza.
+WRITE_START = datetime(2027, 1, 4, 8, 0, tzinfo=timezone.utc)
+
+
+class QueryCounter:
+    """execute_wrapper que cuenta las consultas de la conexión del hilo."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Call:
+    __slots__ = ("method", "path", "body", "units")
+
+    def __init__(self, method, path, body=None, units=1):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.units = units  # citas que mueve la petición (bulk: las del lote)
+
+
+def _iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _slot(seq):
+    start = WRITE_START + timedelta(minutes=30 * seq)
+    return _iso(start), _iso(start + timedelta(minutes=30))
+
+
+# --- Escenarios: cada uno es una lista determinista de llamadas -------------
+
+def read_calls(rnd, n, count):
+    """Listados (con y sin filtros, por ventana de fechas) y detalle de citas/contactos."""
+    calls = []
+    for _ in range(count):
+        roll = rnd.random()
+        loc = rnd.randrange(LOCATIONS)
+        if roll < 0.25:
+            path = f"/api/appointments/?location_id=loc-{loc}"
+        elif roll < 0.40:
+            path = f"/api/appointments/?calendar_id=cal-{loc}-{rnd.randrange(5)}&appointment_status=confirmed"
+        elif roll < 0.50:
+            day = datetime(2024, 1, 1) + timedelta(days=rnd.randrange(700))
+            path = f"/api/appointments/?location_id=loc-{loc}&start={day:%Y-%m-%d}T00:00:00Z" \
+                   f"&end={day + timedelta(days=7):%Y-%m-%d}T00:00:00Z"
+        elif roll < 0.60:
+            path = "/api/appointments/?expand=contact"
+        elif roll < 0.70:
+            path = f"/api/contacts/?location_id=loc-{loc}"
+        elif roll < 0.90:
+            path = f"/api/appointments/appt-{rnd.randrange(n)}/"
+        else:
+            path = f"/api/contacts/contact-{rnd.randrange(n)}/"
+        calls.append(Call("GET", path))
+    return calls
+
+
+def webhook_event(rnd, n, seq):
+    """Alta nueva (20%) o cambio/cancelación de una cita sembrada."""
+    roll = rnd.random()
+    if roll < 0.2:
+        event_type, ghl_id = "AppointmentCreate", f"storm-{seq}"
+    else:
+        event_type = "AppointmentDelete" if roll > 0.9 else "AppointmentUpdate"
+        ghl_id = f"appt-{rnd.randrange(n)}"
+    loc = rnd.randrange(LOCATIONS)
+    start = datetime(2025, 6, 2, 8, 0, tzinfo=timezone.utc) + timedelta(minutes=30 * rnd.randrange(5000))
+    return {
+        "type": event_type,
+        "locationId": f"loc-{loc}",
+        "appointment": {
+            "id": ghl_id,
+            "calendarId": f"cal-{loc}-{rnd.randrange(5)}",
+            "contactId": f"contact-{rnd.randrange(n)}",
+            "title": f"Consulta {seq}",
+            "appointmentStatus": "cancelled" if event_type == "AppointmentDelete" else "confirmed",
+            "assignedUserId": f"user-{loc}-{rnd.randrange(4)}",
+            "startTime": _iso(start),
+            "endTime": _iso(start + timedelta(minutes=30)),
+            "dateAdded": "2025-01-15T00:00:00Z",
+            "dateUpdated": _iso(datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seq)),
+            "webhookId": f"storm-{seq}",
+        },
+    }
+
+
+def create_item(rnd, n, seq):
+    start, end = _slot(seq)
+    loc = rnd.randrange(LOCATIONS)
+    return {
+        "calendarId": f"cal-{loc}-{rnd.randrange(5)}",
+        "locationId": f"loc-{loc}",
+        "contactId": f"contact-{rnd.randrange(n)}",
+        "startTime": start,
+        "endTime": end,
+        "title": f"Alta {seq}",
+    }
+
+
+def build_calls(scenario, args, n):
+    rnd = random.Random(f"{scenario}-{args.seed}")
+    if scenario == "list_polling":
+        return read_calls(rnd, n, args.requests)
+    if scenario == "webhook_storm":
+        return [Call("POST", "/api/webhook/ghl/", webhook_event(rnd, n, seq)) for seq in range(args.requests)]
+    if scenario == "bulk_create":
+        calls = []
+        for batch in range(args.bulk_batches):
+            offset = 1_000_000 + batch * args.bulk_size
+            items = [create_item(rnd, n, offset + k) for k in range(args.bulk_size)]
+            calls.append(Call("POST", "/api/appointments/bulk/", {"appointments": items}, units=len(items)))
+        return calls
+    if scenario == "mixed":
+        calls = []
+        for seq in range(args.requests):
+            if rnd.random() >= args.write_ratio:
+                calls.extend(read_calls(rnd, n, 1))
+            elif rnd.random() < 0.5:
+                calls.append(Call("POST", "/api/appointments/create/", create_item(rnd, n, 2_000_000 + seq)))
+            else:
+                calls.append(Call("POST", "/api/webhook/ghl/", webhook_event(rnd, n, 1_000_000 + seq)))
+        return calls
+    raise ValueError(f"Escenario desconocido: {scenario}")
+
+
+# --- Ejecución -----------------------------------------------------------------
+
+def _worker(calls, rows, lock):
+    from django.db import connection
+    from django.test import Client
+
+    client, counter, local = Client(), QueryCounter(), []
+    with connection.execute_wrapper(counter):
+        for call in calls:
+            before = counter.count
+            start = time.perf_counter()
+            if call.method == "GET":
+                resp = client.get(call.path)
+            else:
+                resp = client.post(call.path, json.dumps(call.body), content_type="application/json")
+            local.append((time.perf_counter() - start, counter.count - before, resp.status_code, call.units))
+    connection.close()
+    with lock:
+        rows.extend(local)
+
+
+def execute(calls, threads):
+    """Reparte las llamadas entre `threads` hilos (cada uno con su Client y su conexión)."""
+    rows, lock = [], threading.Lock()
+    chunks = [calls[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=_worker, args=(chunk, rows, lock)) for chunk in chunks if chunk]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return rows, time.perf_counter() - start
+
+
+def summarize(rows, elapsed):
+    samples = [row[0] for row in rows]
+    queries = [row[1] for row in rows]
+    statuses = Counter(row[2] for row in rows)
+    units = sum(row[3] for row in rows)
+    return {
+        "requests": len(rows),
+        "errors": sum(count for code, count in statuses.items() if code >= 500),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(rows) / elapsed, 1) if elapsed else 0.0,
+        "items_per_s": round(units / elapsed, 1) if elapsed else 0.0,
+        **latency_summary(samples),
+        "queries": {
+            "total": sum(queries),
+            "mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "p95": percentile(queries, 95),
+            "max": max(queries, default=0),
+        },
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run_scenario(scenario, args, n, stub):
+    from appointments.models import WebhookEvent
+    from appointments.webhooks import drain
+
+    calls = build_calls(scenario, args, n)
+    if args.warmup:
+        execute(calls[:args.warmup], 1)
+    stub.status_counts.clear()
+    stub.requests_seen = 0
+    rows, elapsed = execute(calls, args.threads)
+    result = dict(summarize(rows, elapsed), scenario=scenario)
+    result["ghl"] = {"requests": stub.requests_seen,
+                     "status_codes": {str(code): count for code, count in sorted(stub.status_counts.items())}}
+    if args.webhook_mode == "deferred" and scenario in ("webhook_storm", "mixed"):
+        start = time.perf_counter()
+        drain(batch_size=500, once=True)
+        result["drain_s"] = round(time.perf_counter() - start, 3)
+        result["inbox_pending"] = WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING).count()
+    return result
+
+
+# --- Dataset -------------------------------------------------------------------
+
+def ensure_dataset(n):
+    """Migra y siembra `n` citas y `n` contactos si el archivo no los tiene ya."""
+    from appointments.models import Appointment, Contact
+    from benchmarks.datasets import dimensions, seed_appointments, seed_contacts
+
+    if Appointment.objects.count() == n and Contact.objects.count() == n:
+        return False
+    Appointment.objects.all().delete()
+    Contact.objects.all().delete()
+    dims = dimensions(locations=LOCATIONS, contacts=n)
+
+    def progress(kind):
+        return lambda done: print(f"{kind}: {done}/{n}", file=sys.stderr) if done % 100_000 == 0 or done == n else None
+
+    seed_contacts(n, dims=dims, progress=progress("contactos"))
+    seed_appointments(n, dims=dims, progress=progress("citas"))
+    return True
+
+
+# --- Resultado y comparación -----------------------------------------------------
+
+def _git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{rev}-dirty" if dirty else rev
+
+
+def metadata(args, settings):
+    import django
+
+    return {
+        "commit": _git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "engine": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+        "cpus": os.cpu_count(),
+        "dataset": args.dataset,
+        "threads": args.threads,
+        "requests": args.requests,
+        "webhook_mode": args.webhook_mode,
+        "ghl": {"latency_s": args.latency, "error_rate": args.error_rate, "rate_limit": args.rate_limit},
+    }
+
+
+def compare(current, baseline, max_regression):
+    """
+    Regresiones frente a una corrida anterior: throughput que cae o p95 que sube
+    más de `max_regression` (fracción), o más consultas por petición (>5%).
+    """
+    regressions = []
+    for name, row in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if row["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            regressions.append({"scenario": name, "metric": "throughput_rps",
+                                "baseline": base["throughput_rps"], "current": row["throughput_rps"]})
+        if row["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append({"scenario": name, "metric": "p95_ms", "baseline": base["p95_ms"], "current": row["p95_ms"]})
+        if row["queries"]["mean"] > base["queries"]["mean"] * 1.05 + 0.01:
+            regressions.append({"scenario": name, "metric": "queries.mean",
+                                "baseline": base["queries"]["mean"], "current": row["queries"]["mean"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dataset", choices=list(DATASETS), default="10k", help="citas y contactos sembrados")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000, help="peticiones por escenario")
+    parser.add_argument("--threads", type=int, default=1, help="clientes concurrentes (hilos)")
+    parser.add_argument("--warmup", type=int, default=20, help="peticiones sin medir antes de cada escenario")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="fracción de escrituras en `mixed`")
+    parser.add_argument("--bulk-batches", type=int, default=10)
+    parser.add_argument("--bulk-size", type=int, default=100)
+    parser.add_argument("--webhook-mode", choices=["sync", "deferred"], default="sync")
+    parser.add_argument("--latency", type=float, default=0.02, help="latencia simulada de GHL (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de 503 de GHL")
+    parser.add_argument("--rate-limit", type=int, default=None, help="peticiones/s antes de que GHL responda 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "ghl-bench-datasets"),
+                        help="dónde se guardan los datasets sembrados")
+    parser.add_argument("--output", help="además de stdout, escribir el JSON en este archivo")
+    parser.add_argument("--compare", help="JSON de una corrida anterior: sale con código 1 si hay regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+    n = DATASETS[args.dataset]
+
+    stub = StubGHLServer(latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit).start()
+    env = {"GHL_BASE_URL": stub.base_url, "GHL_API_KEY": "bench", "GHL_LOCATION_ID": "loc-0",
+           "GHL_ASSIGNED_USER_ID": "user-0-0", "GHL_WEBHOOK_MODE": args.webhook_mode}
+    os.makedirs(args.cache_dir, exist_ok=True)
+    cached = os.path.join(args.cache_dir, f"{args.dataset}.sqlite3")
+    report = {}
+    try:
+        with persistent_sqlite(cached, **env):
+            start = time.perf_counter()
+            if ensure_dataset(n):
+                print(f"dataset {args.dataset} sembrado en {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        with tempfile.TemporaryDirectory(prefix="ghl-suite-") as tmp:
+            work = shutil.copy(cached, os.path.join(tmp, "suite.sqlite3"))
+            with persistent_sqlite(work, **env) as settings:
+                report["meta"] = metadata(args, settings)
+                report["scenarios"] = {}
+                for scenario in scenarios:
+                    report["scenarios"][scenario] = run_scenario(scenario, args, n, stub)
+                    print(json.dumps(report["scenarios"][scenario]), file=sys.stderr)
+    finally:
+        stub.stop()
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        report["baseline"] = baseline.get("meta", {}).get("commit")
+        differs = [key for key in ("dataset", "threads", "requests", "webhook_mode", "ghl", "cpus")
+                   if baseline.get("meta", {}).get(key) != report["meta"][key]]
+        if differs:
+            print(f"aviso: la línea base se midió con otro {', '.join(differs)}", file=sys.stderr)
+        report["regressions"] = compare(report, baseline, args.max_regression)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output + "\n")
+    if report.get("regressions"):
+        for reg in report["regressions"]:
+            print(f"REGRESIÓN {reg['scenario']} {reg['metric']}: {reg['baseline']} -> {reg['current']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 # mi_proyecto/settings.py
 import os
+import sys
+import tempfile
 from pathlib import Path
+import environ
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 load_dotenv()  # cargar variables de entorno
@@ -25,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero: mide la petición completa (ver appointments/timing.py)
+    "appointments.timing.RequestTimingMiddleware",
         "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -55,12 +61,65 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mi_proyecto.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Base de datos: DATABASE_URL (postgres://, mysql://, sqlite:///ruta) o, si
+# no está, el archivo SQLite local de siempre.
+DATABASE_URL = os.getenv("DATABASE_URL")
+if DATABASE_URL:
+    DATABASES = {'default': environ.Env.db_url_config(DATABASE_URL)}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+
+# Conexiones persistentes: se reutilizan CONN_MAX_AGE segundos en lugar de
+# abrir una por petición, y se comprueban antes de usarlas tras un corte.
+# Bajo ASGI (GHL_ASYNC_VIEWS) cada petición corre en su propio hilo y las
+# conexiones persistentes se acumularían: por defecto 0 en ese modo.
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0" if os.getenv("GHL_ASYNC_VIEWS") == "True" else "60"))
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True"
+# Pool de conexiones nativo de Django para Postgres (psycopg 3 + psycopg-pool);
+# con pool Django exige CONN_MAX_AGE=0
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+
+# SQLite con escrituras concurrentes (webhooks, outbox, vistas): WAL deja leer
+# mientras alguien escribe, synchronous=NORMAL hace fsync solo en checkpoints,
+# y las transacciones IMMEDIATE toman el lock de escritura al empezar y
+# esperan hasta SQLITE_BUSY_TIMEOUT segundos; con DEFERRED, update_or_create
+# falla al instante con "database is locked" al pasar de lector a escritor.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "True") == "True"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "20"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
+_db = DATABASES['default']
+if _db['ENGINE'].endswith('sqlite3'):
+    if SQLITE_TUNING:
+        _db.setdefault('OPTIONS', {}).update({
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f'PRAGMA synchronous={SQLITE_SYNCHRONOUS};'
+                f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB};'
+                'PRAGMA temp_store=MEMORY'
+            ),
+        })
+    _db['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+elif DB_POOL_MAX_SIZE and _db['ENGINE'].endswith('postgresql'):
+    _db.setdefault('OPTIONS', {})['pool'] = {
+        'min_size': min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+        'max_size': DB_POOL_MAX_SIZE,
+    }
+    _db['CONN_MAX_AGE'] = 0
+else:
+    _db['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+_db['CONN_HEALTH_CHECKS'] = DB_CONN_HEALTH_CHECKS
 
 LANGUAGE_CODE = 'es-pe'
 TIME_ZONE = 'America/Lima'
@@ -80,8 +139,199 @@ REST_FRAMEWORK = {
     ]
 }
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "127.0.0.1").split(",")
+
+# Logging estructurado (appointments/logs.py): LOG_FORMAT json | text. Los
+# payloads (webhooks, PUT/POST a GHL) se registran en DEBUG, redactados y
+# muestreados con LOG_PAYLOAD_SAMPLE_RATE.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+LOG_REDACT_FIELDS = {
+    field.strip().lower()
+    for field in os.getenv(
+        "LOG_REDACT_FIELDS",
+        "email,phone,firstName,lastName,name,fullName,address1,city,postalCode,dateOfBirth,notes,"
+        "authorization,apiKey,token",
+    ).split(",")
+    if field.strip()
+}
+# Log por petición (RequestTimingMiddleware): las lentas siempre en WARNING,
+# el resto en INFO muestreadas con LOG_REQUEST_SAMPLE_RATE (por defecto 1 de
+# cada 100: /metrics ya cuenta todas). Server-Timing: total, ghl y db en ms.
+# Con `manage.py test` solo se registran las lentas.
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "0.01"))
+TESTING = sys.argv[1:2] == ["test"]
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "True") == "True"
+
+# Métricas Prometheus en GET /metrics (appointments/metrics.py). Con
+# METRICS_DIR cada proceso vuelca sus contadores ahí y /metrics suma los de
+# todos los workers de gunicorn; vacío = solo el proceso que atiende.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ghl-metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+# Si se define, /metrics exige "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "appointments.logs.JsonFormatter"},
+        "text": {"()": "appointments.logs.TextFormatter", "format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "filters": {
+        "payload_sample": {"()": "appointments.logs.SampleFilter", "rate": LOG_PAYLOAD_SAMPLE_RATE},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": LOG_FORMAT},
+    },
+    "loggers": {
+        "appointments": {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False},
+        "appointments.payload": {"filters": ["payload_sample"]},
+        "appointments.request": {"level": "WARNING" if TESTING else "NOTSET"},
+    },
+}
+
 GHL_API_KEY = os.getenv("GHL_API_KEY")
 # No forzamos excepción si no está. Las vistas validarán cuando sea necesario.
+GHL_API_VERSION = os.getenv("GHL_API_VERSION", "2021-04-15")
+GHL_LOCATION_ID = os.getenv("GHL_LOCATION_ID")  # fallback si el webhook no trae locationId
+GHL_ASSIGNED_USER_ID = os.getenv("GHL_ASSIGNED_USER_ID")  # assignedUserId por defecto al crear citas
+GHL_BASE_URL = os.getenv("GHL_BASE_URL", "https://services.leadconnectorhq.com")
+
+# Varias sub-cuentas (locations): las registradas en el modelo Location usan su
+# propio token y límites; las demás, GHL_API_KEY (salvo con
+# GHL_LOCATION_REGISTRY_STRICT). Cada location tiene su cliente HTTP, con hasta
+# GHL_LOCATION_MAX_CONCURRENCY llamadas en curso (0 = sin tope); una llamada que
+# no consigue turno en GHL_LOCATION_QUEUE_TIMEOUT segundos responde 503. Las
+# credenciales se cachean GHL_LOCATION_CACHE_TTL segundos por proceso.
+GHL_LOCATION_REGISTRY_STRICT = os.getenv("GHL_LOCATION_REGISTRY_STRICT", "False") == "True"
+GHL_LOCATION_MAX_CONCURRENCY = int(os.getenv("GHL_LOCATION_MAX_CONCURRENCY", "16"))
+GHL_LOCATION_QUEUE_TIMEOUT = float(os.getenv("GHL_LOCATION_QUEUE_TIMEOUT", "5"))
+GHL_LOCATION_CACHE_TTL = float(os.getenv("GHL_LOCATION_CACHE_TTL", "60"))
+# True = listados, búsquedas, exportaciones y estadísticas siempre limitados a
+# una location (?location_id=, cabecera X-Location-Id o GHL_LOCATION_ID); sin
+# ninguna responden 400. Por defecto (False), sin location se lee de todas.
+READS_REQUIRE_LOCATION = os.getenv("READS_REQUIRE_LOCATION", "False") == "True"
+
+# Cliente HTTP hacia GHL (uno por location): tamaño del pool de conexiones keep-alive y timeout (segundos)
+GHL_HTTP_POOL_SIZE = int(os.getenv("GHL_HTTP_POOL_SIZE", "10"))
+GHL_HTTP_TIMEOUT = float(os.getenv("GHL_HTTP_TIMEOUT", "15"))
+GHL_HTTP_CONNECT_TIMEOUT = float(os.getenv("GHL_HTTP_CONNECT_TIMEOUT", "3"))
+
+# Vistas async (crear/actualizar/cancelar citas y webhook) para desplegar con
+# uvicorn (ASGI); el pool async admite muchas más conexiones simultáneas que
+# el de requests porque no ocupa un hilo por llamada.
+GHL_ASYNC_VIEWS = os.getenv("GHL_ASYNC_VIEWS", "False") == "True"
+GHL_ASYNC_POOL_SIZE = int(os.getenv("GHL_ASYNC_POOL_SIZE", "200"))
+
+# Limitador de peticiones a GHL por API key + locationId (0 = desactivado). Con
+# GHL_RATE_LIMIT_DIR el bucket se comparte entre procesos mediante flock.
+GHL_RATE_LIMIT_PER_SECOND = float(os.getenv("GHL_RATE_LIMIT_PER_SECOND", "10"))
+GHL_RATE_LIMIT_BURST = float(os.getenv("GHL_RATE_LIMIT_BURST", "10"))
+GHL_RATE_LIMIT_DIR = os.getenv("GHL_RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "ghl-ratelimit"))
+GHL_RATE_LIMIT_MAX_WAIT = float(os.getenv("GHL_RATE_LIMIT_MAX_WAIT", "10"))
+
+# Reintentos ante 429/5xx/errores de conexión (backoff exponencial con jitter,
+# como máximo GHL_RETRY_BUDGET_RATIO reintentos por petición) y circuit breaker.
+GHL_MAX_RETRIES = int(os.getenv("GHL_MAX_RETRIES", "3"))
+GHL_RETRY_BACKOFF_BASE = float(os.getenv("GHL_RETRY_BACKOFF_BASE", "0.5"))
+GHL_RETRY_BACKOFF_MAX = float(os.getenv("GHL_RETRY_BACKOFF_MAX", "10"))
+GHL_RETRY_BUDGET_RATIO = float(os.getenv("GHL_RETRY_BUDGET_RATIO", "0.2"))
+GHL_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GHL_BREAKER_FAILURE_THRESHOLD", "5"))
+GHL_BREAKER_RESET_TIMEOUT = float(os.getenv("GHL_BREAKER_RESET_TIMEOUT", "30"))
+
+# Modo "async write": encolar cambios de citas en el outbox y responder 202.
+# Puede pedirse por request con `Prefer: respond-async` o `?async=1`.
+GHL_ASYNC_WRITES = os.getenv("GHL_ASYNC_WRITES", "False") == "True"
+GHL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("GHL_OUTBOX_MAX_ATTEMPTS", "5"))
+GHL_OUTBOX_RETRY_BASE = float(os.getenv("GHL_OUTBOX_RETRY_BASE", "2"))
+GHL_OUTBOX_LOCK_TIMEOUT = int(os.getenv("GHL_OUTBOX_LOCK_TIMEOUT", "120"))
+
+# Webhooks: "sync" aplica cada evento en el request; "deferred" lo guarda en el
+# inbox y responde 202 (procesar con `manage.py process_webhooks`).
+GHL_WEBHOOK_MODE = os.getenv("GHL_WEBHOOK_MODE", "sync")
+# Inbox: un evento que falla GHL_WEBHOOK_MAX_ATTEMPTS veces queda como fallido
+# (no frena al resto); uno en processing más de GHL_WEBHOOK_LOCK_TIMEOUT
+# segundos (consumidor caído) vuelve a tomarse.
+GHL_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("GHL_WEBHOOK_MAX_ATTEMPTS", "5"))
+GHL_WEBHOOK_LOCK_TIMEOUT = int(os.getenv("GHL_WEBHOOK_LOCK_TIMEOUT", "120"))
+
+# Alta masiva (/api/appointments/bulk/): ítems por petición e hilos concurrentes
+# hacia GHL. El ritmo lo pone el limitador por location (GHL_RATE_LIMIT_*) y
+# los reintentos de 429 el cliente GHL (GHL_MAX_RETRIES).
+GHL_BULK_MAX_ITEMS = int(os.getenv("GHL_BULK_MAX_ITEMS", "1000"))
+GHL_BULK_CONCURRENCY = int(os.getenv("GHL_BULK_CONCURRENCY", "8"))
+
+
+# Motor local de disponibilidad (/api/availability/): días hacia atrás que cubre
+# el índice, segundos mínimos entre refrescos con lo escrito por otros procesos
+# (0 = en cada consulta; lo de este proceso se aplica al momento) y si el
+# alta/edición de citas valida el horario localmente antes de llamar a GHL
+# (también por request con ?validate_slot=1).
+SLOTS_LOOKBACK_DAYS = int(os.getenv("SLOTS_LOOKBACK_DAYS", "30"))
+SLOTS_REFRESH_INTERVAL = float(os.getenv("SLOTS_REFRESH_INTERVAL", "2"))
+SLOTS_MAX_RESULTS = int(os.getenv("SLOTS_MAX_RESULTS", "2000"))
+GHL_LOCAL_SLOT_VALIDATION = os.getenv("GHL_LOCAL_SLOT_VALIDATION", "False") == "True"
+
+# Idempotency-Key en los POST de creación: segundos que se guarda la respuesta,
+# espera máxima de una petición repetida mientras la primera sigue en curso y
+# segundos tras los que una reserva sin terminar se da por abandonada.
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "True") == "True"
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "120"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+
+# Deduplicación local de contactos: POST /api/contacts/create/ responde sin
+# llamar a GHL si ya existe un contacto con el mismo email o teléfono en la
+# location ("409" como el error de GHL, o "200" devolviendo el existente).
+# Los teléfonos sin prefijo internacional se normalizan con este código de país.
+CONTACT_DEDUP_ENABLED = os.getenv("CONTACT_DEDUP_ENABLED", "True") == "True"
+CONTACT_DEDUP_RESPONSE = os.getenv("CONTACT_DEDUP_RESPONSE", "409")
+CONTACT_DEFAULT_COUNTRY_CODE = os.getenv("CONTACT_DEFAULT_COUNTRY_CODE", "51")
+CONTACT_MATCH_MAX_ITEMS = int(os.getenv("CONTACT_MATCH_MAX_ITEMS", "5000"))
+
+# Caché de lecturas (listados y detalle de citas/contactos): "file" se comparte
+# entre workers y con los comandos (process_webhooks, process_outbox, sync_ghl,
+# archive_appointments), así sus escrituras invalidan lo cacheado; "locmem" es
+# por proceso y solo sirve con un único proceso que haga todas las escrituras.
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "True") == "True"
+READ_CACHE_BACKEND = os.getenv("READ_CACHE_BACKEND", "file")
+READ_CACHE_TIMEOUT = int(os.getenv("READ_CACHE_TIMEOUT", "300"))
+READ_CACHE_ALIAS = "default"
+if READ_CACHE_BACKEND == "file":
+    _read_cache = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("READ_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ghl-read-cache")),
+    }
+else:
+    _read_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "ghl-reads"}
+CACHES = {
+    "default": {**_read_cache, "OPTIONS": {"MAX_ENTRIES": int(os.getenv("READ_CACHE_MAX_ENTRIES", "5000"))}},
+}
+
+# Resumen de citas por día (AppointmentRollup) para /api/appointments/stats/:
+# cada escritura de citas lo actualiza en su misma transacción. Con False las
+# estadísticas se calculan con un GROUP BY sobre la tabla (y al reactivarlo
+# hay que correr `manage.py rebuild_rollups`).
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "True") == "True"
+
+# Archivo de citas (appointments/archive.py, `manage.py archive_appointments`):
+# las que terminaron hace más de ARCHIVE_AFTER_DAYS días, o canceladas hace más
+# de ARCHIVE_CANCELLED_AFTER_DAYS, pasan a ArchivedAppointment en lotes de
+# ARCHIVE_BATCH_SIZE filas por transacción. 0 desactiva cada regla. Conviene
+# ARCHIVE_AFTER_DAYS >= SLOTS_LOOKBACK_DAYS.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_CANCELLED_AFTER_DAYS = int(os.getenv("ARCHIVE_CANCELLED_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# Camino rápido de los listados (appointments/fastread.py): filas de .values()
+# convertidas sin instanciar modelos ni campos de DRF, y JSON con orjson si
+# está instalado. La respuesta es la misma byte a byte; False vuelve a los
+# serializers y al JSONRenderer de DRF.
+FAST_READ_PATH_ENABLED = os.getenv("FAST_READ_PATH_ENABLED", "True") == "True"
 
 
 CORS_ALLOWED_ORIGINS = [
@@ -90,5 +340,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Cabeceras propias que el frontend puede enviar
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key", "prefer", "x-location-id")
 _csrf_origins_raw = os.getenv("CSRF_TRUSTED_ORIGINS", "").strip()
 CSRF_TRUSTED_ORIGINS = [o for o in _csrf_origins_raw.split(",") if o]